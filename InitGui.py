@@ -33,10 +33,16 @@ class OSE_PartLibraryWorkbench (Workbench):
 
     def Initialize(self):
         "This function is executed when FreeCAD starts"
+        import time
+        start = time.time()
         import OSE_BasePartLibrary, OSE_CommandsPartLibrary # import here all the needed files that create your FreeCAD commands
         self.list = OSE_CommandsPartLibrary.COMMAND_LIST # A list of command names created in the line above
         self.appendToolbar("Part library", self.list) # creates a new toolbar with your commands
         self.appendMenu("OSE Part Library", self.list) # creates a new menu
+        # Used by benchmarks/bench_startup.py.
+        self.initialization_time = time.time() - start
+        FreeCAD.Console.PrintLog("OSE Part Library initialized in %.1f ms\n" % (
+            self.initialization_time * 1000))
 
         #FreeCADGui.addIconPath(":/Resources/icons")
         #FreeCADGui.addLanguagePath(":/translations")
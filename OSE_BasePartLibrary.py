@@ -1,9 +1,62 @@
 # Define common pathes Here
 
+import contextlib
 import os
+import threading
 
 __dir__ = os.path.dirname(__file__)
 ICON_PATH = os.path.join(__dir__, 'Resources/icons')
 IMAGE_PATH = os.path.join(__dir__, 'Resources/images')
 TABLE_PATH = os.path.join(__dir__, 'tables')
 PARTS_PATH = os.path.join(__dir__, 'parts')
+# One zip archive with tables/ and parts/. If it exists, it is used instead of
+# the directories, see OSE_LibraryPack.py.
+LIBRARY_PACK = os.environ.get('OSE_PART_LIBRARY_PACK', os.path.join(__dir__, 'library-pack.zip'))
+if os.path.isfile(LIBRARY_PACK):
+    LIBRARY_PACK = os.path.abspath(LIBRARY_PACK)
+    TABLE_PATH = os.path.join(LIBRARY_PACK, 'tables')
+    PARTS_PATH = os.path.join(LIBRARY_PACK, 'parts')
+else:
+    LIBRARY_PACK = None
+# FreeCAD parameter group with the preferences of the workbench.
+PREFERENCES = "User parameter:BaseApp/Preferences/Mod/OSE_PartLibrary"
+# Directory for data generated from the library, for example shape caches.
+CACHE_PATH = os.environ.get('OSE_PART_LIBRARY_CACHE',
+                            os.path.join(os.path.expanduser('~'), '.cache', 'ose-part-library'))
+# Precompiled index of all tables, see OSE_CatalogIndex.py.
+CATALOG_INDEX_NAME = 'catalog.idx'
+CATALOG_INDEX_PATH = os.path.join(TABLE_PATH, CATALOG_INDEX_NAME)
+# Suffix of the tables with geometric properties of the parts, see OSE_Geometry.py.
+GEOMETRY_TABLE_SUFFIX = '.geometry.csv'
+# Sizes, modification times and hashes of the part files, see OSE_Manifest.py.
+MANIFEST_PATH = os.path.join(CACHE_PATH, 'manifest.json')
+
+
+def replace_file(src, dst):
+    """Rename *src* to *dst* and replace *dst* if it exists, like os.replace()."""
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)  # os.rename() of Python 2 does not replace files on Windows.
+        os.rename(src, dst)
+
+
+@contextlib.contextmanager
+def atomic_write(path):
+    """Context manager which yields a temporary path to write instead of *path*.
+
+    The temporary file replaces *path* when the block ends, so other threads
+    and processes never read half a file. If the block raises, the temporary
+    file is deleted. Its name is unique per process and thread.
+    """
+    tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.current_thread().ident)
+    try:
+        yield tmp_path
+        replace_file(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
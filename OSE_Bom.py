@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# Bill of materials of an assembly.
+#
+# Parts inserted by importPart remember where they came from in the property
+# sourceFile: a library file or a reference to a generated part like
+# tslot:length=160. SourceIndex maps these back to catalog rows, built once
+# over all catalogs. bill_of_materials() counts the parts of a document in
+# one pass over its objects and keeps one counter per distinct source file,
+# so the memory does not grow with the number of objects.
+#
+# Example, in the FreeCAD Python console:
+#
+#     import OSE_Bom
+#     OSE_Bom.export_bom(App.ActiveDocument, "/tmp/bom.csv")
+#
+# A file name ending with .json writes JSON with all catalog columns.
+
+import csv
+import json
+import os
+import sys
+import threading
+
+import OSE_BasePartLibrary as Base
+import OSE_LibraryPack
+import OSE_ParametricParts
+import OSE_PartCatalog as Catalog
+import OSE_Trace
+
+# Columns of the CSV file.
+CSV_COLUMNS = ["Quantity", "PartNumber", "Text", "Cad", "Catalog"]
+# Directory of the library parts in a path, for parts inserted from another installation.
+_PARTS_DIRECTORY = "/parts/"
+
+
+def _reference_key(reference):
+    """Return *reference* in the form make_reference() writes, "tslot:length=160"."""
+    try:
+        generator, parameters = OSE_ParametricParts.parse_reference(reference)
+    except OSE_ParametricParts.ParameterError:
+        return reference
+    return OSE_ParametricParts.make_reference(generator.name, **parameters)
+
+
+def source_keys(source_file):
+    """Yield the Cad entries *source_file* can stand for, most specific first.
+
+    Paths of library files and of files extracted from the library pack
+    become relative to Base.PARTS_PATH. A path from another installation is
+    tried with everything after each "/parts/" directory. A library file
+    which the catalogs replaced by a generated part, see
+    OSE_ParametricParts.LEGACY_CAD, also stands for the reference.
+    """
+    if OSE_ParametricParts.is_reference(source_file):
+        yield _reference_key(source_file)
+        return
+    for key in _file_keys(source_file):
+        yield key
+        reference = OSE_ParametricParts.legacy_reference(key)
+        if reference is not None:
+            yield reference
+
+
+def _file_keys(source_file):
+    pack = OSE_LibraryPack.active_pack()
+    if pack is not None:
+        member = pack.extracted_member(source_file)
+        if member is not None and member.startswith("parts/"):
+            yield member[len("parts/"):]
+            return
+    parts_path = os.path.abspath(Base.PARTS_PATH) + os.sep
+    path = os.path.abspath(source_file)
+    if path.startswith(parts_path):
+        yield path[len(parts_path):].replace(os.sep, "/")
+        return
+    normalized = source_file.replace("\\", "/")
+    start = normalized.find(_PARTS_DIRECTORY)
+    while start >= 0:
+        yield normalized[start + len(_PARTS_DIRECTORY):]
+        start = normalized.find(_PARTS_DIRECTORY, start + 1)
+
+
+class SourceIndex:
+    """Map from the Cad entries of the catalogs to their rows.
+
+    If several rows have the same Cad entry, the first row of the first
+    catalog in *table_paths* is used, like Catalog.find_part() does.
+    """
+
+    def __init__(self, table_paths=None):
+        if table_paths is None:
+            table_paths = Catalog.catalog_table_paths()
+        self.table_paths = list(table_paths)
+        self.tables = []
+        # Map Cad entry -> (table path, row index).
+        self._rows = {}
+        for table_path in table_paths:
+            table = Catalog.load_catalog(table_path)
+            self.tables.append(table)
+            cad_column = table.column_positions["Cad"]
+            for row_i in range(table.row_count()):
+                cad = table.get_value(row_i, cad_column)
+                if not cad:
+                    continue
+                if OSE_ParametricParts.is_reference(cad):
+                    cad = _reference_key(cad)
+                else:
+                    cad = cad.replace("\\", "/")
+                self._rows.setdefault(cad, (table_path, row_i))
+
+    def is_current(self, table_paths):
+        """Return True if the catalogs did not change since the index was built."""
+        return len(table_paths) == len(self.tables) and all(
+            Catalog.load_catalog(path) is table for path, table in zip(table_paths, self.tables))
+
+    def lookup(self, source_file):
+        """Return (table path, row index) of the part imported from *source_file* or None."""
+        for key in source_keys(source_file):
+            row = self._rows.get(key)
+            if row is not None:
+                return row
+        return None
+
+
+_source_index = None
+_source_index_lock = threading.Lock()
+
+
+def source_index(table_paths=None):
+    """Return the shared SourceIndex of *table_paths*, built again when a catalog changed."""
+    global _source_index
+    if table_paths is None:
+        table_paths = Catalog.catalog_table_paths()
+    table_paths = list(table_paths)
+    with _source_index_lock:
+        index = _source_index
+        if index is None or index.table_paths != table_paths or \
+                not index.is_current(table_paths):
+            index = _source_index = SourceIndex(table_paths)
+    return index
+
+
+class BomItem:
+    """One line of a bill of materials.
+
+    *row* is the catalog row as RowView and *table_path* its catalog; both
+    are None for parts which are not in a catalog. *source* is the
+    sourceFile of the first such object.
+    """
+
+    def __init__(self, quantity, table_path, row, source):
+        self.quantity = quantity
+        self.table_path = table_path
+        self.row = row
+        self.source = source
+
+    def catalog(self):
+        return os.path.basename(self.table_path) if self.table_path is not None else ""
+
+    def part_number(self):
+        return self.row["PartNumber"] if self.row is not None else ""
+
+
+def is_part(obj):
+    """Return True if *obj* is an inserted part. The hidden sources of linked parts are not."""
+    return hasattr(obj, "sourceFile") and hasattr(obj, "timeLastImport") and \
+        not getattr(obj, "sharedGeometry", False)
+
+
+def bill_of_materials(document, table_paths=None):
+    """Return the list of BomItem of the parts in *document*.
+
+    Catalog parts come first, in the order of the catalogs and their rows,
+    followed by the other parts sorted by source file.
+    """
+    with OSE_Trace.span("count_parts") as span:
+        # Map sourceFile -> number of parts; one pass over the objects.
+        counts = {}
+        for obj in document.Objects:
+            if is_part(obj):
+                source = obj.sourceFile
+                counts[source] = counts.get(source, 0) + 1
+        span.set(sources=len(counts))
+    with OSE_Trace.span("build_source_index"):
+        index = source_index(table_paths)
+    # Map (table path, row index) -> BomItem, different source files can be the same part.
+    catalog_items = {}
+    other_items = []
+    for source in sorted(counts):
+        found = index.lookup(source)
+        if found is None:
+            other_items.append(BomItem(counts[source], None, None, source))
+            continue
+        item = catalog_items.get(found)
+        if item is None:
+            table_path, row_i = found
+            row = Catalog.load_catalog(table_path).get_row(row_i)
+            catalog_items[found] = BomItem(counts[source], table_path, row, source)
+        else:
+            item.quantity += counts[source]
+    table_order = dict((path, i) for i, path in enumerate(index.table_paths))
+    order = sorted(catalog_items, key=lambda found: (table_order[found[0]], found[1]))
+    return [catalog_items[found] for found in order] + other_items
+
+
+def write_csv(items, filename):
+    """Write *items* as CSV with the columns CSV_COLUMNS."""
+    if sys.version_info[0] < 3:
+        f = open(filename, "wb")
+    else:
+        f = open(filename, "w", newline="")
+    with f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for item in items:
+            if item.row is not None:
+                writer.writerow([item.quantity, item.part_number(), item.row.get("Text", ""),
+                                 item.row["Cad"], item.catalog()])
+            else:
+                writer.writerow([item.quantity, "", "", item.source, ""])
+
+
+def write_json(items, filename):
+    """Write *items* as JSON list with all catalog columns of each part."""
+    with open(filename, "w") as f:
+        f.write("[")
+        for i, item in enumerate(items):
+            data = item.row.to_dict() if item.row is not None else {"Cad": item.source}
+            data["Quantity"] = item.quantity
+            data["Catalog"] = item.catalog()
+            f.write(",\n " if i else "\n ")
+            f.write(json.dumps(data, sort_keys=True))
+        f.write("\n]\n")
+
+
+def export_bom(document, filename, table_paths=None):
+    """Write the bill of materials of *document* to *filename* and return its items.
+
+    The file is JSON if *filename* ends with .json, otherwise CSV.
+    """
+    items = bill_of_materials(document, table_paths)
+    if filename.lower().endswith(".json"):
+        write_json(items, filename)
+    else:
+        write_csv(items, filename)
+    return items
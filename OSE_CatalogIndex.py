@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+# Precompiled binary index of all part catalogs.
+#
+# The index is built from the CSV files in Base.TABLE_PATH by running
+#
+#     python OSE_CatalogIndex.py
+#
+# At runtime the index file is memory-mapped and only the parts which are
+# actually used are decoded. Every table stores the modification time and
+# size of its CSV file. If the CSV file has changed since the index was
+# built, the table is loaded from the CSV file instead.
+#
+# File layout (little endian):
+#
+#   header      magic, version, table count, string count and section positions
+#   strings     (string count + 1) offsets followed by the UTF-8 string data
+#   directory   one TABLE_RECORD per table
+#   per table   column name ids, row_count * column_count string ids,
+#               and an open addressing hash table mapping keys to rows.
+
+import mmap
+import os
+import struct
+import sys
+
+import OSE_BasePartLibrary as Base
+from OSE_PartCatalog import CsvError, CsvTable, RowView, column_positions
+
+MAGIC = b"OSECIDX\0"
+VERSION = 1
+HEADER = struct.Struct("<8sIIIIII")
+TABLE_RECORD = struct.Struct("<IdQIIiIIII")
+UINT32 = struct.Struct("<I")
+EMPTY_SLOT = 0xFFFFFFFF
+
+PY2 = sys.version_info[0] == 2
+
+
+def _encode(value):
+    if PY2 and isinstance(value, str):
+        return value  # csv module of Python 2 already returns UTF-8 bytes.
+    return value.encode("utf-8")
+
+
+def _decode(data):
+    if PY2:
+        return data
+    return data.decode("utf-8")
+
+
+def _hash(data):
+    """Return 32 bit FNV-1a hash of bytes *data*. It is stable between processes."""
+    h = 0x811c9dc5
+    for c in bytearray(data):
+        h = ((h ^ c) * 0x01000193) & 0xFFFFFFFF
+    return h
+
+
+def _hash_capacity(count):
+    capacity = 8
+    while capacity < count * 2:
+        capacity *= 2
+    return capacity
+
+
+def _table_names(table_dir):
+    return sorted(name for name in os.listdir(table_dir) if name.lower().endswith(".csv")
+                  and not name.lower().endswith(Base.GEOMETRY_TABLE_SUFFIX))
+
+
+def build_index(table_dir=Base.TABLE_PATH, index_path=Base.CATALOG_INDEX_PATH,
+                key_column_name="PartNumber"):
+    """Compile all CSV files in *table_dir* into the index file *index_path*.
+
+    Tables which cannot be loaded, for example because of a not unique key,
+    are not written to the index; they are still loaded from CSV at runtime.
+    Return the list of indexed table names.
+    """
+    strings = []
+    string_ids = {}
+
+    def intern(value):
+        data = _encode(value)
+        sid = string_ids.get(data)
+        if sid is None:
+            sid = len(strings)
+            string_ids[data] = sid
+            strings.append(data)
+        return sid
+
+    tables = []
+    for name in _table_names(table_dir):
+        path = os.path.join(table_dir, name)
+        st = os.stat(path)
+        table = CsvTable(key_column_name=key_column_name)
+        try:
+            table.load(path)
+        except (CsvError, ValueError, StopIteration) as e:
+            sys.stderr.write("Skipping %s: %s\n" % (path, e))
+            continue
+        column_count = table.column_count()
+        row_count = table.row_count()
+        cells = []
+        for row_i in range(row_count):
+            cells.extend(intern(table.get_value(row_i, c)) for c in range(column_count))
+        capacity = _hash_capacity(row_count)
+        slots = [EMPTY_SLOT] * capacity
+        key_column = table.headers.index(key_column_name)
+        for row_i in range(row_count):
+            slot = _hash(_encode(table.get_part_key(row_i))) & (capacity - 1)
+            while slots[slot] != EMPTY_SLOT:
+                slot = (slot + 1) & (capacity - 1)
+            slots[slot] = row_i
+        tables.append((intern(name), st.st_mtime, st.st_size, column_count, row_count,
+                       key_column, [intern(h) for h in table.headers], cells, slots))
+
+    # Compute positions of the sections.
+    pos = HEADER.size
+    strings_offsets_pos = pos
+    pos += 4 * (len(strings) + 1)
+    strings_data_pos = pos
+    pos += sum(len(s) for s in strings)
+    directory_pos = pos
+    pos += TABLE_RECORD.size * len(tables)
+    records = []
+    for (name_id, mtime, size, column_count, row_count, key_column,
+         headers, cells, slots) in tables:
+        headers_pos = pos
+        pos += 4 * len(headers)
+        rows_pos = pos
+        pos += 4 * len(cells)
+        hash_pos = pos
+        pos += 4 * len(slots)
+        records.append(TABLE_RECORD.pack(name_id, mtime, size, column_count, row_count,
+                                         key_column, headers_pos, rows_pos, hash_pos,
+                                         len(slots)))
+
+    offsets = [0]
+    for s in strings:
+        offsets.append(offsets[-1] + len(s))
+
+    with Base.atomic_write(index_path) as tmp_path, open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(tables), len(strings), strings_offsets_pos,
+                            strings_data_pos, directory_pos))
+        f.write(struct.pack("<%dI" % len(offsets), *offsets))
+        f.write(b"".join(strings))
+        f.write(b"".join(records))
+        for (_, _, _, _, _, _, headers, cells, slots) in tables:
+            for ids in (headers, cells, slots):
+                f.write(struct.pack("<%dI" % len(ids), *ids))
+    return [_decode(strings[t[0]]) for t in tables]
+
+
+class IndexedTable:
+    """Read-only table backed by a CatalogIndex.
+
+    It has the same reading interface as CsvTable.
+    """
+
+    def __init__(self, index, record, mandatory_dims=None):
+        self._index = index
+        (name_id, self.source_mtime, self.source_size, self._column_count, self._row_count,
+         self._key_column_index, headers_pos, self._rows_pos, self._hash_pos,
+         self._hash_capacity) = record
+        self.name = index.string(name_id)
+        self.headers = [index.string(index.uint32(headers_pos + 4 * i))
+                        for i in range(self._column_count)]
+        self.column_positions = column_positions(self.headers)
+        if mandatory_dims is None:
+            mandatory_dims = []
+        self.mandatory_dims = mandatory_dims
+        self._key_column_name = self.headers[self._key_column_index]
+        self._secondary_indexes = {}
+        self.has_valid_data = self.has_necessary_columns()
+
+    def key_column_name(self):
+        return self._key_column_name
+
+    def has_necessary_columns(self):
+        """ Check if the data contains all the columns required to create a part."""
+        return all(h in self.headers for h in (self.mandatory_dims + [self._key_column_name]))
+
+    def row_count(self):
+        return self._row_count
+
+    def column_count(self):
+        return self._column_count
+
+    def get_value(self, row_index, column_index):
+        if not 0 <= row_index < self._row_count:
+            raise IndexError(row_index)
+        pos = self._rows_pos + 4 * (row_index * self._column_count + column_index)
+        return self._index.string(self._index.uint32(pos))
+
+    def get_row(self, row_index):
+        """Return row with the index *row_index* as a RowView."""
+        if not 0 <= row_index < self._row_count:
+            raise IndexError(row_index)
+        return RowView(self, row_index)
+
+    def get_part_key(self, index):
+        """Return part key of a row with the index *index*."""
+        return self.get_value(index, self._key_column_index)
+
+    def find_row_index(self, key):
+        """Return index of the row with key *key* or -1 if there is no such row."""
+        mask = self._hash_capacity - 1
+        slot = _hash(_encode(key)) & mask
+        while True:
+            row_i = self._index.uint32(self._hash_pos + 4 * slot)
+            if row_i == EMPTY_SLOT:
+                return -1
+            if self.get_part_key(row_i) == key:
+                return row_i
+            slot = (slot + 1) & mask
+
+    def find_part(self, key):
+        """Return the row with key (part name) as a RowView."""
+        row_i = self.find_row_index(key)
+        if row_i < 0:
+            return None
+        return self.get_row(row_i)
+
+    def find_row_indexes(self, column_name, value):
+        """Return indexes of all rows where column *column_name* equals *value*.
+
+        The index for the column is built on the first call.
+        """
+        index = self._secondary_indexes.get(column_name)
+        if index is None:
+            column = self.headers.index(column_name)
+            index = {}
+            for row_i in range(self._row_count):
+                index.setdefault(self.get_value(row_i, column), []).append(row_i)
+            self._secondary_indexes[column_name] = index
+        return list(index.get(value, []))
+
+
+class CatalogIndex:
+    """Memory-mapped catalog index file."""
+
+    def __init__(self, index_path=Base.CATALOG_INDEX_PATH, table_dir=Base.TABLE_PATH):
+        self.path = index_path
+        self.table_dir = os.path.abspath(table_dir)
+        self._file = open(index_path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        st = os.fstat(self._file.fileno())
+        self.stamp = (st.st_mtime, st.st_size)
+        (magic, version, table_count, self._string_count, self._strings_offsets_pos,
+         self._strings_data_pos, directory_pos) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("%s is not a catalog index of version %d" % (index_path, VERSION))
+        self._strings = {}
+        # Map table name -> record. The directory is small, so read it at once.
+        self._records = {}
+        for i in range(table_count):
+            record = TABLE_RECORD.unpack_from(self._map, directory_pos + i * TABLE_RECORD.size)
+            self._records[self.string(record[0])] = record
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def uint32(self, pos):
+        return UINT32.unpack_from(self._map, pos)[0]
+
+    def string(self, sid):
+        value = self._strings.get(sid)
+        if value is None:
+            start, end = struct.unpack_from("<II", self._map, self._strings_offsets_pos + 4 * sid)
+            pos = self._strings_data_pos
+            value = _decode(self._map[pos + start:pos + end])
+            self._strings[sid] = value
+        return value
+
+    def table_names(self):
+        return sorted(self._records)
+
+    def table(self, filename, mandatory_dims=None, key_column_name="PartNumber"):
+        """Return IndexedTable for the CSV file *filename* or None.
+
+        None is returned if the table is not in the index, if it was indexed
+        with another key column or if the CSV file changed after the index
+        was built. The caller must load the CSV file in this case.
+        """
+        path = os.path.abspath(filename)
+        if os.path.dirname(path) != self.table_dir:
+            return None
+        record = self._records.get(os.path.basename(path))
+        if record is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if st.st_mtime != record[1] or st.st_size != record[2]:
+            return None  # The CSV file is newer than the index.
+        table = IndexedTable(self, record, mandatory_dims)
+        if table.key_column_name() != key_column_name:
+            return None
+        return table
+
+    def stale_tables(self):
+        """Return names of CSV files which were changed or added after the index was built."""
+        stale = []
+        for name in _table_names(self.table_dir):
+            record = self._records.get(name)
+            st = os.stat(os.path.join(self.table_dir, name))
+            if record is None or st.st_mtime != record[1] or st.st_size != record[2]:
+                stale.append(name)
+        return stale
+
+
+def open_index(index_path=Base.CATALOG_INDEX_PATH, table_dir=Base.TABLE_PATH):
+    """Return CatalogIndex or None if there is no usable index file."""
+    if not os.path.isfile(index_path):
+        return None
+    try:
+        return CatalogIndex(index_path, table_dir)
+    except (IOError, OSError, ValueError, struct.error):
+        return None
+
+
+def ensure_index(table_dir=Base.TABLE_PATH, index_path=Base.CATALOG_INDEX_PATH):
+    """Rebuild the index if it is missing or older than any CSV file.
+
+    Return True if the index was rebuilt. If the index file cannot be
+    replaced, for example on Windows while FreeCAD has it memory-mapped, the
+    old index is kept and False is returned. Its stale tables are loaded
+    from the CSV files until the next rebuild.
+    """
+    index = open_index(index_path, table_dir)
+    if index is not None:
+        stale = index.stale_tables()
+        index.close()
+        if not stale:
+            return False
+    try:
+        build_index(table_dir, index_path)
+    except OSError as e:
+        sys.stderr.write("Cannot replace %s: %s\n" % (index_path, e))
+        return False
+    return True
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Build the binary index of the part catalogs.")
+    parser.add_argument("--tables", default=Base.TABLE_PATH,
+                        help="directory with CSV tables (default: %(default)s)")
+    parser.add_argument("--output", default=None,
+                        help="index file (default: catalog.idx in the table directory)")
+    parser.add_argument("--if-stale", action="store_true",
+                        help="only rebuild if a CSV file is newer than the index")
+    args = parser.parse_args(argv)
+    output = args.output or os.path.join(args.tables, Base.CATALOG_INDEX_NAME)
+    if args.if_stale:
+        if not ensure_index(args.tables, output):
+            print("%s was not rebuilt" % output)
+            return 0
+        print("Rebuilt %s" % output)
+    else:
+        try:
+            names = build_index(args.tables, output)
+        except OSError as e:
+            sys.stderr.write("Cannot replace %s: %s\n" % (output, e))
+            return 1
+        print("Indexed %d tables into %s" % (len(names), output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,97 @@
+#***************************************************************************
+#*                                                                         *
+#*  This file is part of the FreeCAD_Workbench_Starter project.            *
+#*                                                                         *
+#*                                                                         *
+#*  Copyright (C) 2017                                                     *
+#*  Ruslan Krenzler                                                        *
+#*  Stephen Kaiser <freesol29@gmail.com>                                   *
+#*                                                                         *
+#*  This library is free software; you can redistribute it and/or          *
+#*  modify it under the terms of the GNU Lesser General Public             *
+#*  License as published by the Free Software Foundation; either           *
+#*  version 2 of the License, or (at your option) any later version.       *
+#*                                                                         *
+#*  This library is distributed in the hope that it will be useful,        *
+#*  but WITHOUT ANY WARRANTY; without even the implied warranty of         *
+#*  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU      *
+#*  Lesser General Public License for more details.                        *
+#*                                                                         *
+#*  You should have received a copy of the GNU Lesser General Public       *
+#*  License along with this library; if not, If not, see                   *
+#*  <http://www.gnu.org/licenses/>.                                        *
+#*                                                                         *
+#*                                                                         *
+#***************************************************************************
+
+# Metadata of the toolbar commands. This module must stay cheap to import:
+# it is read when the workbench is initialized.
+
+#COMMAND_TABLE = [
+ #{"Command":"A", "ButtonImage":"DrawStyleWireFrame.svg", "Csv":"table_d3d.csv", "MenuText":"Command A",
+ #	"ToolTip":"This is a test command A"},
+#]
+
+COMMAND_TABLE = [
+    {"Command": "A", "ButtonImage": "DrawStyleWireFrame.svg", "Csv": "table_d3d.csv", "MenuText": "Command A",
+	 "Title":"Insert a Part",
+     "ToolTip": "This is a test command A"},
+    {"Command": "boxset", "ButtonImage": "DrawStyleWireFrame.svg",
+     "Csv": "boxset.csv",
+	 "Title":"Insert a part from box set",
+     "MenuText": "Add Boxset", "ToolTip": ""},
+
+    {"Command": "AddFlachprofil", "ButtonImage": "flachprofile.png",
+	 "Title":"Insert a Flachprofil",
+     "Csv": "flachprofile.csv",
+     "MenuText": "Add Flachprofil", "ToolTip": ""},
+
+    {"Command": "AddLframeset", "ButtonImage": "DrawStyleWireFrame.svg",
+     "Csv": "lframeset.csv",
+	 "Title":"Insert Lframeset",
+     "MenuText": "Add Lframeset", "ToolTip": ""},
+
+    {"Command": "AddLibresolarbox", "ButtonImage": "DrawStyleWireFrame.svg",
+	 "Title":"Insert Libresolarbox",
+     "Csv": "libresolarbox.csv",
+     "MenuText": "Add Libresolarbox", "ToolTip": ""},
+
+    {"Command": "AddSchraubenmutter", "ButtonImage": "nut.png",
+	 "Title":"Insert a Schraubenmutter",
+     "Csv": "schraubenmuttern.csv",
+     "MenuText": "Add Schraubenmutter", "ToolTip": ""},
+
+    {"Command": "AddTslotprofil", "ButtonImage": "tslot.png",
+	 "Title":"Insert a T-Slot profil",
+     "Csv": "tslotprofile.csv",
+     "MenuText": "Add T-Slotprofil", "ToolTip": ""},
+
+    {"Command": "AddVerbinder", "ButtonImage": "verbinder.png",
+	 "Title":"Insert a Verbinder",
+     "Csv": "verbinder.csv",
+     "MenuText": "Add Verbinder", "ToolTip": ""},
+
+    {"Command": "Add Winkel", "ButtonImage": "angle.png",
+	 "Title":"Insert a Winkel",
+     "Csv": "winkel.csv",
+     "MenuText": "Add Winkel", "ToolTip": ""},
+]
+
+
+# Initalize command list. It is used in InitGui.py.
+COMMAND_LIST = []
+
+for row in COMMAND_TABLE:
+    COMMAND_LIST.append(row["Command"])
+
+# Search over all tables above.
+SEARCH_COMMAND = "OSE_SearchPart"
+COMMAND_LIST.append(SEARCH_COMMAND)
+
+# Update parts of the active document whose files changed.
+REFRESH_COMMAND = "OSE_RefreshParts"
+COMMAND_LIST.append(REFRESH_COMMAND)
+
+# Write the bill of materials of the active document.
+BOM_COMMAND = "OSE_ExportBom"
+COMMAND_LIST.append(BOM_COMMAND)
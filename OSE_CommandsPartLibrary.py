@@ -24,80 +24,40 @@
 #*                                                                         *
 #***************************************************************************
 
-import copy
 import os.path
 
 import FreeCAD
 from FreeCAD import Gui
 
 import OSE_BasePartLibrary as Base
-import OSE_PartLibraryGui as PartLibraryGui
-
-#COMMAND_TABLE = [
- #{"Command":"A", "ButtonImage":"DrawStyleWireFrame.svg", "Csv":"table_d3d.csv", "MenuText":"Command A",
- #	"ToolTip":"This is a test command A"},
-#]
-
-COMMAND_TABLE = [
-    {"Command": "A", "ButtonImage": "DrawStyleWireFrame.svg", "Csv": "table_d3d.csv", "MenuText": "Command A",
-	 "Title":"Insert a Part",
-     "ToolTip": "This is a test command A"},
-    {"Command": "boxset", "ButtonImage": "DrawStyleWireFrame.svg",
-     "Csv": "boxset.csv",
-	 "Title":"Insert a part from box set",
-     "MenuText": "Add Boxset", "ToolTip": ""},
-
-    {"Command": "AddFlachprofil", "ButtonImage": "flachprofile.png",
-	 "Title":"Insert a Flachprofil",
-     "Csv": "flachprofile.csv",
-     "MenuText": "Add Flachprofil", "ToolTip": ""},
-
-    {"Command": "AddLframeset", "ButtonImage": "DrawStyleWireFrame.svg",
-     "Csv": "lframeset.csv",
-	 "Title":"Insert Lframeset",
-     "MenuText": "Add Lframeset", "ToolTip": ""},
-
-    {"Command": "AddLibresolarbox", "ButtonImage": "DrawStyleWireFrame.svg",
-	 "Title":"Insert Libresolarbox",
-     "Csv": "libresolarbox.csv",
-     "MenuText": "Add Libresolarbox", "ToolTip": ""},
-
-    {"Command": "AddSchraubenmutter", "ButtonImage": "nut.png",
-	 "Title":"Insert a Schraubenmutter",
-     "Csv": "schraubenmuttern.csv",
-     "MenuText": "Add Schraubenmutter", "ToolTip": ""},
-
-    {"Command": "AddTslotprofil", "ButtonImage": "tslot.png",
-	 "Title":"Insert a T-Slot profil",
-     "Csv": "tslotprofile.csv",
-     "MenuText": "Add T-Slotprofil", "ToolTip": ""},
-
-    {"Command": "AddVerbinder", "ButtonImage": "verbinder.png",
-	 "Title":"Insert a Verbinder",
-     "Csv": "verbinder.csv",
-     "MenuText": "Add Verbinder", "ToolTip": ""},
-
-    {"Command": "Add Winkel", "ButtonImage": "angle.png",
-	 "Title":"Insert a Winkel",
-     "Csv": "winkel.csv",
-     "MenuText": "Add Winkel", "ToolTip": ""},
-]
-
-
-# Initalize command list. It is used in InitGui.py.
-COMMAND_LIST = []
+import OSE_Trace
+from OSE_CommandTable import (COMMAND_TABLE, COMMAND_LIST,  # noqa: F401
+                              SEARCH_COMMAND, REFRESH_COMMAND, BOM_COMMAND)
+
+# The command metadata lives in OSE_CommandTable. It is enough to register
+# the commands; the dialog module with PySide and assembly2 is imported
+# on the first click, unless lazy loading is switched off in the preferences
+# (Mod/OSE_PartLibrary, LazyCommands).
+PREFERENCES = Base.PREFERENCES
+LAZY_COMMANDS = FreeCAD.ParamGet(PREFERENCES).GetBool("LazyCommands", True)
+# Timing spans of the commands in the log and in a Chrome trace file (Trace,
+# TracePath), see OSE_Trace.py.
+if FreeCAD.ParamGet(PREFERENCES).GetBool("Trace", False):
+    OSE_Trace.enable(FreeCAD.ParamGet(PREFERENCES).GetString(
+        "TracePath", os.path.join(Base.CACHE_PATH, "trace.json")))
 
-for row in COMMAND_TABLE:
-    COMMAND_LIST.append(row["Command"])
+
+def gui_module():
+    """Return the dialog module. Import it on the first call."""
+    import OSE_PartLibraryGui
+    return OSE_PartLibraryGui
 
 
 class ButtonCommand():
     """Command to add the printer frame"""
 
     def __init__(self, row):
-        self.row = copy.deepcopy(row)
-        print("This command got row")
-        print(row)
+        self.row = row
 
     def GetResources(self):
         return {'Pixmap': Base.ICON_PATH + '/' + self.row["ButtonImage"],  # the name of a svg file available in the resources
@@ -120,6 +80,8 @@ class ButtonCommand():
         return True
 
     def show_dialog(self, document, row):
+        with OSE_Trace.span("import_gui_module"):
+            PartLibraryGui = gui_module()
         table_path = os.path.join(Base.TABLE_PATH, row["Csv"])
         table = PartLibraryGui.gui_check_table(table_path)
         if table is None:
@@ -129,17 +91,91 @@ class ButtonCommand():
         params = PartLibraryGui.DialogParams()
         params.document = document
         params.table = table
+        params.table_path = table_path
         params.dialogTitle = row["Title"]
         # Use the same name for settings as for the table.
         params.settings_name = row["Csv"]
         params.key_column_name = "PartNumber"
-        form = PartLibraryGui.BaseDialog(params)
+        with OSE_Trace.span("open_dialog", command=row["Command"]):
+            form = PartLibraryGui.BaseDialog(params)
+        form.exec_()
+
+
+class SearchCommand():
+    """Command to search a part in all tables"""
+
+    def GetResources(self):
+        return {'Pixmap': Base.ICON_PATH + '/DrawStyleWireFrame.svg',
+                'MenuText': "Search part",
+                'ToolTip': "Search a part in all part tables"}
+
+    def Activated(self):
+        if Gui.ActiveDocument == None:
+            FreeCAD.newDocument()
+        with OSE_Trace.span("open_dialog", command=SEARCH_COMMAND):
+            form = gui_module().SearchDialog(FreeCAD.activeDocument())
         form.exec_()
 
+    def IsActive(self):
+        return True
+
+
+class RefreshCommand():
+    """Command to update all parts whose files changed since they were inserted"""
+
+    def GetResources(self):
+        return {'Pixmap': Base.ICON_PATH + '/DrawStyleWireFrame.svg',
+                'MenuText': "Refresh changed parts",
+                'ToolTip': "Reload parts of the active document whose files changed"}
+
+    def Activated(self):
+        import OSE_PartInsertion
+        from PySide import QtGui
+        report = OSE_PartInsertion.refresh_parts(FreeCAD.activeDocument())
+        QtGui.QMessageBox.information(QtGui.qApp.activeWindow(), "Refresh changed parts",
+                                      report.summary())
+
+    def IsActive(self):
+        return FreeCAD.activeDocument() is not None
+
+
+class BomCommand():
+    """Command to write the parts of the active document with their quantities"""
+
+    def GetResources(self):
+        return {'Pixmap': Base.ICON_PATH + '/DrawStyleWireFrame.svg',
+                'MenuText': "Export bill of materials",
+                'ToolTip': "Write the parts of the active document to a CSV or JSON file"}
+
+    def Activated(self):
+        import OSE_Bom
+        from PySide import QtGui
+        document = FreeCAD.activeDocument()
+        filename, _ = QtGui.QFileDialog.getSaveFileName(
+            QtGui.qApp.activeWindow(), "Export bill of materials", document.Label + ".csv",
+            "CSV (*.csv);;JSON (*.json)")
+        if not filename:
+            return
+        with OSE_Trace.span("export_bom", file=filename):
+            items = OSE_Bom.export_bom(document, filename)
+        missing = sum(item.quantity for item in items if item.row is None)
+        text = "Wrote %d parts in %d lines to %s." % (
+            sum(item.quantity for item in items), len(items), filename)
+        if missing:
+            text += "\n%d parts are not in a catalog." % missing
+        QtGui.QMessageBox.information(QtGui.qApp.activeWindow(), "Export bill of materials", text)
+
+    def IsActive(self):
+        return FreeCAD.activeDocument() is not None
 
 
 # Add commands from the list
 
 for row in COMMAND_TABLE:
-    print("Adding command %s" % row["Command"])
     Gui.addCommand(row["Command"], ButtonCommand(row))
+Gui.addCommand(SEARCH_COMMAND, SearchCommand())
+Gui.addCommand(REFRESH_COMMAND, RefreshCommand())
+Gui.addCommand(BOM_COMMAND, BomCommand())
+
+if not LAZY_COMMANDS:
+    gui_module()
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# Per-document lookup tables for importPart.
+#
+# Inserting a part needs an unused object name, an unused label, the open
+# document of a file, whether the assembly already has a part with a
+# fixed position and, for linked parts, the shared source object of a
+# file. Computed from document.Objects this costs O(n) per insert and an
+# assembly of n parts O(n^2) to build. DocumentIndex keeps these
+# facts in sets and dictionaries. A FreeCAD document observer keeps the
+# indexes current when objects are created, deleted, relabeled or changed
+# by undo and redo, also by other workbenches.
+#
+# Without document observers (very old FreeCAD versions) the index of a
+# document is rebuilt on every index_for() call, which is still correct.
+
+import re
+
+import FreeCAD
+
+# Characters FreeCAD replaces by "_" in object names.
+_NOT_IDENTIFIER = re.compile(r"[^0-9A-Za-z_]")
+
+
+def identifier(name):
+    """Return *name* as FreeCAD makes it a valid object name."""
+    name = _NOT_IDENTIFIER.sub("_", name)
+    if not name or name[0].isdigit():
+        name = "_" + name
+    return name
+
+
+class DocumentIndex:
+    """Object names, labels and fixed parts of one document."""
+
+    def __init__(self, document):
+        self.document = document
+        self.rebuild()
+
+    def rebuild(self):
+        self.names = set()
+        # Map label -> number of objects with this label.
+        self.labels = {}
+        # Map object name -> label, to find the old label after a relabel.
+        self._label_of = {}
+        # Names of objects whose fixedPosition property is True.
+        self.fixed = set()
+        # Map source file -> name of the object with its shared geometry.
+        self.shared = {}
+        # Map (base, format, counter start) -> smallest number which may still be unused.
+        self._next_name = {}
+        self._next_label = {}
+        for obj in self.document.Objects:
+            self.add_object(obj)
+
+    def add_object(self, obj):
+        self.names.add(obj.Name)
+        self._set_label(obj.Name, obj.Label)
+        if getattr(obj, "fixedPosition", False):
+            self.fixed.add(obj.Name)
+        if getattr(obj, "sharedGeometry", False):
+            self.shared[obj.sourceFile] = obj.Name
+
+    def remove_object(self, obj):
+        self.names.discard(obj.Name)
+        self._set_label(obj.Name, None)
+        self.fixed.discard(obj.Name)
+        if getattr(obj, "sharedGeometry", False) and \
+                self.shared.get(obj.sourceFile) == obj.Name:
+            del self.shared[obj.sourceFile]
+        # The name can be used again; search from the start next time.
+        self._next_name.clear()
+
+    def changed_object(self, obj, prop):
+        if prop == "Label":
+            self._set_label(obj.Name, obj.Label)
+        elif prop == "fixedPosition":
+            if obj.fixedPosition:
+                self.fixed.add(obj.Name)
+            else:
+                self.fixed.discard(obj.Name)
+        elif prop == "sharedGeometry" and obj.sharedGeometry:
+            self.shared[obj.sourceFile] = obj.Name
+
+    def _set_label(self, name, label):
+        old = self._label_of.pop(name, None)
+        if old is not None:
+            count = self.labels[old] - 1
+            if count:
+                self.labels[old] = count
+            else:
+                del self.labels[old]
+                self._next_label.clear()
+        if label is not None:
+            self._label_of[name] = label
+            self.labels[label] = self.labels.get(label, 0) + 1
+
+    def has_fixed_part(self):
+        """Return True if an object of the document has fixedPosition set."""
+        return bool(self.fixed)
+
+    def shared_source(self, filename):
+        """Return the object with the shared geometry of *filename* or None."""
+        name = self.shared.get(filename)
+        if name is None:
+            return None
+        return self.document.getObject(name)
+
+    @staticmethod
+    def _unused(base, used, next_numbers, counter_start, fmt):
+        key = (base, fmt, counter_start)
+        i = next_numbers.get(key, counter_start)
+        candidate = "%s%s" % (base, fmt % i)
+        while candidate in used:
+            i += 1
+            candidate = "%s%s" % (base, fmt % i)
+        next_numbers[key] = i
+        return candidate
+
+    def unused_name(self, base, counter_start=1, fmt="%02i"):
+        """Return the first name base + number which is not used in the document."""
+        base = identifier(base)
+        name = self._unused(base, self.names, self._next_name, counter_start, fmt)
+        # Guard against names created while no observer was listening.
+        while self.document.getObject(name) is not None:
+            self.names.add(name)
+            name = self._unused(base, self.names, self._next_name, counter_start, fmt)
+        return name
+
+    def unused_label(self, base, counter_start=1, fmt="%02i"):
+        """Return the first label base + number which is not used in the document."""
+        return self._unused(base, self.labels, self._next_label, counter_start, fmt)
+
+
+class _Observer:
+    """Keeps the indexes current. Registered with FreeCAD.addDocumentObserver."""
+
+    def slotCreatedObject(self, obj):
+        index = _indexes.get(obj.Document.Name)
+        if index is not None:
+            index.add_object(obj)
+
+    def slotDeletedObject(self, obj):
+        index = _indexes.get(obj.Document.Name)
+        if index is not None:
+            index.remove_object(obj)
+
+    def slotChangedObject(self, obj, prop):
+        if prop in _INDEXED_PROPERTIES:
+            index = _indexes.get(obj.Document.Name)
+            if index is not None and obj.Name in index.names:
+                index.changed_object(obj, prop)
+
+    def slotUndoDocument(self, doc):
+        # Undo and redo may restore or remove objects without the usual signals.
+        _indexes.pop(doc.Name, None)
+
+    slotRedoDocument = slotUndoDocument
+
+    def slotDeletedDocument(self, doc):
+        _indexes.pop(doc.Name, None)
+        _forget_open_documents()
+
+    def slotCreatedDocument(self, doc):
+        _forget_open_documents()
+
+    def slotRelabelDocument(self, doc):
+        _forget_open_documents()
+
+    def slotFinishSaveDocument(self, doc, filename):
+        _forget_open_documents()
+
+
+# Properties whose changes DocumentIndex.changed_object() handles.
+_INDEXED_PROPERTIES = ("Label", "fixedPosition", "sharedGeometry")
+# Map document name -> DocumentIndex.
+_indexes = {}
+# Map file name -> open document, built on demand.
+_open_documents = None
+_observer = None
+
+
+def _observe():
+    """Register the document observer once. Return True if it is active."""
+    global _observer
+    if _observer is None:
+        _observer = _Observer()
+        try:
+            FreeCAD.addDocumentObserver(_observer)
+        except AttributeError:
+            _observer = False
+    return bool(_observer)
+
+
+def _forget_open_documents():
+    global _open_documents
+    _open_documents = None
+
+
+def index_for(document):
+    """Return the DocumentIndex of *document*."""
+    observing = _observe()
+    index = _indexes.get(document.Name)
+    if index is None or index.document is not document:
+        index = _indexes[document.Name] = DocumentIndex(document)
+    elif not observing:
+        index.rebuild()
+    return index
+
+
+def open_document(filename):
+    """Return the open document loaded from *filename* or None."""
+    global _open_documents
+    documents = _open_documents
+    if documents is None or not _observe():
+        documents = {}
+        for doc in FreeCAD.listDocuments().values():
+            documents.setdefault(doc.FileName, doc)
+        _open_documents = documents
+    return documents.get(filename)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Read data from FreeCAD .fcstd files without FreeCAD.
+#
+# A .fcstd file is a zip archive. Document.xml describes the objects,
+# GuiDocument.xml their view providers. Properties like DiffuseColor are
+# stored in separate binary members. Reading these members directly is much
+# faster than opening the document and works in FreeCADCmd, where the view
+# providers are not loaded.
+
+import struct
+import xml.etree.ElementTree as ElementTree
+import zipfile
+
+
+def unpack_color(value):
+    """Convert a packed 0xRRGGBBAA color of FreeCAD to a tuple of floats."""
+    value = int(value)
+    return tuple(((value >> shift) & 0xFF) / 255.0 for shift in (24, 16, 8, 0))
+
+
+def read_color_list(data):
+    """Decode an App::PropertyColorList member: uint32 count and packed colors."""
+    count = struct.unpack_from("<I", data, 0)[0]
+    return [unpack_color(v) for v in struct.unpack_from("<%dI" % count, data, 4)]
+
+
+def _property_value(archive, prop):
+    """Return python value of a property element of GuiDocument.xml or None."""
+    for child in prop:
+        tag = child.tag
+        if tag == "Bool":
+            return child.get("value") == "true"
+        if tag == "Integer":
+            return int(child.get("value"))
+        if tag == "Float":
+            return float(child.get("value"))
+        if tag == "PropertyColor":
+            return unpack_color(child.get("value"))
+        if tag == "ColorList":
+            try:
+                return read_color_list(archive.read(child.get("file")))
+            except KeyError:
+                return None  # Referenced member is missing.
+    return None
+
+
+def read_view_properties(filename, names=("Visibility", "Transparency", "DiffuseColor",
+                                          "ShapeColor")):
+    """Return {object name: {property name: value}} from GuiDocument.xml.
+
+    Only properties listed in *names* are decoded. Return an empty
+    dictionary if the file has no GuiDocument.xml.
+    """
+    result = {}
+    with zipfile.ZipFile(filename) as archive:
+        try:
+            data = archive.read("GuiDocument.xml")
+        except KeyError:
+            return result
+        root = ElementTree.fromstring(data)
+        for view_provider in root.iter("ViewProvider"):
+            props = {}
+            for prop in view_provider.iter("Property"):
+                name = prop.get("name")
+                if name in names:
+                    value = _property_value(archive, prop)
+                    if value is not None:
+                        props[name] = value
+            result[view_provider.get("name")] = props
+    return result
+
+
+def diffuse_color(view_properties):
+    """Return DiffuseColor of an object, or its ShapeColor as a one-element list."""
+    colors = view_properties.get("DiffuseColor")
+    if colors:
+        return colors
+    if "ShapeColor" in view_properties:
+        return [view_properties["ShapeColor"]]
+    return []
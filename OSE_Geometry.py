@@ -0,0 +1,533 @@
+# -*- coding: utf-8 -*-
+# Geometric properties of the catalog parts, to filter parts by size.
+#
+# The properties of the parts of a catalog tables/<name>.csv are stored in
+# the table tables/<name>.geometry.csv next to it:
+#
+#     PartNumber,Cad,Hash,Length,Width,Height,Volume,Area,Mass,Holes
+#
+# Length >= Width >= Height are the edges of the bounding box, so they do
+# not depend on the orientation of the part in its file. Lengths are in mm,
+# Volume in mm^3, Area in mm^2 and Mass in g, computed from the volume with
+# the density of the catalog, see DENSITIES. Holes is the number of
+# cylindrical holes. Hash is the content hash of the part file; a row whose
+# Cad entry or part file changed is not used and measured again.
+#
+# Build or update the tables with plain Python, before building a library pack:
+#
+#     python OSE_Geometry.py --freecadcmd /usr/bin/FreeCADCmd --jobs 8
+#
+# The shapes are measured by the headless FreeCADCmd workers of OSE_Warmup,
+# which take them from the BREP disk cache or extract them first. Generated
+# parts like tslot:length=160 are computed from their source profile.
+#
+# Query them with:
+#
+#     import OSE_Geometry
+#     keys = OSE_Geometry.find_parts(".../tables/winkel.csv", Length=(20, 40), Holes=(2, None))
+
+import array
+import bisect
+import collections
+import csv
+import os
+import re
+import sys
+import threading
+import time
+
+import OSE_BasePartLibrary as Base
+import OSE_LibraryPack
+import OSE_Manifest
+import OSE_ParametricParts
+import OSE_PartCache
+import OSE_PartCatalog as Catalog
+
+# Numeric columns of a geometry table and their units.
+COLUMNS = ["Length", "Width", "Height", "Volume", "Area", "Mass", "Holes"]
+UNITS = {"Length": "mm", "Width": "mm", "Height": "mm", "Volume": "mm^3", "Area": "mm^2",
+         "Mass": "g", "Holes": ""}
+HEADERS = ["PartNumber", "Cad", "Hash"] + COLUMNS
+# Other names for columns in filter texts.
+ALIASES = {"size": "Length"}
+
+# Density in g/mm^3 of the parts of a catalog. Most parts are aluminium profiles.
+DEFAULT_DENSITY = 2.7e-3
+DENSITIES = {"schraubenmuttern.csv": 7.85e-3}  # Steel screws and nuts.
+
+
+class GeometryError(Catalog.Error):
+    """A geometry table or a filter can not be used."""
+
+    def __init__(self, message):
+        super(GeometryError, self).__init__(message)
+
+
+def geometry_path(table_path):
+    """Return path of the geometry table of the catalog *table_path*."""
+    return os.path.splitext(table_path)[0] + Base.GEOMETRY_TABLE_SUFFIX
+
+
+def density(table_path):
+    return DENSITIES.get(os.path.basename(table_path), DEFAULT_DENSITY)
+
+
+def count_holes(shape):
+    """Return the number of cylindrical holes of a Part shape.
+
+    A hole is a concave cylindrical face. Faces with the same axis and
+    radius, like the two halves FreeCAD makes of a drilled hole, count once.
+    """
+    holes = set()
+    for face in shape.Faces:
+        surface = face.Surface
+        if type(surface).__name__ != "Cylinder" or face.Orientation != "Reversed":
+            continue
+        axis = surface.Axis
+        ax = (axis.x, axis.y, axis.z)
+        if [c for c in ax if abs(c) > 1e-9][0] < 0:
+            ax = (-ax[0], -ax[1], -ax[2])  # Same key for both directions of an axis.
+        center = surface.Center
+        d = center.x * ax[0] + center.y * ax[1] + center.z * ax[2]
+        # The point of the axis nearest to the origin.
+        point = (center.x - d * ax[0], center.y - d * ax[1], center.z - d * ax[2])
+        holes.add(tuple(round(v, 3) for v in ax + point + (surface.Radius,)))
+    return len(holes)
+
+
+def measure(shape):
+    """Return the geometric properties of a Part shape as a JSON compatible dictionary.
+
+    Size holds the edges of the bounding box along x, y and z.
+    """
+    box = shape.BoundBox
+    return {"Size": [box.XLength, box.YLength, box.ZLength], "Volume": shape.Volume,
+            "Area": shape.Area, "Holes": count_holes(shape)}
+
+
+def table_values(geometry, part_density=DEFAULT_DENSITY):
+    """Return the values of COLUMNS for a result of measure()."""
+    length, width, height = sorted(geometry["Size"], reverse=True)
+    return [length, width, height, geometry["Volume"], geometry["Area"],
+            geometry["Volume"] * part_density, geometry["Holes"]]
+
+
+def cad_source(cad):
+    """Return (path of the part file, generator, parameters) of a Cad entry.
+
+    Generator and parameters are None for a library file. Raise
+    OSE_ParametricParts.ParameterError for an invalid reference.
+    """
+    if OSE_ParametricParts.is_reference(cad):
+        generator, parameters = OSE_ParametricParts.parse_reference(cad)
+        return os.path.abspath(generator.source_path()), generator, parameters
+    return os.path.abspath(os.path.join(Base.PARTS_PATH, cad)), None, None
+
+
+def current_hash(cad):
+    """Return the content hash of the part file of *cad* or None if there is none."""
+    try:
+        return OSE_PartCache.FILE_HASHES.get(cad_source(cad)[0])
+    except (IOError, OSError, OSE_ParametricParts.ParameterError):
+        return None
+
+
+def read_table(path):
+    """Return the rows of the geometry table *path* as (key, cad, hash, values)."""
+    with OSE_LibraryPack.open_text(path) as f:
+        reader = csv.reader(f)
+        try:
+            headers = next(reader)
+        except StopIteration:
+            headers = []
+        if headers != HEADERS:
+            raise GeometryError("%s does not have the columns %s" % (path, ",".join(HEADERS)))
+        rows = []
+        for record in reader:
+            if not record:
+                continue
+            try:
+                rows.append((record[0], record[1], record[2], [float(v) for v in record[3:]]))
+            except (IndexError, ValueError):
+                raise GeometryError("Invalid row in %s: %s" % (path, ",".join(record)))
+            if len(rows[-1][3]) != len(COLUMNS):
+                raise GeometryError("Invalid row in %s: %s" % (path, ",".join(record)))
+    return rows
+
+
+def write_table(path, rows):
+    """Write *rows* of (key, cad, hash, values) into the geometry table *path*."""
+    with Base.atomic_write(path) as tmp_path:
+        if sys.version_info[0] < 3:
+            f = open(tmp_path, "wb")
+        else:
+            f = open(tmp_path, "w", newline="")
+        with f:
+            writer = csv.writer(f)
+            writer.writerow(HEADERS)
+            for key, cad, digest, values in rows:
+                writer.writerow([key, cad, digest] + ["%.10g" % v for v in values])
+
+
+class GeometryTable:
+    """Numeric columns of the parts of one catalog with sorted indexes for range queries.
+
+    *keys* are the part keys in catalog order; *columns* maps every name of
+    COLUMNS to an array of the values in the same order. *sources* can give
+    the (Cad entry, content hash) every row was measured from. A row whose
+    part file has another hash now is left out; the hash is checked the
+    first time the row is found, so loading the table does not read the
+    part files.
+    """
+
+    def __init__(self, keys, columns, sources=None):
+        self.keys = keys
+        self.columns = columns
+        self.sources = sources
+        self._rows = dict((key, i) for i, key in enumerate(keys))
+        # Map column -> (sorted values, row of every sorted value), built on the first query.
+        self._indexes = {}
+        # Map row -> True if its part file is unchanged.
+        self._valid = {}
+
+    def row_count(self):
+        return len(self.keys)
+
+    def _is_valid(self, row):
+        if self.sources is None:
+            return True
+        valid = self._valid.get(row)
+        if valid is None:
+            cad, digest = self.sources[row]
+            valid = self._valid[row] = current_hash(cad) == digest
+        return valid
+
+    def get(self, key):
+        """Return {column: value} of the part *key* or None if it was not measured."""
+        row = self._rows.get(key)
+        if row is None or not self._is_valid(row):
+            return None
+        return dict((name, values[row]) for name, values in self.columns.items())
+
+    def _index(self, column):
+        index = self._indexes.get(column)
+        if index is None:
+            values = self.columns.get(column)
+            if values is None:
+                raise GeometryError("Unknown column %s, use one of %s"
+                                    % (column, ", ".join(COLUMNS)))
+            order = sorted(range(len(values)), key=values.__getitem__)
+            index = (array.array("d", (values[i] for i in order)), array.array("i", order))
+            self._indexes[column] = index
+        return index
+
+    def rows_in_range(self, column, low=None, high=None):
+        """Return the rows whose value of *column* is in [low, high], sorted by the value.
+
+        None means no limit.
+        """
+        values, order = self._index(column)
+        first = 0 if low is None else bisect.bisect_left(values, low)
+        last = len(values) if high is None else bisect.bisect_right(values, high)
+        return order[first:last]
+
+    def find(self, ranges):
+        """Return keys of the parts with values in all *ranges*, in catalog order.
+
+        *ranges* maps a column to (low, high) like rows_in_range().
+        """
+        if not ranges:
+            return [key for row, key in enumerate(self.keys) if self._is_valid(row)]
+        # Take the rows of the smallest range and check the other ranges only for them.
+        matches = [(self.rows_in_range(column, *limits), column)
+                   for column, limits in ranges.items()]
+        rows, first = min(matches, key=lambda match: len(match[0]))
+        checks = [(self.columns[column], low, high)
+                  for column, (low, high) in ranges.items() if column != first]
+        found = [row for row in rows
+                 if all((low is None or values[row] >= low) and
+                        (high is None or values[row] <= high) for values, low, high in checks)
+                 and self._is_valid(row)]
+        found.sort()
+        return [self.keys[row] for row in found]
+
+
+def read_geometry(table_path):
+    """Return the GeometryTable of the catalog *table_path* or None if it has no geometry table.
+
+    Parts whose Cad entry changed since they were measured are left out, as
+    are parts whose part file changed when they are found.
+    """
+    path = geometry_path(table_path)
+    if not OSE_LibraryPack.isfile(path):
+        return None
+    catalog = Catalog.load_catalog(table_path)
+    cad_column = catalog.column_positions["Cad"]
+    keys = []
+    sources = []
+    columns = dict((name, array.array("d")) for name in COLUMNS)
+    for key, cad, digest, values in read_table(path):
+        row_i = catalog.find_row_index(key)
+        if row_i < 0 or catalog.get_value(row_i, cad_column) != cad:
+            continue
+        keys.append(key)
+        sources.append((cad, digest))
+        for name, value in zip(COLUMNS, values):
+            columns[name].append(value)
+    return GeometryTable(keys, columns, sources)
+
+
+class GeometryCache:
+    """Process-wide cache of the GeometryTable objects of the catalogs.
+
+    Works like OSE_PartCatalog.CatalogCache: a table is valid as long as the
+    stamps of the geometry table and of the catalog do not change, so a
+    repeated lookup costs two os.stat() calls. Part files are not checked
+    again, a part file changed after its row was found keeps its values.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # Map catalog path -> (stamps, GeometryTable or None), oldest first.
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, table_path):
+        """Return the GeometryTable of *table_path* or None if it has no geometry table."""
+        path = os.path.abspath(table_path)
+        try:
+            stamps = (Catalog.file_stamp(geometry_path(path)), Catalog.file_stamp(path))
+        except OSError:
+            stamps = None  # read_geometry() reports a missing catalog.
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None and stamps is not None and entry[0] == stamps:
+                self._entries[path] = entry  # Mark as recently used.
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        table = read_geometry(path)
+        if stamps is not None:
+            with self._lock:
+                self._entries[path] = (stamps, table)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return table
+
+    def invalidate(self, table_path=None):
+        """Forget the table of *table_path*, or all tables if *table_path* is None."""
+        with self._lock:
+            if table_path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(table_path), None)
+
+    def stats(self):
+        """Return cache counters as a dictionary."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                    "max_entries": self.max_entries}
+
+
+# Cache shared by the dialogs and find_parts().
+GEOMETRY_CACHE = GeometryCache()
+
+
+def load_geometry(table_path):
+    """Return the GeometryTable of the catalog *table_path* or None if it has no geometry table.
+
+    Parts whose Cad entry or part file changed since they were measured are left out.
+    """
+    return GEOMETRY_CACHE.get(table_path)
+
+
+def find_parts(table_path, **ranges):
+    """Return keys of the parts of the catalog *table_path* with values in all *ranges*.
+
+    For example find_parts(path, Length=(20, 40), Holes=(2, None)). Raise
+    GeometryError if the catalog has no geometry table.
+    """
+    table = load_geometry(table_path)
+    if table is None:
+        raise GeometryError("%s has no geometry table, run OSE_Geometry.py" % table_path)
+    return table.find(ranges)
+
+
+def find_all_parts(table_paths=None, **ranges):
+    """Return (table path, key) of the parts of all catalogs with values in all *ranges*.
+
+    Catalogs without geometry table are skipped.
+    """
+    if table_paths is None:
+        table_paths = Catalog.catalog_table_paths()
+    found = []
+    for table_path in table_paths:
+        table = load_geometry(table_path)
+        if table is not None:
+            found.extend((table_path, key) for key in table.find(ranges))
+    return found
+
+
+def describe(values):
+    """Return a short text of the {column: value} of a part, like GeometryTable.get() returns."""
+    text = "%(Length)g x %(Width)g x %(Height)g mm, %(Mass).3g g" % values
+    holes = int(values["Holes"])
+    if holes:
+        text += ", %d hole%s" % (holes, "s" if holes > 1 else "")
+    return text
+
+
+def filter_help():
+    """Return a description of filter texts for parse_filter()."""
+    return "Filter like \"length 20..40, holes >= 2\". Columns: %s" % ", ".join(
+        "%s (%s)" % (name, UNITS[name]) if UNITS[name] else name for name in COLUMNS)
+
+
+_NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_TERM = re.compile(r"^\s*([A-Za-z]+)\s*(?:(>=|<=|=)?\s*(%s)|(%s)?\s*\.\.\s*(%s)?)\s*$"
+                   % (_NUMBER, _NUMBER, _NUMBER))
+
+
+def parse_filter(text):
+    """Return the ranges of a filter text like "length 20..40, holes >= 2".
+
+    Every term is a column name followed by "low..high", ">= low", "<= high"
+    or a single value. Limits are inclusive. Raise GeometryError for an invalid text.
+    """
+    names = dict((name.lower(), name) for name in COLUMNS)
+    names.update(ALIASES)
+    ranges = {}
+    for term in text.split(","):
+        if not term.strip():
+            continue
+        match = _TERM.match(term)
+        if match is None:
+            raise GeometryError("Invalid filter: %s" % term.strip())
+        name, operator, value, low, high = match.groups()
+        column = names.get(name.lower())
+        if column is None:
+            raise GeometryError("Unknown column %s, use one of %s"
+                                % (name, ", ".join(COLUMNS)))
+        if value is not None:
+            value = float(value)
+            limits = (value, None) if operator == ">=" else \
+                (None, value) if operator == "<=" else (value, value)
+        else:
+            limits = (None if low is None else float(low), None if high is None else float(high))
+        ranges[column] = limits
+    return ranges
+
+
+def update_geometry(table_paths=None, freecadcmd=None, jobs=None, force=False, progress=None):
+    """Measure the parts of the catalogs *table_paths* and write their geometry tables.
+
+    Only new parts and parts whose Cad entry or part file changed are
+    measured, all parts if *force* is set. *freecadcmd*, *jobs* and
+    *progress* are passed to OSE_Warmup.warm_up(). Return a list of (table
+    path, key, error) of the parts which could not be measured.
+    """
+    import OSE_Warmup
+    if table_paths is None:
+        table_paths = Catalog.catalog_table_paths()
+    # Use the stored hashes; only new or changed part files are read.
+    OSE_Manifest.shared_manifest()
+    problems = []
+    # List of (table path, [(key, cad, hash, values or None, path, generator, parameters)]).
+    plans = []
+    measure_paths = set()
+    for table_path in table_paths:
+        if OSE_LibraryPack.in_pack(table_path):
+            raise GeometryError("%s is in a library pack, build the geometry tables before "
+                                "packing the library" % table_path)
+        catalog = Catalog.load_catalog(table_path)
+        known = {}
+        path = geometry_path(table_path)
+        if not force and os.path.isfile(path):
+            try:
+                known = dict((row[0], row) for row in read_table(path))
+            except GeometryError:
+                pass  # The table is written again.
+        cad_column = catalog.column_positions["Cad"]
+        entries = []
+        for row_i in range(catalog.row_count()):
+            key = catalog.get_part_key(row_i)
+            cad = catalog.get_value(row_i, cad_column)
+            if not cad:
+                continue
+            try:
+                part_path, generator, parameters = cad_source(cad)
+                digest = OSE_PartCache.FILE_HASHES.get(part_path)
+            except (IOError, OSError, OSE_ParametricParts.ParameterError) as e:
+                problems.append((table_path, key, str(e)))
+                continue
+            if not part_path.lower().endswith(".fcstd"):
+                continue  # The workers can only open FreeCAD documents.
+            row = known.get(key)
+            values = row[3] if row is not None and row[1] == cad and row[2] == digest else None
+            if values is None:
+                measure_paths.add(part_path)
+            entries.append((key, cad, digest, values, part_path, generator, parameters))
+        plans.append((table_path, entries))
+
+    results = OSE_Warmup.warm_up(sorted(measure_paths), freecadcmd, jobs, force, progress,
+                                 measure=True)
+    measured = dict((r.path, r.geometry) for r in results if r.ok())
+    errors = dict((r.path, r.error) for r in results if not r.ok())
+    for table_path, entries in plans:
+        rows = []
+        for key, cad, digest, values, part_path, generator, parameters in entries:
+            if values is None:
+                geometry = measured.get(part_path)
+                if geometry is None:
+                    problems.append((table_path, key, errors.get(part_path, "not measured")))
+                    continue
+                if generator is not None:
+                    geometry = generator.measure(geometry, parameters)
+                values = table_values(geometry, density(table_path))
+            rows.append((key, cad, digest, values))
+        write_table(geometry_path(table_path), rows)
+        GEOMETRY_CACHE.invalidate(table_path)
+    return problems
+
+
+def main(argv):
+    import argparse
+    import OSE_Warmup
+    parser = argparse.ArgumentParser(description="Measure the catalog parts into geometry "
+                                                 "tables next to the catalogs.")
+    parser.add_argument("tables", nargs="*", help="catalog tables (default: all catalogs)")
+    parser.add_argument("--freecadcmd", help="FreeCADCmd executable")
+    parser.add_argument("--jobs", "-j", type=int, help="number of workers")
+    parser.add_argument("--force", action="store_true", help="also measure unchanged parts")
+    args = parser.parse_args(argv)
+
+    def progress(done, total, result):
+        status = "ok    " if result.ok() else "FAILED"
+        sys.stdout.write("[%d/%d] %s %5.2f s %s\n" % (done, total, status, result.time,
+                                                      result.path))
+        sys.stdout.flush()
+
+    table_paths = [os.path.abspath(p) for p in args.tables] or Catalog.catalog_table_paths()
+    start = time.time()
+    try:
+        problems = update_geometry(table_paths, args.freecadcmd, args.jobs, args.force,
+                                   progress)
+    except KeyboardInterrupt:
+        print("Interrupted. Shapes extracted so far stay in the cache.")
+        return 1
+    except (OSE_Warmup.WarmupError, Catalog.Error, IOError, OSError) as e:
+        print(e)
+        return 1
+    print("Wrote geometry tables of %d catalogs in %.1f s" % (len(table_paths),
+                                                              time.time() - start))
+    if problems:
+        print("%d parts without geometry:" % len(problems))
+        for table_path, key, error in problems:
+            print("  %s %s: %s" % (os.path.basename(table_path), key, error))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+# Read the part library from one zip archive, the library pack.
+#
+# A library pack contains the directories tables/ and parts/ of the
+# workbench. Build one from the current library with
+#
+#     python OSE_LibraryPack.py build library-pack.zip
+#
+# and copy it next to the workbench files, or set the environment variable
+# OSE_PART_LIBRARY_PACK to its path. Base.TABLE_PATH and Base.PARTS_PATH then
+# point into the archive, for example .../library-pack.zip/tables/winkel.csv.
+#
+# The functions of this module accept such paths as well as normal file
+# paths. Members of the pack are found in the central directory of the
+# archive, which is read once; catalogs, images and thumbnails are read from
+# the archive into memory. FreeCAD can only open real files, so local_path()
+# extracts CAD files into Base.CACHE_PATH/pack when they are inserted.
+#
+# The pack is opened once per session. After replacing the file, call
+# reload() or restart FreeCAD.
+
+import errno
+import io
+import os
+import shutil
+import sys
+import threading
+import time
+import zipfile
+
+import OSE_BasePartLibrary as Base
+
+# Directory for CAD files extracted from packs.
+EXTRACT_PATH = os.path.join(Base.CACHE_PATH, "pack")
+# Directories of the workbench which are stored in a pack.
+PACK_DIRECTORIES = ["tables", "parts"]
+# These files are compressed already and are stored without compression.
+STORED_EXTENSIONS = (".fcstd", ".png", ".jpg", ".jpeg", ".zip")
+
+
+def _missing(path):
+    return IOError(errno.ENOENT, "No such file in library pack", path)
+
+
+class LibraryPack:
+    """An opened library pack. *path* is the archive file.
+
+    Members are named like in the archive, with "/" as separator.
+    """
+
+    def __init__(self, path, extract_path=EXTRACT_PATH):
+        self.path = os.path.abspath(path)
+        self.mtime = os.stat(self.path).st_mtime
+        self._prefix = self.path + os.sep
+        self._archive = zipfile.ZipFile(self.path)
+        # Map member name -> ZipInfo, from the central directory.
+        self._members = dict((info.filename, info) for info in self._archive.infolist()
+                             if not info.filename.endswith("/"))
+        self.extract_path = os.path.join(
+            extract_path, os.path.splitext(os.path.basename(self.path))[0])
+        self._extract_prefix = self.extract_path + os.sep
+        # zipfile does not support concurrent reads on Python 2.
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._archive.close()
+
+    def member(self, path):
+        """Return the member name of *path* in the pack or None if it is not a pack path."""
+        if not path.startswith(self._prefix):
+            path = os.path.abspath(path)
+            if not path.startswith(self._prefix):
+                return None
+        return path[len(self._prefix):].replace(os.sep, "/")
+
+    def info(self, member):
+        try:
+            return self._members[member]
+        except KeyError:
+            raise _missing(os.path.join(self.path, member))
+
+    def isfile(self, member):
+        return member in self._members
+
+    def stamp(self, member):
+        """Return (mtime, size) of *member*. The mtime is the one of the pack."""
+        return (self.mtime, self.info(member).file_size)
+
+    def read(self, member):
+        info = self.info(member)
+        with self._lock:
+            return self._archive.read(info)
+
+    def files(self, directory):
+        """Return sorted names of all members below the member directory *directory*."""
+        prefix = directory.rstrip("/") + "/" if directory else ""
+        return sorted(m for m in self._members if m.startswith(prefix))
+
+    def extract(self, member):
+        """Return path of *member* extracted into the extract directory.
+
+        The file is written only if it is missing or its size or time differ
+        from the member. It gets the modification time of the member.
+        """
+        info = self.info(member)
+        target = os.path.join(self.extract_path, *member.split("/"))
+        mtime = time.mktime(info.date_time + (0, 0, -1))
+        try:
+            st = os.stat(target)
+            if st.st_size == info.file_size and int(st.st_mtime) == int(mtime):
+                return target
+        except OSError:
+            pass
+        directory = os.path.dirname(target)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass  # Created by another thread or process.
+        # Write to a temporary file first, so FreeCAD never opens half a file.
+        with Base.atomic_write(target) as tmp_path:
+            with self._lock:
+                with self._archive.open(info) as source, open(tmp_path, "wb") as f:
+                    shutil.copyfileobj(source, f)
+            os.utime(tmp_path, (mtime, mtime))
+        return target
+
+    def extracted_member(self, path):
+        """Return the member name of a file extracted by extract() or None."""
+        path = os.path.abspath(path)
+        if not path.startswith(self._extract_prefix):
+            return None
+        return path[len(self._extract_prefix):].replace(os.sep, "/")
+
+
+_pack = None
+_pack_lock = threading.Lock()
+
+
+def active_pack():
+    """Return the LibraryPack of Base.LIBRARY_PACK or None if the library is not packed."""
+    global _pack
+    if _pack is None and Base.LIBRARY_PACK is not None:
+        with _pack_lock:
+            if _pack is None:
+                _pack = LibraryPack(Base.LIBRARY_PACK)
+    return _pack
+
+
+def reload():
+    """Open the pack again on the next access, for example after it was replaced."""
+    global _pack
+    with _pack_lock:
+        if _pack is not None:
+            _pack.close()
+        _pack = None
+
+
+def _member(path):
+    """Return (pack, member name) for a pack path, otherwise (None, None)."""
+    pack = active_pack()
+    if pack is None:
+        return None, None
+    member = pack.member(path)
+    if member is None:
+        return None, None
+    return pack, member
+
+
+def in_pack(path):
+    return _member(path)[0] is not None
+
+
+def isfile(path):
+    pack, member = _member(path)
+    if pack is None:
+        return os.path.isfile(path)
+    return pack.isfile(member)
+
+
+def stamp(path):
+    """Return (mtime, size) of a file or pack member. Raise OSError if it does not exist."""
+    pack, member = _member(path)
+    if pack is None:
+        st = os.stat(path)
+        return (st.st_mtime, st.st_size)
+    return pack.stamp(member)
+
+
+def read(path):
+    """Return the content of a file or pack member as bytes."""
+    pack, member = _member(path)
+    if pack is None:
+        with open(path, "rb") as f:
+            return f.read()
+    return pack.read(member)
+
+
+def open_binary(path):
+    """Open a file or pack member for reading bytes."""
+    pack, member = _member(path)
+    if pack is None:
+        return open(path, "rb")
+    return io.BytesIO(pack.read(member))
+
+
+def open_text(path):
+    """Open a file or pack member for reading text, like open(path, "r")."""
+    pack, member = _member(path)
+    if pack is None:
+        return open(path, "r")
+    data = pack.read(member)
+    if sys.version_info[0] < 3:
+        return io.BytesIO(data)
+    return io.StringIO(data.decode("utf-8"), newline=None)
+
+
+def list_files(directory):
+    """Return sorted paths of all files below *directory*, a directory or a pack path."""
+    pack, member = _member(directory)
+    if pack is not None:
+        return [os.path.join(pack.path, *m.split("/")) for m in pack.files(member)]
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, f) for f in files)
+    return sorted(paths)
+
+
+def local_path(path):
+    """Return a real file for *path*. Pack members are extracted if necessary."""
+    pack, member = _member(path)
+    if pack is None:
+        return path
+    return pack.extract(member)
+
+
+def update_local(path):
+    """Extract the member behind a file returned by local_path() again if it changed.
+
+    Other paths are not touched. Raise IOError if the member is no longer in the pack.
+    """
+    pack = active_pack()
+    if pack is not None:
+        member = pack.extracted_member(path)
+        if member is not None:
+            pack.extract(member)
+    return path
+
+
+def build(pack_path, workbench_path=os.path.dirname(os.path.abspath(__file__))):
+    """Write the directories PACK_DIRECTORIES of *workbench_path* into a new pack.
+
+    Return the number of files.
+    """
+    count = 0
+    with Base.atomic_write(pack_path) as tmp_path, \
+            zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for directory in PACK_DIRECTORIES:
+            for path in list_files(os.path.join(workbench_path, directory)):
+                if os.path.basename(path) == Base.CATALOG_INDEX_NAME:
+                    continue  # The index is only used for table directories.
+                name = os.path.relpath(path, workbench_path).replace(os.sep, "/")
+                compression = zipfile.ZIP_STORED if name.lower().endswith(STORED_EXTENSIONS) \
+                    else zipfile.ZIP_DEFLATED
+                archive.write(path, name, compression)
+                count += 1
+    return count
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Build or inspect a library pack.")
+    commands = parser.add_subparsers(dest="command")
+    build_parser = commands.add_parser("build", help="pack tables/ and parts/")
+    build_parser.add_argument("pack")
+    build_parser.add_argument("--workbench", default=os.path.dirname(os.path.abspath(__file__)),
+                              help="directory with tables/ and parts/")
+    list_parser = commands.add_parser("list", help="list the files of a pack")
+    list_parser.add_argument("pack")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.time()
+        count = build(args.pack, args.workbench)
+        print("Packed %d files into %s (%.1f MB) in %.1f s" % (
+            count, args.pack, os.path.getsize(args.pack) / 1e6, time.time() - start))
+    elif args.command == "list":
+        pack = LibraryPack(args.pack)
+        for member in pack.files(""):
+            print("%10d  %s" % (pack.info(member).file_size, member))
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+# Manifest of the files referenced by the part catalogs.
+#
+# For every file in the Cad and Image columns of the tables the manifest
+# records the size, the modification time, the SHA-1 hash of the content and,
+# for .fcstd files, whether the zip archive is intact. check() validates all
+# references with a thread pool. A file whose size and modification time did
+# not change since the last run is neither hashed nor tested again.
+#
+# The hashes are shared with OSE_PartCache.FILE_HASHES, which is the key of
+# the shape and thumbnail caches. After load() these caches find their
+# entries without reading the part files.
+#
+# Run it from the workbench directory to find broken references:
+#
+#     python OSE_Manifest.py --threads 8
+
+import collections
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+from multiprocessing.pool import ThreadPool
+
+import OSE_BasePartLibrary as Base
+import OSE_LibraryPack
+import OSE_ParametricParts
+import OSE_PartCache
+import OSE_PartCatalog as Catalog
+
+# Columns with paths relative to Base.PARTS_PATH.
+REFERENCE_COLUMNS = ["Cad", "Image"]
+ZIP_EXTENSIONS = (".fcstd", ".zip")
+
+
+class FileRecord:
+    """Version and state of one file."""
+
+    def __init__(self, size, mtime, sha1, zip_error=None):
+        self.size = size
+        self.mtime = mtime
+        self.sha1 = sha1
+        # Error message if the file is a broken zip archive, otherwise None.
+        self.zip_error = zip_error
+
+    def stamp(self):
+        return (self.mtime, self.size)
+
+    def to_json(self):
+        return {"size": self.size, "mtime": self.mtime, "sha1": self.sha1,
+                "zip_error": self.zip_error}
+
+    @staticmethod
+    def from_json(data):
+        return FileRecord(data["size"], data["mtime"], data["sha1"], data.get("zip_error"))
+
+
+class Problem:
+    """Broken reference in a catalog. *key*, *column* and *reference* are None
+    if the whole table is affected."""
+
+    def __init__(self, table_path, key, column, reference, message):
+        self.table_path = table_path
+        self.key = key
+        self.column = column
+        self.reference = reference
+        self.message = message
+
+    def __str__(self):
+        if self.key is None:
+            return "%s: %s" % (self.table_path, self.message)
+        return "%s: %s %s %s: %s" % (os.path.basename(self.table_path), self.key, self.column,
+                                     self.reference, self.message)
+
+
+class CheckReport:
+    """Result of Manifest.check()."""
+
+    def __init__(self):
+        self.problems = []
+        self.files = 0
+        # Number of files which were new or changed and had to be read.
+        self.hashed = 0
+        self.time = 0.0
+
+    def ok(self):
+        return not self.problems
+
+    def summary(self):
+        return "Checked %d files (%d read) in %.2f s, %d problems" % (
+            self.files, self.hashed, self.time, len(self.problems))
+
+
+def test_zip(path):
+    """Return None if the zip archive *path* is intact, otherwise an error message."""
+    try:
+        with OSE_LibraryPack.open_binary(path) as f, zipfile.ZipFile(f) as archive:
+            bad = archive.testzip()
+    except (zipfile.BadZipfile, IOError, OSError) as e:
+        return str(e) or type(e).__name__
+    if bad is not None:
+        return "CRC error in %s" % bad
+    return None
+
+
+class Manifest:
+    """Records of the files in *parts_path*, stored as JSON in *path*.
+
+    The hashes of loaded and checked files are passed to *hashes*.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path=Base.MANIFEST_PATH, parts_path=Base.PARTS_PATH,
+                 hashes=OSE_PartCache.FILE_HASHES):
+        self.path = path
+        self.parts_path = parts_path
+        self.hashes = hashes
+        # Map path relative to parts_path, with "/" as separator -> FileRecord.
+        self.records = {}
+        self._lock = threading.Lock()
+
+    def relative_path(self, filename):
+        return os.path.relpath(os.path.abspath(filename),
+                               os.path.abspath(self.parts_path)).replace(os.sep, "/")
+
+    def absolute_path(self, relative_path):
+        return os.path.abspath(os.path.join(self.parts_path, relative_path))
+
+    def load(self):
+        """Read the manifest file. Return False if it does not exist or can not be used."""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("version") != Manifest.FORMAT_VERSION:
+                return False
+            records = dict((rel, FileRecord.from_json(item))
+                           for rel, item in data["files"].items())
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return False
+        for rel, record in records.items():
+            self.hashes.set(self.absolute_path(rel), record.stamp(), record.sha1)
+        with self._lock:
+            self.records = records
+        return True
+
+    def save(self):
+        """Write the manifest file atomically."""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with self._lock:
+            files = dict((rel, record.to_json()) for rel, record in self.records.items())
+        data = {"version": Manifest.FORMAT_VERSION,
+                "parts_path": os.path.abspath(self.parts_path), "files": files}
+        with Base.atomic_write(self.path) as tmp_path, open(tmp_path, "w") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+
+    def record(self, filename):
+        """Return (FileRecord, read) for the current version of *filename*.
+
+        The file is hashed and tested only if its size or modification time
+        changed; *read* tells whether this was necessary. Raise OSError if
+        the file does not exist.
+        """
+        path = os.path.abspath(filename)
+        rel = self.relative_path(path)
+        stamp = OSE_PartCache.file_stamp(path)
+        with self._lock:
+            record = self.records.get(rel)
+        if record is not None and record.stamp() == stamp:
+            return record, False
+        digest = OSE_PartCache.file_hash(path)
+        zip_error = test_zip(path) if path.lower().endswith(ZIP_EXTENSIONS) else None
+        record = FileRecord(stamp[1], stamp[0], digest, zip_error)
+        with self._lock:
+            self.records[rel] = record
+        self.hashes.set(path, stamp, digest)
+        return record, True
+
+    def references(self, table_paths=None):
+        """Return ({absolute path: [(table path, key, column, reference)]}, [Problem]).
+
+        The problems are tables which can not be read, rows without a Cad file
+        and invalid references to generated parts. A generated part refers to
+        the library file of its cross-section.
+        """
+        if table_paths is None:
+            table_paths = Catalog.catalog_table_paths()
+        references = collections.OrderedDict()
+        problems = []
+        for table_path in table_paths:
+            try:
+                table = Catalog.load_catalog(table_path)
+            except (IOError, OSError, Catalog.Error) as e:
+                problems.append(Problem(table_path, None, None, None,
+                                        "can not read table: %s" % e))
+                continue
+            columns = [(name, table.column_positions[name]) for name in REFERENCE_COLUMNS
+                       if name in table.column_positions]
+            for row_i in range(table.row_count()):
+                key = table.get_part_key(row_i)
+                for name, column in columns:
+                    value = table.get_value(row_i, column)
+                    if not value:
+                        if name == "Cad":
+                            problems.append(Problem(table_path, key, name, value, "no Cad file"))
+                        continue  # Previews fall back to the thumbnail of the Cad file.
+                    if name == "Cad" and OSE_ParametricParts.is_reference(value):
+                        try:
+                            path = OSE_ParametricParts.source_path(value)
+                        except OSE_ParametricParts.ParameterError as e:
+                            problems.append(Problem(table_path, key, name, value, str(e)))
+                            continue
+                    else:
+                        path = os.path.join(self.parts_path, value)
+                    references.setdefault(os.path.abspath(path), []).append(
+                        (table_path, key, name, value))
+        return references, problems
+
+    def check(self, table_paths=None, threads=8):
+        """Validate all references of the catalogs and update the records.
+
+        Records of files which are no longer referenced are dropped. The
+        manifest is not saved. Return CheckReport.
+        """
+        start = time.time()
+        report = CheckReport()
+        references, report.problems = self.references(table_paths)
+
+        def check_file(path):
+            try:
+                record, read = self.record(path)
+                return record, read, None
+            except (IOError, OSError) as e:
+                return None, False, e
+
+        pool = ThreadPool(threads)
+        try:
+            results = pool.map(check_file, list(references))
+        finally:
+            pool.close()
+            pool.join()
+
+        referenced = set()
+        for path, (record, read, error) in zip(references, results):
+            report.files += 1
+            report.hashed += int(read)
+            if error is not None:
+                message = "missing file" if not OSE_LibraryPack.isfile(path) else \
+                    "can not read file: %s" % error
+            elif record.zip_error is not None:
+                message = "broken archive: %s" % record.zip_error
+            else:
+                message = None
+            if record is not None:
+                referenced.add(self.relative_path(path))
+            if message is not None:
+                for table_path, key, column, value in references[path]:
+                    report.problems.append(Problem(table_path, key, column, value, message))
+        with self._lock:
+            for rel in [r for r in self.records if r not in referenced]:
+                del self.records[rel]
+        report.time = time.time() - start
+        return report
+
+
+_shared_manifest = None
+
+
+def shared_manifest():
+    """Return the manifest of the library. It is loaded on the first call,
+    which gives the caches the stored hashes."""
+    global _shared_manifest
+    if _shared_manifest is None:
+        _shared_manifest = Manifest()
+        _shared_manifest.load()
+    return _shared_manifest
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Check the files referenced by the catalogs.")
+    parser.add_argument("tables", nargs="*", help="CSV tables (default: tables of the commands)")
+    parser.add_argument("--threads", "-j", type=int, default=8)
+    parser.add_argument("--manifest", default=Base.MANIFEST_PATH, help="manifest file")
+    parser.add_argument("--no-save", action="store_true", help="do not update the manifest")
+    args = parser.parse_args(argv)
+
+    manifest = Manifest(args.manifest)
+    manifest.load()
+    report = manifest.check(args.tables or None, args.threads)
+    for problem in report.problems:
+        print(problem)
+    print(report.summary())
+    if not args.no_save:
+        manifest.save()
+    return 0 if report.ok() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
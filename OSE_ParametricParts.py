@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# Parts generated from parameters instead of being loaded from a part file.
+#
+# The Cad column of a catalog can hold a reference to a generator instead of
+# a file:
+#
+#     tslot:length=160
+#
+# is a T-slot profile of 160 mm. The generator cuts the cross-section once
+# out of one library profile and keeps it as BREP in CACHE_PATH/profiles,
+# named after the content hash of that file. Every profile is then a single
+# extrusion of the cached face, so any length works without a new file and
+# inserting it does not load a document.
+#
+# The module imports FreeCAD and Part only when a shape is generated, so
+# OSE_Manifest can check references without FreeCAD.
+
+import os
+import threading
+
+import OSE_BasePartLibrary as Base
+import OSE_LibraryPack
+import OSE_PartCache
+import OSE_PartCatalog as Catalog
+
+
+class ParameterError(Catalog.Error):
+    """A parametric reference can not be parsed or has invalid values."""
+
+    def __init__(self, message):
+        super(ParameterError, self).__init__(message)
+
+
+def format_number(value):
+    """Return *value* as short text, 160.0 as "160"."""
+    return "%g" % value
+
+
+class ExtrudedProfile:
+    """Profiles with a constant cross-section and a variable length.
+
+    *source* is a library part, relative to Base.PARTS_PATH, which is
+    extruded from the origin along *direction*. Its cross-section is cut
+    *depth* millimeters from the start, between any end features.
+    """
+    PARAMETERS = ("length",)
+
+    def __init__(self, name, source, direction, depth=1.0):
+        self.name = name
+        self.source = source
+        self.direction = direction
+        self.depth = depth
+        # Map content hash of the source file -> CachedShape of the cross-section.
+        self._sections = {}
+        self._lock = threading.Lock()
+
+    def source_path(self):
+        return os.path.join(Base.PARTS_PATH, self.source)
+
+    def check(self, parameters):
+        """Raise ParameterError if *parameters* do not describe a profile."""
+        if parameters["length"] <= 0:
+            raise ParameterError("%s: length must be positive" % self.name)
+
+    def cross_section(self):
+        """Return CachedShape of the cross-section face in the plane of the origin."""
+        path = self.source_path()
+        digest = OSE_PartCache.FILE_HASHES.get(path)
+        with self._lock:
+            section = self._sections.get(digest)
+        if section is None:
+            section = SECTION_CACHE.get(path)
+            if section is None:
+                section = self._cut_section(path)
+                try:
+                    SECTION_CACHE.put(path, section)
+                except (IOError, OSError):
+                    pass  # For example a read-only home directory.
+            with self._lock:
+                self._sections[digest] = section
+        return section
+
+    def _cut_section(self, path):
+        import FreeCAD
+        import Part
+        import OSE_importPart
+        source = OSE_importPart.loadSourceShape(OSE_LibraryPack.local_path(path))
+        if source is None:
+            raise ParameterError("%s does not have exactly one visible part" % path)
+        direction = FreeCAD.Vector(*self.direction)
+        wires = source.shape.slice(direction, self.depth)
+        # The bullseye face maker turns the inner wires into holes.
+        face = Part.makeFace(wires, "Part::FaceMakerBullseye")
+        face.translate(direction * -self.depth)
+        # The extrusion has other faces than the source, use one color for all.
+        return OSE_PartCache.CachedShape(self.name, face, source.diffuse_color[:1],
+                                         source.transparency, source.view_properties)
+
+    def cached_shape(self, parameters):
+        """Return CachedShape of the profile described by *parameters*."""
+        import FreeCAD
+        section = self.cross_section()
+        length = parameters["length"]
+        shape = section.shape.extrude(FreeCAD.Vector(*self.direction) * length)
+        return OSE_PartCache.CachedShape("%s_%smm" % (self.name, format_number(length)),
+                                         shape, section.diffuse_color, section.transparency,
+                                         section.view_properties)
+
+    def measure(self, source, parameters):
+        """Return OSE_Geometry.measure() of the profile from the one of the source part.
+
+        The source is assumed to have the cross-section over its whole length,
+        so the profile is measured without generating its shape.
+        """
+        axis = max(range(3), key=lambda i: abs(self.direction[i]))
+        size = list(source["Size"])
+        source_length = size[axis]
+        length = parameters["length"]
+        section_area = source["Volume"] / source_length
+        mantle_area = source["Area"] - 2 * section_area
+        size[axis] = length
+        return {"Size": size, "Volume": section_area * length,
+                "Area": mantle_area * length / source_length + 2 * section_area,
+                "Holes": source["Holes"]}
+
+
+# Map generator name -> generator.
+GENERATORS = {
+    "tslot": ExtrudedProfile("tslot", "basis-set/tslotprofile/tslot8.fcstd", (0, -1, 0)),
+}
+
+# Cross-sections keyed by the content hash of their source file.
+SECTION_CACHE = OSE_PartCache.BrepDiskCache(os.path.join(Base.CACHE_PATH, "profiles"))
+
+
+def is_reference(cad):
+    """Return True if the Cad entry *cad* refers to a generator and not to a file."""
+    name, sep, _ = cad.partition(":")
+    return bool(sep) and name in GENERATORS
+
+
+def make_reference(name, **parameters):
+    """Return the reference to generator *name*, make_reference("tslot", length=160)."""
+    return "%s:%s" % (name, ",".join("%s=%s" % (key, format_number(parameters[key]))
+                                     for key in sorted(parameters)))
+
+
+# Map Cad path of a library file -> reference which replaced it in the
+# catalogs. The files stay, assemblies made before refer to them.
+LEGACY_CAD = dict(("basis-set/tslotprofile/tslot%d.fcstd" % n,
+                   make_reference("tslot", length=10 * n))
+                  for n in (4, 6, 8, 12, 16, 24, 32, 40, 48, 56, 64))
+
+
+def legacy_reference(cad):
+    """Return the reference which replaced the Cad path *cad*, or None."""
+    return LEGACY_CAD.get(cad.replace("\\", "/"))
+
+
+def parse_reference(reference):
+    """Return (generator, {parameter: value}) of a reference like "tslot:length=160".
+
+    Raise ParameterError if the reference is not valid.
+    """
+    name, _, text = reference.partition(":")
+    generator = GENERATORS.get(name)
+    if generator is None:
+        raise ParameterError("Unknown generator in %s" % reference)
+    parameters = {}
+    for item in text.split(","):
+        key, _, value = item.partition("=")
+        key = key.strip()
+        if key not in generator.PARAMETERS:
+            raise ParameterError("Unknown parameter %s in %s" % (key, reference))
+        try:
+            parameters[key] = float(value)
+        except ValueError:
+            raise ParameterError("Parameter %s in %s is not a number" % (key, reference))
+    missing = [key for key in generator.PARAMETERS if key not in parameters]
+    if missing:
+        raise ParameterError("%s misses %s" % (reference, ", ".join(missing)))
+    generator.check(parameters)
+    return generator, parameters
+
+
+def source_path(reference):
+    """Return path of the library file a valid reference takes its cross-section from."""
+    return parse_reference(reference)[0].source_path()
+
+
+def insert_part(reference, doc_assembly):
+    """Add the part described by *reference* to *doc_assembly* and return it.
+
+    The object has the properties of importPart, with *reference* as sourceFile.
+    """
+    import OSE_importPart
+    generator, parameters = parse_reference(reference)
+    cached = generator.cached_shape(parameters)
+    # A generated part has no file time; refresh_parts() skips it.
+    return OSE_importPart.importCachedPart(cached, reference, 0.0, doc_assembly)
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+# Caches for shapes imported from the part library.
+#
+# The caches store the visible shape of a library file together with the view
+# properties which importPart copies to the new object. They are used by
+# OSE_importPart.importPart. The module imports the Part module of FreeCAD
+# only when a shape is read from the disk cache.
+#
+# There are two levels: SHAPE_CACHE holds shapes in memory for the current
+# session, DISK_CACHE keeps them as BREP files between sessions.
+
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+
+import OSE_BasePartLibrary as Base
+import OSE_LibraryPack
+
+
+# View properties which importPart copies from the visible part to the new
+# object, besides DiffuseColor and Transparency. Enumerations are names in
+# FreeCAD and indexes when read from GuiDocument.xml; FreeCAD accepts both.
+VIEW_PROPERTIES = ("ShapeColor", "LineColor", "PointColor", "LineWidth", "PointSize",
+                   "DisplayMode", "DrawStyle", "Lighting", "Deviation", "AngularDeflection",
+                   "BoundingBox", "Selectable")
+
+
+def view_properties(view_object):
+    """Return {name: value} of the VIEW_PROPERTIES of *view_object*."""
+    return dict((name, getattr(view_object, name)) for name in VIEW_PROPERTIES
+                if name in view_object.PropertiesList)
+
+
+class CachedShape:
+    """Visible shape of a part file and its view properties."""
+
+    def __init__(self, label, shape, diffuse_color, transparency, view_properties=None):
+        self.label = label
+        self.shape = shape
+        self.diffuse_color = [tuple(c) for c in diffuse_color]
+        self.transparency = transparency
+        # Colors are lists when read from the disk cache.
+        self.view_properties = dict((name, tuple(value) if isinstance(value, list) else value)
+                                    for name, value in (view_properties or {}).items())
+        self.size = shape_size(shape)
+
+
+def shape_size(shape):
+    """Return approximate memory used by *shape* in bytes."""
+    size = getattr(shape, "MemSize", None)
+    if size is None:
+        # Older FreeCAD versions do not have TopoShape.MemSize.
+        size = len(shape.exportBrepToString())
+    return size
+
+
+class ShapeCache:
+    """In-memory cache of part shapes keyed by the file path and its modification time.
+
+    Only one version of each file is kept. The cache evicts least recently
+    used shapes when their total estimated size exceeds *max_bytes*.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Map path -> (mtime, CachedShape), oldest first.
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filename, mtime=None):
+        """Return CachedShape for the file or None.
+
+        *mtime* is the current modification time of the file. If it is None,
+        it is read from the file system.
+        """
+        path = os.path.abspath(filename)
+        if mtime is None:
+            mtime = os.path.getmtime(path)
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None and entry[0] == mtime:
+                self._entries[path] = entry  # Mark as recently used.
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self.total_bytes -= entry[1].size  # Outdated version of the file.
+            self.misses += 1
+            return None
+
+    def put(self, filename, mtime, cached_shape):
+        """Store *cached_shape* for the version *mtime* of the file."""
+        path = os.path.abspath(filename)
+        if cached_shape.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self.total_bytes -= old[1].size
+            self._entries[path] = (mtime, cached_shape)
+            self.total_bytes += cached_shape.size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted.size
+                self.evictions += 1
+
+    def invalidate(self, filename=None):
+        """Forget the shape of *filename*, or all shapes if *filename* is None."""
+        with self._lock:
+            if filename is None:
+                self._entries.clear()
+                self.total_bytes = 0
+                return
+            entry = self._entries.pop(os.path.abspath(filename), None)
+            if entry is not None:
+                self.total_bytes -= entry[1].size
+
+    def stats(self):
+        """Return cache counters as a dictionary."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self.total_bytes,
+                    "max_bytes": self.max_bytes}
+
+
+def file_hash(filename):
+    """Return SHA-1 hex digest of the content of *filename*, a file or a pack member."""
+    h = hashlib.sha1()
+    with OSE_LibraryPack.open_binary(filename) as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_stamp(filename):
+    """Return (mtime, size) of *filename*. Raise OSError if it does not exist."""
+    return OSE_LibraryPack.stamp(filename)
+
+
+class FileHashes:
+    """Content hashes of files. A file is hashed again only if its mtime or size changed.
+
+    OSE_Manifest fills it with the hashes stored in the library manifest.
+    """
+
+    def __init__(self):
+        # Map path -> ((mtime, size), hash).
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        """Return the content hash of *filename*."""
+        path = os.path.abspath(filename)
+        stamp = file_stamp(path)
+        with self._lock:
+            known = self._hashes.get(path)
+        if known is not None and known[0] == stamp:
+            return known[1]
+        digest = file_hash(path)
+        with self._lock:
+            self._hashes[path] = (stamp, digest)
+        return digest
+
+    def known(self, filename):
+        """Return ((mtime, size), hash) remembered for *filename* or None. Do not read the file."""
+        with self._lock:
+            return self._hashes.get(os.path.abspath(filename))
+
+    def set(self, filename, stamp, digest):
+        """Remember the hash of *filename* for the version *stamp* (mtime, size)."""
+        with self._lock:
+            self._hashes[os.path.abspath(filename)] = (tuple(stamp), digest)
+
+
+# Hashes shared by the disk caches of the workbench.
+FILE_HASHES = FileHashes()
+
+
+class BrepDiskCache:
+    """Persistent cache of part shapes keyed by the content hash of the part file.
+
+    Each entry consists of <hash>.brep with the shape and <hash>.json with
+    the label and the view properties. The JSON file is written last, an entry without
+    it is incomplete and ignored. When the total size of the entries exceeds
+    *max_bytes*, the least recently used entries are deleted.
+
+    The total size is counted once and then updated by put(). Entries
+    written by other processes are only counted again by cleanup().
+    """
+
+    FORMAT_VERSION = 2
+    # put() deletes entries until this fraction of max_bytes is used.
+    CLEANUP_FRACTION = 0.9
+
+    def __init__(self, cache_dir, max_bytes=1024 * 1024 * 1024, hashes=FILE_HASHES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hashes = hashes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Total size of the entries in bytes, None until it is counted.
+        self._total_bytes = None
+
+    def source_hash(self, filename):
+        """Return the content hash of *filename*."""
+        return self.hashes.get(filename)
+
+    def _entry_paths(self, digest):
+        base = os.path.join(self.cache_dir, digest)
+        return base + ".brep", base + ".json"
+
+    def contains(self, filename):
+        """Return True if there is a complete entry for the current content of *filename*."""
+        brep_path, json_path = self._entry_paths(self.source_hash(filename))
+        return os.path.isfile(json_path) and os.path.isfile(brep_path)
+
+    def get(self, filename):
+        """Return CachedShape for the current content of *filename* or None."""
+        brep_path, json_path = self._entry_paths(self.source_hash(filename))
+        try:
+            with open(json_path) as f:
+                meta = json.load(f)
+        except (IOError, OSError, ValueError):
+            meta = None
+        shape = None
+        if meta is not None and meta.get("version") == self.FORMAT_VERSION:
+            shape = self._read_brep(brep_path)
+        if shape is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        # Mark entry as recently used for cleanup().
+        now = time.time()
+        try:
+            os.utime(json_path, (now, now))
+        except OSError:
+            pass  # Deleted by another process, the shape is read already.
+        with self._lock:
+            self.hits += 1
+        return CachedShape(meta["label"], shape, meta["diffuse_color"], meta["transparency"],
+                           meta["view_properties"])
+
+    @staticmethod
+    def _read_brep(brep_path):
+        """Return the shape in *brep_path* or None if the file is missing or broken."""
+        if not os.path.isfile(brep_path):
+            return None
+        import Part
+        shape = Part.Shape()
+        try:
+            shape.importBrep(brep_path)
+        except Exception:
+            # Deleted by cleanup() of another process after the test above.
+            return None
+        return shape
+
+    def put(self, filename, cached_shape):
+        """Store *cached_shape* for the current content of *filename*."""
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        brep_path, json_path = self._entry_paths(self.source_hash(filename))
+        old_size = self._entry_size(brep_path, json_path)
+        # Write to temporary files first, so other FreeCAD processes never read half an entry.
+        with Base.atomic_write(brep_path) as tmp_path:
+            cached_shape.shape.exportBrep(tmp_path)
+        meta = {"version": self.FORMAT_VERSION, "source": os.path.abspath(filename),
+                "label": cached_shape.label, "diffuse_color": cached_shape.diffuse_color,
+                "transparency": cached_shape.transparency,
+                "view_properties": cached_shape.view_properties}
+        with Base.atomic_write(json_path) as tmp_path, open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        size = self._entry_size(brep_path, json_path)
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += size - old_size
+            total = self._total_bytes
+        if total is None:
+            self.cleanup()
+        elif total > self.max_bytes:
+            # Make room for more entries, so the next puts do not list the directory again.
+            self.cleanup(int(self.max_bytes * BrepDiskCache.CLEANUP_FRACTION))
+
+    @staticmethod
+    def _entry_size(*paths):
+        size = 0
+        for path in paths:
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass  # Not written or deleted by another process.
+        return size
+
+    def _entries(self):
+        """Return list of (last use, size, [paths]) for all entries."""
+        files = {}
+        for name in os.listdir(self.cache_dir):
+            digest, ext = os.path.splitext(name)
+            if ext in (".brep", ".json"):
+                files.setdefault(digest, []).append(os.path.join(self.cache_dir, name))
+        entries = []
+        for digest, paths in files.items():
+            try:
+                stats = [os.stat(p) for p in paths]
+            except OSError:
+                continue  # Deleted by another process.
+            entries.append((max(st.st_mtime for st in stats), sum(st.st_size for st in stats),
+                            paths))
+        return entries
+
+    def cleanup(self, max_bytes=None):
+        """Delete least recently used entries until the cache is smaller than *max_bytes*.
+
+        Return the number of deleted entries.
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        entries = sorted(self._entries())
+        total = sum(e[1] for e in entries)
+        deleted = 0
+        for _, size, paths in entries:
+            if total <= max_bytes:
+                break
+            for p in paths:
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+            total -= size
+            deleted += 1
+        with self._lock:
+            self._total_bytes = total
+        return deleted
+
+    def clear(self):
+        """Delete all entries."""
+        return self.cleanup(0)
+
+    def stats(self):
+        """Return cache counters as a dictionary."""
+        entries = self._entries() if os.path.isdir(self.cache_dir) else []
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(entries),
+                    "bytes": sum(e[1] for e in entries), "max_bytes": self.max_bytes}
+
+
+# Caches shared by all imports in this FreeCAD session.
+SHAPE_CACHE = ShapeCache()
+DISK_CACHE = BrepDiskCache(os.path.join(Base.CACHE_PATH, "shapes"))
+
+
+def get_cached_shape(filename, mtime):
+    """Return CachedShape from the memory or the disk cache, or None."""
+    cached = SHAPE_CACHE.get(filename, mtime)
+    if cached is None:
+        cached = DISK_CACHE.get(filename)
+        if cached is not None:
+            SHAPE_CACHE.put(filename, mtime, cached)
+    return cached
+
+
+def store_cached_shape(filename, mtime, cached_shape):
+    """Store *cached_shape* in the memory and the disk cache."""
+    SHAPE_CACHE.put(filename, mtime, cached_shape)
+    try:
+        DISK_CACHE.put(filename, cached_shape)
+    except (IOError, OSError):
+        pass  # For example a read-only home directory. The memory cache still works.
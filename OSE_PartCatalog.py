@@ -0,0 +1,696 @@
+# -*- coding: utf-8 -*-
+# Author: Ruslan Krenzler.
+# Date: 12 Mai 2018
+# Part catalogs read from CSV tables.
+#
+# This module does not depend on FreeCAD or Qt. It is shared by the dialogs
+# and by the scripting API.
+
+import array
+import collections
+import csv
+import io
+import os
+import threading
+
+import OSE_BasePartLibrary as Base
+import OSE_LibraryPack
+
+
+class Error(Exception):
+    """Base class for exceptions in this module."""
+
+    def __init__(self, message):
+        super(Error, self).__init__(message)
+
+
+class CsvError(Error):
+    """Error in the content of a CSV table."""
+
+    def __init__(self, message):
+        super(CsvError, self).__init__(message)
+
+
+class PartNotFoundError(Error):
+    """There is no part with the given key in the catalogs."""
+
+    def __init__(self, message):
+        super(PartNotFoundError, self).__init__(message)
+
+
+class RowView(object):
+    """Read-only view of one table row, used like a dictionary {column name: value}.
+
+    It stores only the table and the row index; the values are read from the
+    table on access.
+    """
+    __slots__ = ("_table", "_row_index")
+
+    def __init__(self, table, row_index):
+        self._table = table
+        self._row_index = row_index
+
+    def __getitem__(self, column_name):
+        return self._table.get_value(self._row_index, self._table.column_positions[column_name])
+
+    def get(self, column_name, default=None):
+        column = self._table.column_positions.get(column_name)
+        if column is None:
+            return default
+        return self._table.get_value(self._row_index, column)
+
+    def __contains__(self, column_name):
+        return column_name in self._table.column_positions
+
+    def __iter__(self):
+        return iter(self._table.headers)
+
+    def __len__(self):
+        return len(self._table.headers)
+
+    def keys(self):
+        return list(self._table.headers)
+
+    def values(self):
+        return [self._table.get_value(self._row_index, c)
+                for c in range(len(self._table.headers))]
+
+    def items(self):
+        return list(zip(self._table.headers, self.values()))
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, RowView):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "RowView(%r)" % self.to_dict()
+
+
+def column_positions(headers):
+    """Return {column name: column index}. The first of duplicated names wins."""
+    positions = {}
+    for i, name in enumerate(headers):
+        positions.setdefault(name, i)
+    return positions
+
+
+class _ValueColumn(object):
+    """Column of strings. Equal values share one string object."""
+    __slots__ = ("values",)
+
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, row_index):
+        return self.values[row_index]
+
+
+class _PrefixColumn(object):
+    """Column of paths. The directory part is stored once for all rows."""
+    __slots__ = ("prefixes", "prefix_ids", "suffixes")
+
+    def __init__(self, prefixes, prefix_ids, suffixes):
+        self.prefixes = prefixes
+        self.prefix_ids = prefix_ids
+        self.suffixes = suffixes
+
+    def get(self, row_index):
+        return self.prefixes[self.prefix_ids[row_index]] + self.suffixes[row_index]
+
+
+def _compact_column(values):
+    """Return the column storage for a list of strings.
+
+    Equal strings are replaced by one object. Paths are split in a shared
+    directory prefix and a file name if this saves more memory than the
+    prefix numbers cost.
+    """
+    distinct = {}
+    values = [distinct.setdefault(v, v) for v in values]
+    saved = sum(v.rfind("/") + 1 for v in distinct)
+    if saved <= 2 * len(values):
+        return _ValueColumn(values)
+    prefix_ids = {}
+    for v in distinct:
+        prefix_ids.setdefault(v[:v.rfind("/") + 1], len(prefix_ids))
+    if len(prefix_ids) > 0xFFFF:
+        return _ValueColumn(values)
+    suffixes = {}
+    ids = array.array("H")
+    suffix_list = []
+    for v in values:
+        cut = v.rfind("/") + 1
+        ids.append(prefix_ids[v[:cut]])
+        suffix = v[cut:]
+        suffix_list.append(suffixes.setdefault(suffix, suffix))
+    prefixes = [None] * len(prefix_ids)
+    for prefix, i in prefix_ids.items():
+        prefixes[i] = prefix
+    return _PrefixColumn(prefixes, ids, suffix_list)
+
+
+class CsvTable:
+    """ Read part catalog from a csv file.
+    one part of the column must be unique and contains a unique key.
+
+    Store the data column-wise. Equal values in a column share one string
+    object, columns with paths store their directories once. get_row()
+    returns a RowView instead of a dictionary.
+    The rows are indexed by the key column. Additional columns can be indexed
+    by passing their names in *index_columns*. All indexes are built once
+    in load().
+    """
+
+    # Number of rows moved into the columns at once while loading.
+    LOAD_CHUNK = 4096
+
+    def __init__(self, mandatory_dims=None, key_column_name="PartNumber", index_columns=None):
+        """
+        @param mandatoryDims: list of column names which must be presented in the CSV files apart
+        the "keyColumnName" column
+        @param index_columns: list of additional column names to index, for example
+        ["Cad", "Image"]. Missing columns are ignored.
+        """
+        self.headers = []
+        self.column_positions = {}
+        self.has_valid_data = False
+        if mandatory_dims is None:
+            mandatory_dims = []
+        self.mandatory_dims = mandatory_dims
+        if index_columns is None:
+            index_columns = []
+        self.index_columns = index_columns
+        self._key_column_name = key_column_name
+        self._key_column_index = None
+        self._row_count = 0
+        # List of _ValueColumn or _PrefixColumn, one for each header.
+        self._columns = []
+        # Map key -> row index.
+        self._key_index = {}
+        # Map column name -> {value -> list of row indexes}.
+        self._secondary_indexes = {}
+
+    def key_column_name(self):
+        return self._key_column_name
+
+    def load(self, filename):
+        """Load data from a CSV file or a member of the library pack."""
+        self.has_valid_data = False
+        with OSE_LibraryPack.open_text(filename) as csvfile:
+            csv_reader = csv.reader(csvfile, delimiter=',', quotechar='"')
+            self.headers = next(csv_reader)
+            self.column_positions = column_positions(self.headers)
+            # Fill the talble
+            self._key_index = {}
+            self._key_column_index = self.headers.index(self._key_column_name)
+            key_column_index = self._key_column_index
+            key_index = self._key_index
+            column_count = len(self.headers)
+            padding = [""] * column_count
+            columns = [[] for _ in range(column_count)]
+            rows = []
+            row_count = 0
+            for row in csv_reader:
+                # Check if the keys is unique
+                key = row[key_column_index]
+                if key in key_index:
+                    msg = 'Error: Not unique key "%s" in column %s found in %s' % (
+                        key, self._key_column_name, filename)
+                    raise CsvError(msg)
+                key_index[key] = row_count
+                row_count += 1
+                if len(row) < column_count:
+                    row = row + padding[len(row):]
+                rows.append(row)
+                if len(rows) == CsvTable.LOAD_CHUNK:
+                    self._append_rows(columns, rows)
+                    rows = []
+            self._append_rows(columns, rows)
+        self._row_count = row_count
+        self._build_secondary_indexes(columns)
+        self._columns = [_compact_column(values) for values in columns]
+        self.has_valid_data = self.has_necessary_columns()
+
+    @staticmethod
+    def _append_rows(columns, rows):
+        for column, values in zip(columns, zip(*rows)):
+            column.extend(values)
+
+    def _build_secondary_indexes(self, columns):
+        """Build the indexes from lists of the values of all columns."""
+        self._secondary_indexes = {}
+        for name in self.index_columns:
+            if name not in self.headers:
+                continue
+            index = {}
+            for row_i, value in enumerate(columns[self.headers.index(name)]):
+                index.setdefault(value, []).append(row_i)
+            self._secondary_indexes[name] = index
+
+    def has_necessary_columns(self):
+        """ Check if the data contains all the columns required to create a part."""
+        return all(h in self.headers for h in (self.mandatory_dims + [self._key_column_name]))
+
+    def row_count(self):
+        return self._row_count
+
+    def column_count(self):
+        return len(self.headers)
+
+    def get_value(self, row_index, column_index):
+        if not 0 <= row_index < self._row_count:
+            raise IndexError(row_index)
+        return self._columns[column_index].get(row_index)
+
+    def get_row(self, row_index):
+        """Return row with the index *row_index* as a RowView."""
+        if not 0 <= row_index < self._row_count:
+            raise IndexError(row_index)
+        return RowView(self, row_index)
+
+    def find_row_index(self, key):
+        """Return index of the row with key *key* or -1 if there is no such row."""
+        return self._key_index.get(key, -1)
+
+    def find_part(self, key):
+        """Return the row with key (part name) as a RowView."""
+        row_i = self._key_index.get(key)
+        if row_i is None:
+            return None
+        return RowView(self, row_i)
+
+    def find_row_indexes(self, column_name, value):
+        """Return indexes of all rows where column *column_name* equals *value*.
+
+        The column must be listed in *index_columns*.
+        """
+        return list(self._secondary_indexes[column_name].get(value, []))
+
+    def get_part_key(self, index):
+        """Return part key of a row with the index *index*."""
+        return self.get_value(index, self._key_column_index)
+
+
+# Type code of the row offsets of StreamingCsvTable. "L" has only 32 bits on
+# Windows, Python 2 has no "Q".
+_OFFSET_TYPE = "Q" if "Q" in getattr(array, "typecodes", "") else "L"
+
+
+class StreamingCsvTable:
+    """ Read part catalog from a large csv file on demand.
+
+    open() reads the file once to find the byte offsets of the rows and to
+    index their keys, so a duplicated key raises CsvError like in
+    CsvTable.load(). Only the key column is decoded there; rows are parsed
+    when they are read and kept in a small cache. The secondary indexes are
+    built on the first lookup.
+
+    It has the same reading interface as CsvTable. scanned_row_count() and
+    scan() are kept for callers which show the rows step by step.
+    """
+    # Number of parsed rows kept in memory and number of rows parsed together on a miss.
+    ROW_CACHE_SIZE = 2048
+    READ_AHEAD = 64
+    # Number of rows added to the secondary indexes in one step.
+    INDEX_STEP = 8192
+
+    def __init__(self, mandatory_dims=None, key_column_name="PartNumber", index_columns=None):
+        self.filename = None
+        self.headers = []
+        self.column_positions = {}
+        self.has_valid_data = False
+        if mandatory_dims is None:
+            mandatory_dims = []
+        self.mandatory_dims = mandatory_dims
+        if index_columns is None:
+            index_columns = []
+        self.index_columns = index_columns
+        self._key_column_name = key_column_name
+        self._key_column_index = None
+        # Offsets of the scanned rows followed by the end of the last scanned row.
+        self._offsets = array.array(_OFFSET_TYPE)
+        self._at_end = False
+        # Map row index -> list of values, oldest first.
+        self._rows = collections.OrderedDict()
+        # Map key -> row index of the scanned rows.
+        self._key_index = {}
+        # Map column name -> {value -> list of row indexes}, built on demand.
+        self._secondary_indexes = None
+        self._lock = threading.RLock()
+
+    def key_column_name(self):
+        return self._key_column_name
+
+    def open(self, filename):
+        """Read the header and the keys of a CSV file. The rows are read later.
+
+        Raise CsvError if a key is not unique or the file is too large.
+        """
+        self.filename = filename
+        self.has_valid_data = False
+        if os.path.getsize(filename) >= 1 << (8 * array.array(_OFFSET_TYPE).itemsize):
+            raise CsvError("Error: %s is too large to be streamed" % filename)
+        with open(filename, "rb") as csvfile:
+            self.headers = self._parse(self._read_record(csvfile))[0]
+            self.column_positions = column_positions(self.headers)
+            self._offsets = array.array(_OFFSET_TYPE, [csvfile.tell()])
+        self._at_end = False
+        self._rows.clear()
+        self._key_index = {}
+        self._secondary_indexes = None
+        self._key_column_index = self.headers.index(self._key_column_name)
+        self.scan()
+        self.has_valid_data = self.has_necessary_columns()
+
+    @staticmethod
+    def _read_record(csvfile):
+        """Read one CSV record. A quoted value can span several lines."""
+        record = csvfile.readline()
+        while record.count(b'"') % 2 == 1:
+            line = csvfile.readline()
+            if not line:
+                break
+            record += line
+        return record
+
+    @staticmethod
+    def _parse(data):
+        """Return the rows in *data* as lists of values."""
+        if isinstance(data, str):
+            lines = io.BytesIO(data)  # Python 2 csv reads bytes.
+        else:
+            # Universal newlines like the text file of CsvTable. str.splitlines()
+            # would also split at characters like \x0c.
+            lines = io.StringIO(data.decode("utf-8"), newline=None)
+        return [row for row in csv.reader(lines, delimiter=',', quotechar='"') if row]
+
+    def _record_key(self, record):
+        """Return the value of the key column in the CSV record *record*."""
+        column = self._key_column_index
+        quote = record.find(b'"')
+        if quote < 0:
+            values = record.rstrip(b"\r\n").split(b",", column + 1)
+        else:
+            # Split the part before the first quote if the key ends there.
+            values = record[:quote].split(b",", column + 1)
+            if len(values) <= column + 1:
+                values = self._parse(record)[0]
+        key = values[column] if column < len(values) else ""
+        if not isinstance(key, str):
+            key = key.decode("utf-8")
+        return key
+
+    def scan(self, count=None):
+        """Find the offsets of up to *count* more rows, or of all rows if *count* is None.
+
+        The keys of the rows are added to the key index. Return the number of
+        rows found. Raise CsvError if a key is not unique.
+        """
+        with self._lock:
+            found = 0
+            if self._at_end:
+                return found
+            key_index = self._key_index
+            offsets = self._offsets
+            record_key = self._record_key
+            pos = offsets[-1]
+            with open(self.filename, "rb") as csvfile:
+                csvfile.seek(pos)
+                while count is None or found < count:
+                    record = self._read_record(csvfile)
+                    if not record:
+                        self._at_end = True
+                        break
+                    pos += len(record)
+                    if record.strip():
+                        key = record_key(record)
+                        if key in key_index:
+                            msg = 'Error: Not unique key "%s" in column %s found in %s' % (
+                                key, self._key_column_name, self.filename)
+                            raise CsvError(msg)
+                        key_index[key] = len(offsets) - 1
+                        offsets.append(pos)
+                        found += 1
+                    else:
+                        offsets[-1] = pos  # Skip an empty line.
+            return found
+
+    def scanned_row_count(self):
+        return len(self._offsets) - 1
+
+    def at_end(self):
+        """Return True if scan() has reached the end of the file."""
+        return self._at_end
+
+    def has_necessary_columns(self):
+        """ Check if the data contains all the columns required to create a part."""
+        return all(h in self.headers for h in (self.mandatory_dims + [self._key_column_name]))
+
+    def row_count(self):
+        self.scan()
+        return self.scanned_row_count()
+
+    def column_count(self):
+        return len(self.headers)
+
+    def _parse_range(self, first, last):
+        """Return the rows *first* to *last* - 1, which must be scanned.
+
+        Short rows are padded with empty values like in CsvTable.
+        """
+        with open(self.filename, "rb") as csvfile:
+            csvfile.seek(self._offsets[first])
+            rows = self._parse(csvfile.read(self._offsets[last] - self._offsets[first]))
+        column_count = len(self.headers)
+        return [row + [""] * (column_count - len(row)) if len(row) < column_count else row
+                for row in rows]
+
+    def _record(self, row_index):
+        with self._lock:
+            row = self._rows.pop(row_index, None)
+            if row is None:
+                if row_index < 0:
+                    raise IndexError(row_index)
+                last = row_index + StreamingCsvTable.READ_AHEAD
+                if last > self.scanned_row_count():
+                    self.scan(last - self.scanned_row_count())
+                    last = min(last, self.scanned_row_count())
+                    if row_index >= last:
+                        raise IndexError(row_index)
+                for i, values in enumerate(self._parse_range(row_index, last)):
+                    self._rows[row_index + i] = values
+                row = self._rows.pop(row_index)
+                while len(self._rows) >= StreamingCsvTable.ROW_CACHE_SIZE:
+                    self._rows.popitem(last=False)
+            self._rows[row_index] = row  # Mark as recently used.
+            return row
+
+    def get_value(self, row_index, column_index):
+        return self._record(row_index)[column_index]
+
+    def get_row(self, row_index):
+        """Return row with the index *row_index* as a RowView."""
+        self._record(row_index)  # Raise IndexError for a wrong index.
+        return RowView(self, row_index)
+
+    def find_row_index(self, key):
+        """Return index of the row with key *key* or -1 if there is no such row."""
+        row_i = self._key_index.get(key)
+        if row_i is None and not self._at_end:
+            self.scan()
+            row_i = self._key_index.get(key)
+        return -1 if row_i is None else row_i
+
+    def find_part(self, key):
+        """Return the row with key (part name) as a RowView."""
+        row_i = self.find_row_index(key)
+        if row_i < 0:
+            return None
+        return self.get_row(row_i)
+
+    def find_row_indexes(self, column_name, value):
+        """Return indexes of all rows where column *column_name* equals *value*.
+
+        The column must be listed in *index_columns*.
+        """
+        with self._lock:
+            if self._secondary_indexes is None:
+                columns = [(name, self.headers.index(name)) for name in self.index_columns
+                           if name in self.headers]
+                indexes = dict((name, {}) for name, _ in columns)
+                rows = self.row_count()
+                for first in range(0, rows, StreamingCsvTable.INDEX_STEP):
+                    last = min(rows, first + StreamingCsvTable.INDEX_STEP)
+                    for row_i, row in enumerate(self._parse_range(first, last), first):
+                        for name, column in columns:
+                            indexes[name].setdefault(row[column], []).append(row_i)
+                self._secondary_indexes = indexes
+        return list(self._secondary_indexes[column_name].get(value, []))
+
+    def get_part_key(self, index):
+        """Return part key of a row with the index *index*."""
+        return self._record(index)[self._key_column_index]
+
+
+def file_stamp(filename):
+    """Return data identifying the version of a file. Raise OSError if it does not exist."""
+    if OSE_LibraryPack.in_pack(filename):
+        return OSE_LibraryPack.stamp(filename)
+    st = os.stat(filename)
+    return (getattr(st, "st_mtime_ns", st.st_mtime), st.st_size)
+
+
+# CSV files of at least this size are read with StreamingCsvTable.
+STREAMING_MIN_BYTES = 16 * 1024 * 1024
+
+
+class CatalogCache:
+    """Process-wide cache of loaded CsvTable objects.
+
+    Tables are keyed by their path and the load options. A cached table is
+    valid as long as the modification time and the size of the CSV file do
+    not change, so a repeated lookup costs one os.stat() call. The cache
+    holds at most *max_entries* tables and evicts the least recently used one.
+
+    On a miss, the table is taken from the precompiled catalog index at
+    *index_path* if the index is up to date for this table, otherwise
+    the CSV file is parsed. Use index_path=None to always parse CSV files.
+    CSV files of at least *streaming_min_bytes* are opened as
+    StreamingCsvTable; use None to always read the whole file. Tables in
+    the library pack are always read completely.
+    """
+
+    def __init__(self, max_entries=32, index_path=Base.CATALOG_INDEX_PATH,
+                 streaming_min_bytes=STREAMING_MIN_BYTES):
+        self.max_entries = max_entries
+        self.index_path = index_path
+        self.streaming_min_bytes = streaming_min_bytes
+        self.hits = 0
+        self.misses = 0
+        self.index_loads = 0
+        # Map (path, options) -> (stat stamp, table), oldest first.
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._index = None
+        self._index_stamp = None
+
+    def get(self, filename, mandatory_dims=None, key_column_name="PartNumber",
+            index_columns=None):
+        """Return a loaded table for the CSV file *filename*.
+
+        Raise OSError if the file does not exist and CsvError if it is broken.
+        """
+        path = os.path.abspath(filename)
+        stamp = file_stamp(path)
+        key = (path, tuple(mandatory_dims or []), key_column_name, tuple(index_columns or []))
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[0] == stamp:
+                self._entries[key] = entry  # Mark as recently used.
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        table = self._load_from_index(path, mandatory_dims, key_column_name)
+        if table is None and self.streaming_min_bytes is not None and \
+                stamp[1] >= self.streaming_min_bytes and not OSE_LibraryPack.in_pack(path):
+            table = StreamingCsvTable(mandatory_dims, key_column_name, index_columns)
+            table.open(path)
+        elif table is None:
+            table = CsvTable(mandatory_dims, key_column_name, index_columns)
+            table.load(path)
+        with self._lock:
+            self._entries[key] = (stamp, table)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return table
+
+    def _load_from_index(self, path, mandatory_dims, key_column_name):
+        """Return IndexedTable for *path* or None if the index can not be used."""
+        if self.index_path is None:
+            return None
+        import OSE_CatalogIndex
+        try:
+            stamp = file_stamp(self.index_path)
+        except OSError:
+            return None
+        with self._lock:
+            if stamp != self._index_stamp:
+                # The index file was (re)built. Tables from the old index
+                # keep their own reference to the old mapping.
+                self._index = OSE_CatalogIndex.open_index(
+                    self.index_path, os.path.dirname(self.index_path))
+                self._index_stamp = stamp
+            index = self._index
+        if index is None:
+            return None
+        table = index.table(path, mandatory_dims, key_column_name)
+        if table is not None:
+            with self._lock:
+                self.index_loads += 1
+        return table
+
+    def invalidate(self, filename=None):
+        """Forget the table loaded from *filename*, or all tables if *filename* is None."""
+        with self._lock:
+            if filename is None:
+                self._entries.clear()
+                return
+            path = os.path.abspath(filename)
+            for key in [k for k in self._entries if k[0] == path]:
+                del self._entries[key]
+
+    def stats(self):
+        """Return cache counters as a dictionary."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "index_loads": self.index_loads,
+                    "entries": len(self._entries), "max_entries": self.max_entries}
+
+
+# Cache shared by all commands of the workbench.
+CATALOG_CACHE = CatalogCache()
+
+
+def load_table(filename, mandatory_dims=None, key_column_name="PartNumber", index_columns=None):
+    """Return the table from *filename* using the shared catalog cache."""
+    return CATALOG_CACHE.get(filename, mandatory_dims, key_column_name, index_columns)
+
+
+# Columns required in every part catalog and the columns indexed in addition to the key.
+CATALOG_COLUMNS = ["PartNumber", "Text", "Image", "Cad"]
+CATALOG_INDEX_COLUMNS = ["Cad", "Image"]
+
+
+def load_catalog(filename):
+    """Return the part catalog from *filename* using the shared catalog cache."""
+    return load_table(filename, CATALOG_COLUMNS, index_columns=CATALOG_INDEX_COLUMNS)
+
+
+def catalog_table_paths():
+    """Return paths of the tables used by the workbench commands."""
+    from OSE_CommandTable import COMMAND_TABLE
+    return [os.path.join(Base.TABLE_PATH, row["Csv"]) for row in COMMAND_TABLE]
+
+
+def find_part(key, table_paths=None):
+    """Return (table path, row dictionary) of the part with key *key*.
+
+    The tables are searched in the order of *table_paths*, by default in the
+    order of the workbench commands. Raise PartNotFoundError if no table
+    contains the part.
+    """
+    if table_paths is None:
+        table_paths = catalog_table_paths()
+    for path in table_paths:
+        row = load_catalog(path).find_part(key)
+        if row is not None:
+            return path, row
+    raise PartNotFoundError('Part "%s" not found in the catalogs.' % key)
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+# Insert library parts into a document from scripts.
+#
+# Example:
+#
+#     import FreeCAD, OSE_PartInsertion
+#     report = OSE_PartInsertion.insert_parts(FreeCAD.ActiveDocument, [
+#         ("tslot16", FreeCAD.Placement()),
+#         ("basis-set/winkel/angle4.fcstd", FreeCAD.Placement(FreeCAD.Vector(0, 0, 100),
+#                                                             FreeCAD.Rotation())),
+#     ])
+#     print(report.summary())
+#
+# A Cad path can also be a reference to a generated part such as
+# "tslot:length=160", see OSE_ParametricParts.
+#
+# All parts of a batch are inserted in one undo transaction and the document
+# is recomputed once at the end. With linked=True, or the preference
+# Mod/OSE_PartLibrary/LinkedParts, every part is an App::Link to one shared
+# copy of the geometry of its file, see OSE_importPart.importLinkedPart.
+#
+# refresh_parts() updates all imported parts whose source file changed since
+# the import:
+#
+#     report = OSE_PartInsertion.refresh_parts(FreeCAD.ActiveDocument)
+#     print(report.summary())
+#
+# The dialogs call prepare_part() in a worker thread before insert_parts(),
+# so reading a large part file does not freeze the GUI.
+
+import collections
+import os.path
+import time
+
+import FreeCAD
+
+import OSE_BasePartLibrary as Base
+import OSE_LibraryPack
+import OSE_ParametricParts
+import OSE_PartCache
+import OSE_PartCatalog as Catalog
+import OSE_importPart
+import OSE_Trace
+import OSE_Warmup
+
+# File types accepted as a Cad path instead of a part number.
+CAD_EXTENSIONS = (".fcstd", ".step", ".stp", ".iges", ".igs", ".brep", ".brp")
+
+
+def resolve_cad_path(name, table_paths=None):
+    """Return full path of the CAD file for a part number or a Cad path.
+
+    A Cad path is relative to Base.PARTS_PATH, as in the Cad column of the
+    catalogs. Raise Catalog.PartNotFoundError if the part number is unknown.
+    Files from the library pack are extracted, FreeCAD needs a real file.
+    References to generated parts are returned unchanged.
+    """
+    if OSE_ParametricParts.is_reference(name):
+        return name
+    if name.lower().endswith(CAD_EXTENSIONS):
+        return OSE_LibraryPack.local_path(os.path.join(Base.PARTS_PATH, name))
+    _, row = Catalog.find_part(name, table_paths)
+    if OSE_ParametricParts.is_reference(row["Cad"]):
+        return row["Cad"]
+    return OSE_LibraryPack.local_path(os.path.join(Base.PARTS_PATH, row["Cad"]))
+
+
+class InsertResult:
+    """Outcome of inserting one item of a batch."""
+
+    def __init__(self, name, placement):
+        self.name = name
+        self.placement = placement
+        self.cad_path = None
+        self.obj = None
+        self.error = None
+        self.time = 0.0  # Seconds spent on this item.
+
+    def ok(self):
+        return self.error is None
+
+
+class BatchReport:
+    """Results of insert_parts()."""
+
+    def __init__(self):
+        self.results = []
+        self.recompute_time = 0.0
+        self.total_time = 0.0
+
+    def objects(self):
+        return [r.obj for r in self.results if r.ok()]
+
+    def failures(self):
+        return [r for r in self.results if not r.ok()]
+
+    def summary(self):
+        lines = ["%8.1f ms  %s%s" % (r.time * 1000, r.name,
+                                     "" if r.ok() else "  FAILED: %s" % r.error)
+                 for r in self.results]
+        lines.append("Inserted %d of %d parts in %.1f ms (recompute %.1f ms)" % (
+            len(self.objects()), len(self.results), self.total_time * 1000,
+            self.recompute_time * 1000))
+        return "\n".join(lines)
+
+
+def linked_parts_default():
+    """Return True if parts are inserted as links by default."""
+    return FreeCAD.ParamGet(Base.PREFERENCES).GetBool("LinkedParts", False)
+
+
+def background_insertion_default():
+    """Return True if the dialogs load parts in the background."""
+    return FreeCAD.ParamGet(Base.PREFERENCES).GetBool("BackgroundInsertion", True)
+
+
+class Cancelled(Exception):
+    """Raised by prepare_part() when the insertion was cancelled."""
+
+
+def prepare_part(filename, cancel=None, freecadcmd=None):
+    """Load the shape of the part file *filename* into the shape cache.
+
+    prepare_part() does not touch FreeCAD documents and is meant to run in
+    a worker thread; insert_parts() then only copies the cached shape. A
+    shape missing in the disk cache is extracted by a FreeCADCmd worker
+    process, see OSE_Warmup. Setting the threading.Event *cancel* terminates
+    the worker and raises Cancelled.
+
+    Return True if the shape is cached now. False means that importPart has
+    to load the file in the main thread, for example if FreeCADCmd was not
+    found or the file is not a .fcstd file with exactly one visible part.
+    """
+    if OSE_ParametricParts.is_reference(filename):
+        return True  # Generated parts do not load a file.
+    mtime = os.path.getmtime(filename)
+    if OSE_PartCache.get_cached_shape(filename, mtime) is not None:
+        return True
+    if not filename.lower().endswith(".fcstd"):
+        return False
+    with OSE_Trace.span("extract_in_worker", file=filename):
+        try:
+            results = OSE_Warmup.warm_up([filename], freecadcmd, jobs=1, cancel=cancel)
+        except OSE_Warmup.WarmupError:
+            return False
+    if cancel is not None and cancel.is_set():
+        raise Cancelled("Insertion of %s was cancelled" % filename)
+    if not results or not results[0].ok():
+        return False
+    return OSE_PartCache.get_cached_shape(filename, mtime) is not None
+
+
+def insert_parts(document, items, table_paths=None, transaction_name="Insert parts",
+                 linked=None):
+    """Insert library parts into *document* and recompute it once.
+
+    :param items: iterable of (name, placement) pairs. *name* is a part
+        number from the catalogs or a Cad path relative to Base.PARTS_PATH.
+        *placement* can be None to keep the placement of the source part.
+    :param table_paths: catalogs used to resolve part numbers, by default the
+        tables of the workbench commands.
+    :param linked: insert links to shared geometry instead of copies. None
+        uses the preference LinkedParts.
+    :return: BatchReport. A failed item does not stop the batch.
+    """
+    if linked is None:
+        linked = linked_parts_default()
+    with OSE_Trace.span("insert_parts", transaction=transaction_name, linked=linked) as span:
+        report = _insert_batch(document, items, table_paths, transaction_name, linked)
+        span.set(parts=len(report.results), failures=len(report.failures()))
+    FreeCAD.Console.PrintLog(report.summary() + "\n")
+    return report
+
+
+def _insert_batch(document, items, table_paths, transaction_name, linked):
+    report = BatchReport()
+    start = time.time()
+    document.openTransaction(transaction_name)
+    try:
+        for name, placement in items:
+            result = InsertResult(name, placement)
+            item_start = time.time()
+            with OSE_Trace.span("insert_part", part=name):
+                try:
+                    with OSE_Trace.span("resolve_cad_path"):
+                        result.cad_path = resolve_cad_path(name, table_paths)
+                    if OSE_ParametricParts.is_reference(result.cad_path):
+                        result.obj = OSE_ParametricParts.insert_part(result.cad_path, document)
+                    elif linked:
+                        result.obj = OSE_importPart.importLinkedPart(result.cad_path, document)
+                    else:
+                        result.obj = OSE_importPart.importPart(result.cad_path, None, document)
+                    if result.obj is None:
+                        result.error = "importPart failed for %s" % result.cad_path
+                    elif placement is not None:
+                        result.obj.Placement = placement
+                except (Catalog.Error, IOError, OSError) as e:
+                    result.error = str(e)
+                except Exception as e:
+                    # For example an OCC error of a broken file, the batch continues.
+                    result.error = "%s: %s" % (type(e).__name__, e)
+            result.time = time.time() - item_start
+            report.results.append(result)
+    finally:
+        document.commitTransaction()
+    recompute_start = time.time()
+    with OSE_Trace.span("recompute"):
+        document.recompute()
+    report.recompute_time = time.time() - recompute_start
+    report.total_time = time.time() - start
+    return report
+
+
+class RefreshReport:
+    """Results of refresh_parts()."""
+
+    def __init__(self):
+        self.files_checked = 0
+        self.files_updated = 0
+        self.objects_updated = 0
+        self.errors = []  # (source file, message)
+        self.total_time = 0.0
+
+    def summary(self):
+        lines = ["FAILED %s: %s" % error for error in self.errors]
+        lines.append("Updated %d objects from %d of %d files in %.1f ms" % (
+            self.objects_updated, self.files_updated, self.files_checked,
+            self.total_time * 1000))
+        return "\n".join(lines)
+
+
+def imported_objects(document):
+    """Return {source file: [objects]} of the parts inserted by importPart."""
+    groups = collections.OrderedDict()
+    for obj in document.Objects:
+        if hasattr(obj, "sourceFile") and hasattr(obj, "timeLastImport"):
+            groups.setdefault(obj.sourceFile, []).append(obj)
+    return groups
+
+
+def refresh_parts(document, transaction_name="Refresh parts"):
+    """Update imported parts of *document* whose source file changed.
+
+    The modification time of every source file is read once. Generated
+    parts have no source file and are skipped. Each changed
+    file is loaded once and its shape and colors are copied to all objects
+    imported from it; their placements are kept. All updates are one undo
+    transaction and the document is recomputed once.
+    :return: RefreshReport. A failed file does not stop the refresh.
+    """
+    report = RefreshReport()
+    start = time.time()
+    with OSE_Trace.span("refresh_parts") as span:
+        changed = []
+        for filename, objects in imported_objects(document).items():
+            if OSE_ParametricParts.is_reference(filename):
+                continue
+            report.files_checked += 1
+            try:
+                mtime = os.path.getmtime(OSE_LibraryPack.update_local(filename))
+            except (IOError, OSError) as e:
+                report.errors.append((filename, str(e)))
+                continue
+            stale = [obj for obj in objects if obj.timeLastImport < mtime]
+            if stale:
+                changed.append((filename, mtime, stale))
+        if changed:
+            _refresh_files(document, changed, report, transaction_name)
+        span.set(files=report.files_updated, objects=report.objects_updated)
+    report.total_time = time.time() - start
+    FreeCAD.Console.PrintLog(report.summary() + "\n")
+    return report
+
+
+def _refresh_files(document, changed, report, transaction_name):
+    document.openTransaction(transaction_name)
+    try:
+        for filename, mtime, stale in changed:
+            with OSE_Trace.span("refresh_file", file=filename, objects=len(stale)):
+                try:
+                    cached = OSE_importPart.loadSourceShape(filename)
+                except (IOError, OSError) as e:
+                    report.errors.append((filename, str(e)))
+                    continue
+                if cached is None:
+                    report.errors.append(
+                        (filename, "the file does not have exactly one visible part"))
+                    continue
+                for obj in stale:
+                    OSE_importPart.updateImportedPart(obj, cached, mtime)
+                report.files_updated += 1
+                report.objects_updated += len(stale)
+    finally:
+        document.commitTransaction()
+    with OSE_Trace.span("recompute"):
+        document.recompute()
@@ -3,137 +3,97 @@
 # Date: 12 Mai 2018
 # Dialog to select a part.
 
+import collections
+import math
 import os.path
-import csv
+import threading
 
 from PySide import QtCore, QtGui
 import FreeCAD
-import assembly2
 import OSE_BasePartLibrary as Base
+import OSE_Geometry
+import OSE_LibraryPack
+import OSE_Manifest
+import OSE_PartCatalog as Catalog
+import OSE_PartSearch
+import OSE_PreviewMesh
+import OSE_Previews
+import OSE_Trace
+from OSE_CommandTable import COMMAND_TABLE
+from OSE_PartCatalog import CsvError, CsvTable  # noqa: F401
 
 
-class Error(Exception):
-    """Base class for exceptions in this module."""
-
-    def __init__(self, message):
-        super(Error, self).__init__(message)
-
-
-class CsvError(Error):
-    """Base class for exceptions in this module."""
-
-    def __init__(self, message):
-        super(Error, self).__init__(message)
-
-
-class CsvTable:
-    """ Read pipe dimensions from a csv file.
-    one part of the column must be unique and contains a unique key.
+class PartTableModel(QtCore.QAbstractTableModel):
+    """Qt model over a CsvTable. The model does not copy the table data.
 
-    Store the data as a list of rows. Each row is a list of values.
+    Rows of a StreamingCsvTable are shown in steps of FETCH_ROWS: the view
+    asks for more with canFetchMore()/fetchMore() when it is scrolled down.
     """
+    FETCH_ROWS = 1000
 
-    def __init__(self, mandatory_dims=None, key_column_name="PartNumber"):
-        """
-        @param mandatoryDims: list of column names which must be presented in the CSV files apart
-        the "keyColumnName" column
-        """
-        self.headers = []
-        self.data = []
-        self.has_valid_data = False
-        if mandatory_dims is None:
-            mandatory_dims = []
-        self.mandatory_dims = mandatory_dims
-        self._key_column_name = key_column_name
-        self._key_column_index = None
-
-    def key_column_name(self):
-        return self._key_column_name
-
-    def load(self, filename):
-        """Load data from a CSV file."""
-        self.has_valid_data = False
-        with open(filename, "r") as csvfile:
-            csv_reader = csv.reader(csvfile, delimiter=',', quotechar='"')
-            self.headers = csv_reader.next()
-            # Fill the talble
-            self.data = []
-            keys = []
-            self._key_column_index = self.headers.index(self._key_column_name)
-            for row in csv_reader:
-                # Check if the keys is unique
-                key = row[self._key_column_index]
-                if key in keys:
-                    msg = 'Error: Not unique key "%s" in column %s found in %s' % (
-                        key, self._key_column_name, filename)
-                    raise CsvError(msg)
-                else:
-                    keys.append(key)
-                self.data.append(row)
-            csvfile.close()  # Should I close this file explicitely?
-            self.has_valid_data = self.has_necessary_columns()
-
-    def has_necessary_columns(self):
-        """ Check if the data contains all the columns required to create a part."""
-        return all(h in self.headers for h in (self.mandatory_dims + [self._key_column_name]))
-
-    def find_part(self, key):
-        """Return first row with with key (part name) as a dictionary."""
-        # Search for the first appereance of the name in this column.
-        for row in self.data:
-            if row[self._key_column_index] == key:
-                # Convert row to dicionary.
-                return dict(zip(self.headers, row))
-        return None
-
-    def get_part_key(self, index):
-        """Return part key of a row with the index *index*."""
-        return self.data[index][self._key_column_index]
+    def __init__(self, table, parent=None, *args):
+        self.table = table
+        self.headers = table.headers
+        QtCore.QAbstractTableModel.__init__(self, parent, *args)
+        self.streaming = isinstance(table, Catalog.StreamingCsvTable)
+        if self.streaming:
+            table.scan(PartTableModel.FETCH_ROWS)
+            self.fetched_rows = min(table.scanned_row_count(), PartTableModel.FETCH_ROWS)
+        else:
+            self.fetched_rows = table.row_count()
 
+    def rowCount(self, parent):
+        return self.fetched_rows
 
-class PartTableModel(QtCore.QAbstractTableModel):
+    def canFetchMore(self, parent):
+        if not self.streaming or parent.isValid():
+            return False
+        return self.fetched_rows < self.table.scanned_row_count() or not self.table.at_end()
 
-    def __init__(self, headers, data, parent=None, *args):
-        self.headers = headers
-        self.table_data = data
-        self.keyColumnName = None
-        QtCore.QAbstractTableModel.__init__(self, parent, *args)
+    def fetchMore(self, parent):
+        self.fetch_to(self.fetched_rows + PartTableModel.FETCH_ROWS - 1)
 
-    def rowCount(self, parent):
-        return len(self.table_data)
+    def fetch_to(self, row_index):
+        """Make rows up to *row_index* visible in the views."""
+        if not self.streaming or row_index < self.fetched_rows:
+            return
+        missing = row_index + 1 - self.table.scanned_row_count()
+        if missing > 0:
+            self.table.scan(missing)
+        last = min(row_index, self.table.scanned_row_count() - 1)
+        if last < self.fetched_rows:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), self.fetched_rows, last)
+        self.fetched_rows = last + 1
+        self.endInsertRows()
 
     def columnCount(self, parent):
-        return len(self.headers)
+        return self.table.column_count()
 
     def data(self, index, role):
         if not index.isValid():
             return None
         elif role != QtCore.Qt.DisplayRole:
             return None
-        return self.table_data[index.row()][index.column()]
+        return self.table.get_value(index.row(), index.column())
 
     def get_part_key(self, row_index):
-        key_index = self.headers.index(self.keyColumnName)
-        return self.table_data[row_index][key_index]
+        return self.table.get_part_key(row_index)
 
     def get_row(self, row_index):
-        values = self.table_data[row_index]
-        keys = self.headers
-        return dict(zip(keys, values))
+        return self.table.get_row(row_index)
 
     def get_part_row_index(self, key):
         """ Return row index of the part with key *key*.
 
         The *key* is usually refers to the part number.
         :param key: Key of the part.
-        :return: Index of the first row whose key is equal to key
+        :return: Index of the row whose key is equal to key
                         return -1 if no row find.
         """
-        key_index = self.headers.index(self.keyColumnName)
-        for row_i in range(key_index, len(self.table_data)):
-            if self.table_data[row_i][key_index] == key:
-                return row_i
-        return -1
+        row_i = self.table.find_row_index(key)
+        self.fetch_to(row_i)
+        return row_i
 
     def headerData(self, col, orientation, role):
         if orientation == QtCore. Qt.Horizontal and role == QtCore.Qt.DisplayRole:
@@ -141,10 +101,381 @@ class PartTableModel(QtCore.QAbstractTableModel):
         return None
 
 
+class _ImageLoadSignals(QtCore.QObject):
+    # (path, width, height), QImage
+    loaded = QtCore.Signal(object, object)
+
+
+class _ImageLoadTask(QtCore.QRunnable):
+    """Decode and scale one image in a worker thread.
+
+    Only QImage is used here, QPixmap must be created in the GUI thread.
+    """
+
+    def __init__(self, key, signals):
+        super(_ImageLoadTask, self).__init__()
+        self.key = key
+        self.signals = signals
+
+    def run(self):
+        image = QtGui.QImage()
+        try:
+            image = self._load()
+        except Exception as e:
+            FreeCAD.Console.PrintLog("Loading the preview of %s failed: %s\n" % (self.key[0], e))
+        finally:
+            # Always answer, otherwise the key would stay pending for ever.
+            self.signals.loaded.emit(self.key, image)
+
+    def _load(self):
+        path, width, height = self.key
+        if path.lower().endswith(".fcstd"):
+            # Use the thumbnail embedded in the part file.
+            path = OSE_Previews.THUMBNAIL_CACHE.get(path)
+        if path is not None and OSE_LibraryPack.in_pack(path):
+            image = QtGui.QImage()
+            try:
+                image.loadFromData(OSE_LibraryPack.read(path))
+            except (IOError, OSError):
+                pass
+        else:
+            image = QtGui.QImage(path) if path is not None else QtGui.QImage()
+        if not image.isNull():
+            image = image.scaled(width, height, QtCore.Qt.KeepAspectRatio,
+                                 QtCore.Qt.SmoothTransformation)
+        return image
+
+
+class PreviewLoader(QtCore.QObject):
+    """Load preview images in the background and keep them in a bounded cache.
+
+    request() returns a cached pixmap immediately. Otherwise the image is
+    decoded and scaled on a thread pool and the *ready* signal delivers the
+    pixmap in the GUI thread later. Null pixmaps are delivered for images
+    which cannot be read.
+    """
+    # path, QPixmap
+    ready = QtCore.Signal(object, object)
+
+    def __init__(self, max_pixmaps=128, threads=2, parent=None):
+        super(PreviewLoader, self).__init__(parent)
+        self.max_pixmaps = max_pixmaps
+        self._pool = QtCore.QThreadPool(self)
+        self._pool.setMaxThreadCount(threads)
+        # Map (path, width, height) -> QPixmap, oldest first.
+        self._pixmaps = collections.OrderedDict()
+        self._pending = set()
+        self._signals = _ImageLoadSignals(self)
+        # The signal is emitted in worker threads, Qt queues it to this thread.
+        self._signals.loaded.connect(self._loaded)
+
+    def request(self, path, size):
+        """Return scaled pixmap of *path* if it is cached, otherwise start loading it and
+        return None. *path* can be an image or a .fcstd file with a thumbnail."""
+        key = (path, size.width(), size.height())
+        pixmap = self._pixmaps.pop(key, None)
+        if pixmap is not None:
+            self._pixmaps[key] = pixmap  # Mark as recently used.
+            return pixmap
+        if key not in self._pending:
+            self._pending.add(key)
+            self._pool.start(_ImageLoadTask(key, self._signals))
+        return None
+
+    def prefetch(self, paths, size):
+        """Load *paths* into the cache without waiting for them."""
+        for path in paths:
+            self.request(path, size)
+
+    def _loaded(self, key, image):
+        self._pending.discard(key)
+        pixmap = QtGui.QPixmap.fromImage(image)
+        self._pixmaps[key] = pixmap
+        while len(self._pixmaps) > self.max_pixmaps:
+            self._pixmaps.popitem(last=False)
+        self.ready.emit(key[0], pixmap)
+
+
+_preview_loader = None
+
+
+def preview_loader():
+    """Return the preview loader shared by all dialogs."""
+    global _preview_loader
+    if _preview_loader is None:
+        _preview_loader = PreviewLoader()
+    return _preview_loader
+
+
+class _MeshLoadSignals(QtCore.QObject):
+    # .fcstd path, PreviewMesh or None
+    loaded = QtCore.Signal(object, object)
+
+
+class _MeshLoadTask(QtCore.QRunnable):
+    """Read the preview mesh of a part in a worker thread.
+
+    If *build* is a threading.Event, a missing mesh is built by a FreeCADCmd
+    worker process unless the event is set meanwhile.
+    """
+
+    def __init__(self, path, signals, build=None):
+        super(_MeshLoadTask, self).__init__()
+        self.path = path
+        self.signals = signals
+        self.build = build
+
+    def run(self):
+        mesh = None
+        try:
+            mesh = OSE_PreviewMesh.MESH_CACHE.get(self.path)
+            if mesh is None and self.build is not None and not self.build.is_set():
+                mesh = OSE_PreviewMesh.MESH_CACHE.build(self.path, self.build)
+        except Exception as e:
+            FreeCAD.Console.PrintLog("Loading the preview mesh of %s failed: %s\n" % (
+                self.path, e))
+        finally:
+            # Always answer, otherwise the path would stay pending for ever.
+            self.signals.loaded.emit(self.path, mesh)
+
+
+class MeshLoader(QtCore.QObject):
+    """Load preview meshes in the background and keep them in a bounded cache.
+
+    Works like PreviewLoader: request() returns a cached mesh immediately,
+    otherwise the *ready* signal delivers the mesh, or None if the part has
+    none, in the GUI thread later. The meshes are built by FreeCADCmd worker
+    processes, see OSE_PreviewMesh.MeshCache.build(); without FreeCADCmd
+    only the meshes written by "OSE_Warmup.py --meshes" are shown.
+    """
+    # .fcstd path, PreviewMesh or None
+    ready = QtCore.Signal(object, object)
+
+    def __init__(self, max_meshes=32, threads=1, parent=None):
+        super(MeshLoader, self).__init__(parent)
+        self.max_meshes = max_meshes
+        self._pool = QtCore.QThreadPool(self)
+        self._pool.setMaxThreadCount(threads)
+        # Map path -> PreviewMesh, oldest first.
+        self._meshes = collections.OrderedDict()
+        # Map path -> True if the pending task builds a missing mesh.
+        self._pending = {}
+        # Set to stop the build of the previously requested part.
+        self._build = threading.Event()
+        self._signals = _MeshLoadSignals(self)
+        self._signals.loaded.connect(self._loaded)
+
+    def request(self, path, build=True):
+        """Return the cached mesh of *path* or start loading it and return None.
+
+        With *build*, a missing mesh is built; the build of the part
+        requested before is cancelled.
+        """
+        mesh = self._meshes.pop(path, None)
+        if mesh is not None:
+            self._meshes[path] = mesh  # Mark as recently used.
+            return mesh
+        if build:
+            self._build.set()
+            self._build = threading.Event()
+        if path not in self._pending or build and not self._pending[path]:
+            self._pending[path] = build
+            self._pool.start(_MeshLoadTask(path, self._signals,
+                                           self._build if build else None))
+        return None
+
+    def prefetch(self, paths):
+        """Read the existing meshes of *paths* without building missing ones."""
+        for path in paths:
+            self.request(path, build=False)
+
+    def _loaded(self, path, mesh):
+        self._pending.pop(path, None)
+        # Parts without a mesh are asked again, it may be built meanwhile.
+        if mesh is not None:
+            self._meshes[path] = mesh
+            while len(self._meshes) > self.max_meshes:
+                self._meshes.popitem(last=False)
+        self.ready.emit(path, mesh)
+
+
+_mesh_loader = None
+
+
+def mesh_loader():
+    """Return the mesh loader shared by all dialogs."""
+    global _mesh_loader
+    if _mesh_loader is None:
+        _mesh_loader = MeshLoader()
+    return _mesh_loader
+
+
+class MeshView(QtGui.QWidget):
+    """Flat shaded view of a PreviewMesh, drawn with QPainter.
+
+    Drag with the mouse to turn the part.
+    """
+    # Radians per pixel of mouse movement.
+    ROTATION_SPEED = 0.01
+
+    def __init__(self, parent=None):
+        super(MeshView, self).__init__(parent)
+        self.mesh = None
+        self.yaw = math.radians(-30)
+        self.pitch = math.radians(30)
+        self._drag_position = None
+
+    def set_mesh(self, mesh):
+        self.mesh = mesh
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), self.palette().color(QtGui.QPalette.Base))
+        if self.mesh is not None:
+            painter.setRenderHint(QtGui.QPainter.Antialiasing)
+            r, g, b = self.mesh.color
+            for points, shade in OSE_PreviewMesh.project(self.mesh, self.yaw, self.pitch,
+                                                          self.width(), self.height()):
+                light = 0.35 + 0.65 * shade
+                color = QtGui.QColor.fromRgbF(min(r * light, 1.0), min(g * light, 1.0),
+                                              min(b * light, 1.0))
+                # Outline in the same color to close the gaps between triangles.
+                painter.setPen(color)
+                painter.setBrush(color)
+                painter.drawPolygon(QtGui.QPolygonF([
+                    QtCore.QPointF(points[0], points[1]), QtCore.QPointF(points[2], points[3]),
+                    QtCore.QPointF(points[4], points[5])]))
+        painter.end()
+
+    def mousePressEvent(self, event):
+        self._drag_position = event.pos()
+
+    def mouseMoveEvent(self, event):
+        if self._drag_position is None:
+            return
+        pos = event.pos()
+        self.yaw += (pos.x() - self._drag_position.x()) * MeshView.ROTATION_SPEED
+        self.pitch = max(-math.pi / 2, min(math.pi / 2, self.pitch + (
+            pos.y() - self._drag_position.y()) * MeshView.ROTATION_SPEED))
+        self._drag_position = pos
+        self.update()
+
+    def mouseReleaseEvent(self, event):
+        self._drag_position = None
+
+
+class _PrepareSignals(QtCore.QObject):
+    # True, False or the exception raised in the worker thread
+    finished = QtCore.Signal(object)
+
+
+class _PrepareTask(QtCore.QRunnable):
+    """Load the shape of a part in a worker thread, see OSE_PartInsertion.prepare_part."""
+
+    def __init__(self, cad_name, cancel, signals):
+        super(_PrepareTask, self).__init__()
+        self.cad_name = cad_name
+        self.cancel = cancel
+        self.signals = signals
+
+    def run(self):
+        import OSE_PartInsertion
+        try:
+            path = OSE_PartInsertion.resolve_cad_path(self.cad_name)
+            result = OSE_PartInsertion.prepare_part(path, self.cancel)
+        except Exception as e:
+            # Report every error, otherwise the progress dialog would stay open.
+            result = e
+        self.signals.finished.emit(result)
+
+
+class BackgroundInsertion(QtCore.QObject):
+    """Insert the part of a catalog row without freezing the GUI.
+
+    The part file is read and its shape extracted in the background while a
+    progress dialog with a Cancel button is shown. Only insert_parts(), which
+    takes the shape from the cache, runs in the GUI thread. If the shape
+    cannot be prepared in the background, insert_parts() loads the file as
+    before.
+    """
+    # The progress dialog appears only if loading takes longer.
+    PROGRESS_DELAY_MS = 500
+    # document, BatchReport or None if nothing was inserted
+    finished = QtCore.Signal(object, object)
+
+    def __init__(self, document, row, parent=None):
+        super(BackgroundInsertion, self).__init__(parent)
+        self.document = document
+        self.row = row
+        self.cancel = threading.Event()
+        self.progress = QtGui.QProgressDialog("Loading %s ..." % row["PartNumber"], "Cancel",
+                                              0, 0)
+        self.progress.setWindowTitle("Insert part")
+        self.progress.setMinimumDuration(BackgroundInsertion.PROGRESS_DELAY_MS)
+        self.progress.canceled.connect(self.cancel.set)
+        self._pool = QtCore.QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self._signals = _PrepareSignals(self)
+        # The signal is emitted in the worker thread, Qt queues it to this thread.
+        self._signals.finished.connect(self._prepared)
+
+    def start(self):
+        # Keep this object alive until the part is inserted.
+        _background_insertions.add(self)
+        self.progress.setValue(0)
+        self._pool.start(_PrepareTask(self.row["Cad"], self.cancel, self._signals))
+
+    def _prepared(self, result):
+        import OSE_PartInsertion
+        _background_insertions.discard(self)
+        part_number = self.row["PartNumber"]
+        report = None
+        if self.cancel.is_set() or isinstance(result, OSE_PartInsertion.Cancelled):
+            FreeCAD.Console.PrintMessage("Insertion of %s cancelled.\n" % part_number)
+        elif self.document not in FreeCAD.listDocuments().values():
+            FreeCAD.Console.PrintWarning(
+                "The document was closed while %s was loaded.\n" % part_number)
+        else:
+            if isinstance(result, Exception):
+                FreeCAD.Console.PrintLog("Loading %s in the background failed: %s\n" % (
+                    part_number, result))
+            self.progress.setLabelText("Inserting %s ..." % part_number)
+            with OSE_Trace.span("attach_part", part=part_number):
+                report = OSE_PartInsertion.insert_parts(
+                    self.document, [(self.row["Cad"], None)],
+                    transaction_name="Insert %s" % part_number)
+            for failure in report.failures():
+                FreeCAD.Console.PrintError("Inserting %s failed: %s\n" % (
+                    part_number, failure.error))
+        self.progress.reset()
+        self.finished.emit(self.document, report)
+
+
+# Running BackgroundInsertion objects.
+_background_insertions = set()
+
+
+def insert_row(document, row):
+    """Insert the part of a catalog row into *document*.
+
+    With the preference BackgroundInsertion (default on) the part is loaded
+    in the background and inserted later, see BackgroundInsertion.
+    """
+    import OSE_PartInsertion
+    if OSE_PartInsertion.background_insertion_default():
+        BackgroundInsertion(document, row).start()
+    else:
+        OSE_PartInsertion.insert_parts(document, [(row["Cad"], None)],
+                                       transaction_name="Insert %s" % row["PartNumber"])
+
+
 class DialogParams:
     def __init__(self):
         self.document = None
         self.table = None
+        # CSV file of *table*, to find its geometry table.
+        self.table_path = None
         self.dialog_title = None
         self.selection_dialog_title = None
         self.explanation_text = None
@@ -169,26 +500,48 @@ def UnicodeUTF8():
 
 class BaseDialog(QtGui.QDialog):
     QSETTINGS_APPLICATION = "OSE part library workbench"
+    # Smallest size of preview images and number of rows around the selection to prefetch.
+    MIN_PREVIEW_SIZE = QtCore.QSize(256, 256)
+    PREFETCH_ROWS = 3
 
     def __init__(self, params):
         super(BaseDialog, self).__init__()
         self.params = params
+        # Give the shape and preview caches the stored hashes of the part files.
+        with OSE_Trace.span("load_manifest"):
+            OSE_Manifest.shared_manifest()
+        self.preview_loader = preview_loader()
+        self.preview_path = None
+        self.preview_loader.ready.connect(self.preview_ready)
+        self.mesh_loader = mesh_loader()
+        self.mesh_path = None
+        self.mesh_loader.ready.connect(self.mesh_ready)
         self.init_ui()
 
     def init_ui(self):
         self.result = -1
         self.setup_ui(self)
         # Fill table with dimensions.
-        self.init_table()
+        with OSE_Trace.span("init_table"):
+            self.init_table()
+
+        if self.model.streaming:
+            # Finding the last selected part can read the whole table. Show
+            # the first rows before.
+            QtCore.QTimer.singleShot(0, self.try_restore_user_input)
+        else:
+            self.try_restore_user_input()
+        self.show()
 
+    def try_restore_user_input(self):
         # Restore previous user input. Ignore exceptions to prevent this part
         # part of the code to prevent GUI from starting, once settings are broken.
         try:
-            self.restore_user_input()
+            with OSE_Trace.span("restore_user_input"):
+                self.restore_user_input()
         except Exception as e:
             print("Could not restore old user input!")
             print(e)
-        self.show()
 
 
 # The following lines are from QtDesigner .ui-file processed by pyside-uic
@@ -199,6 +552,12 @@ class BaseDialog(QtGui.QDialog):
         dialog.resize(800, 800)
         self.verticalLayout = QtGui.QVBoxLayout(dialog)
         self.verticalLayout.setObjectName("verticalLayout")
+        # Filter by the geometry table of the catalog, hidden if there is none.
+        self.lineEditFilter = QtGui.QLineEdit(dialog)
+        self.lineEditFilter.setPlaceholderText(
+            "Filter by geometry, e.g. length 20..40, holes >= 2")
+        self.lineEditFilter.setObjectName("lineEditFilter")
+        self.verticalLayout.addWidget(self.lineEditFilter)
         self.tableViewParts = QtGui.QTableView(dialog)
         self.tableViewParts.setSelectionMode(
             QtGui.QAbstractItemView.SingleSelection)
@@ -216,7 +575,18 @@ class BaseDialog(QtGui.QDialog):
         self.labelImage.setPixmap("")
         self.labelImage.setAlignment(QtCore.Qt.AlignCenter)
         self.labelImage.setObjectName("labelImage")
-        self.verticalLayout.addWidget(self.labelImage)
+        # 3D preview next to the image, shown when the part has a preview mesh.
+        self.meshView = MeshView(dialog)
+        self.meshView.setMinimumSize(BaseDialog.MIN_PREVIEW_SIZE)
+        self.meshView.setObjectName("meshView")
+        self.meshView.setToolTip("Drag to turn the part.\nThe preview is built by FreeCADCmd in "
+                                 "the background. Without FreeCADCmd only previews made by "
+                                 "\"OSE_Warmup.py --meshes\" are shown.")
+        self.meshView.hide()
+        self.previewLayout = QtGui.QHBoxLayout()
+        self.previewLayout.addWidget(self.labelImage)
+        self.previewLayout.addWidget(self.meshView)
+        self.verticalLayout.addLayout(self.previewLayout)
         self.buttonBox = QtGui.QDialogButtonBox(dialog)
         self.buttonBox.setOrientation(QtCore.Qt.Horizontal)
         self.buttonBox.setStandardButtons(
@@ -230,7 +600,6 @@ class BaseDialog(QtGui.QDialog):
         QtCore.QObject.connect(
             self.buttonBox, QtCore.SIGNAL("rejected()"), dialog.reject)
         QtCore.QMetaObject.connectSlotsByName(dialog)
-        QtCore.QObject.connect(self.tableViewParts, QtCore.SIGNAL("clicked(QModelIndex)"), dialog.rows_selected)
 
     def retranslate_ui(self, dialog):
         dialog.setWindowTitle(QtGui.QApplication.translate(
@@ -238,10 +607,56 @@ class BaseDialog(QtGui.QDialog):
 
     def init_table(self):
         # Read table data from CSV
-        self.model = PartTableModel(
-            self.params.table.headers, self.params.table.data)
-        self.model.keyColumnName = self.params.key_column_name
+        self.model = PartTableModel(self.params.table)
         self.tableViewParts.setModel(self.model)
+        # Update the preview for mouse and keyboard selection.
+        QtCore.QObject.connect(self.tableViewParts.selectionModel(),
+                               QtCore.SIGNAL("selectionChanged(QItemSelection,QItemSelection)"),
+                               self.rows_selected)
+        self.geometry = None
+        # Keys of the parts matching the geometry filter, None shows all rows.
+        self.filter_keys = None
+        if self.params.table_path is not None:
+            try:
+                with OSE_Trace.span("load_geometry"):
+                    self.geometry = OSE_Geometry.load_geometry(self.params.table_path)
+            except (IOError, OSError, Catalog.Error) as e:
+                FreeCAD.Console.PrintWarning("Can not read geometry table: %s\n" % e)
+        if self.geometry is None:
+            self.lineEditFilter.hide()
+        else:
+            self.lineEditFilter.setToolTip(OSE_Geometry.filter_help())
+            QtCore.QObject.connect(self.lineEditFilter, QtCore.SIGNAL("textChanged(QString)"),
+                                   self.filter_rows)
+            # A streaming table fetches rows while it is scrolled, filter them too.
+            self.model.rowsInserted.connect(self.rows_fetched)
+
+    def filter_rows(self, text):
+        """Show only the parts whose geometry matches the filter *text*."""
+        try:
+            ranges = OSE_Geometry.parse_filter(text)
+        except OSE_Geometry.GeometryError as e:
+            # Keep the rows of the last valid filter while the user is typing.
+            self.lineEditFilter.setToolTip(str(e))
+            return
+        self.lineEditFilter.setToolTip(OSE_Geometry.filter_help())
+        self.filter_keys = set(self.geometry.find(ranges)) if ranges else None
+        self.hide_filtered_rows(0, self.model.rowCount(None) - 1)
+        if self.filter_keys:
+            # The view does not fetch more rows when all fetched ones are hidden,
+            # fetch up to the last match. rows_fetched() hides the others.
+            self.model.fetch_to(max(self.model.table.find_row_index(key)
+                                    for key in self.filter_keys))
+
+    def rows_fetched(self, parent, first, last):
+        if self.filter_keys is not None:
+            self.hide_filtered_rows(first, last)
+
+    def hide_filtered_rows(self, first, last):
+        keys = self.filter_keys
+        for row_i in range(first, last + 1):
+            self.tableViewParts.setRowHidden(
+                row_i, keys is not None and self.model.get_part_key(row_i) not in keys)
 
     def get_selected_part_name(self):
         sel = self.tableViewParts.selectionModel()
@@ -267,9 +682,7 @@ class BaseDialog(QtGui.QDialog):
                 self.tableViewParts.selectRow(row_i)
 
     def create_new_part(self, document, row):
-        part_path = os.path.join(Base.PARTS_PATH, row["Cad"])
-        assembly2.importPart.importPart(part_path, None, document)
-        document.recompute()
+        insert_row(document, row)
 
     def accept_creation_mode(self):
         """User clicked OK"""
@@ -289,7 +702,8 @@ class BaseDialog(QtGui.QDialog):
         row = self.get_selected_row()
         if row is not None:
                 self.save_user_input()
-                self.create_new_part(self.params.document, row)
+                with OSE_Trace.span("create_new_part", part=row["PartNumber"]):
+                    self.create_new_part(self.params.document, row)
                 super(BaseDialog, self).accept()
 
         else:
@@ -318,22 +732,98 @@ class BaseDialog(QtGui.QDialog):
             image = row["Image"]
             if len(image) > 0:
                 path = os.path.join(Base.PARTS_PATH, image)
-                if os.path.isfile(path):
+                if OSE_LibraryPack.isfile(path):
                     return path
 
         return None  # File does not exists
 
-    def rows_selected(self):
+    def get_preview_source(self, row):
+        """Return path of the image of *row*, or of its Cad file if the image is missing.
+
+        The thumbnail embedded in the Cad file is used as preview then.
+        """
+        path = self.get_image_full_path(row)
+        if path is None and row is not None:
+            path = OSE_Previews.cad_path(row)
+        return path
+
+    def preview_size(self):
+        return self.labelImage.contentsRect().size().expandedTo(BaseDialog.MIN_PREVIEW_SIZE)
+
+    def rows_selected(self, *args):
         #   FreeCAD.Console.PrintMessage("row selected")
         row = self.get_selected_row()
-        path = self.get_image_full_path(row)
-        if path is not None:
-            self.labelImage.setPixmap(path)
+        if row is None:
+            return
+        path = self.get_preview_source(row)
+        self.preview_path = path
+        pixmap = None
+        if path is not None and self.preview_loader is not None:
+            pixmap = self.preview_loader.request(path, self.preview_size())
+        # Show the cached image or nothing until the image is loaded.
+        self.labelImage.setPixmap(pixmap if pixmap is not None else QtGui.QPixmap())
+        self.mesh_path = OSE_Previews.cad_path(row)
+        if self.mesh_path is not None and self.mesh_loader is not None:
+            # Keep the view visible while the mesh is loaded, it hides when there is none.
+            self.meshView.set_mesh(None)
+            mesh = self.mesh_loader.request(self.mesh_path)
+            if mesh is not None:
+                self.show_mesh(mesh)
         else:
-            self.labelImage.setPixmap("")  # No picture.
+            self.show_mesh(None)
 
         # update text
-        self.labelText.setText(row["Text"])
+        text = row["Text"]
+        if self.geometry is not None:
+            values = self.geometry.get(self.get_selected_part_name())
+            if values is not None:
+                text = "%s\n%s" % (text, OSE_Geometry.describe(values))
+        self.labelText.setText(text)
+        self.prefetch_previews()
+
+    def prefetch_previews(self):
+        """Start loading images of the rows around the selected one."""
+        sel = self.tableViewParts.selectionModel().selectedRows()
+        if not sel or self.preview_loader is None:
+            return
+        current = sel[0].row()
+        paths = []
+        mesh_paths = []
+        for row_i in range(max(0, current - BaseDialog.PREFETCH_ROWS),
+                           min(self.model.rowCount(None), current + BaseDialog.PREFETCH_ROWS + 1)):
+            if row_i != current:
+                row = self.model.get_row(row_i)
+                path = self.get_preview_source(row)
+                if path is not None:
+                    paths.append(path)
+                cad = OSE_Previews.cad_path(row)
+                if cad is not None:
+                    mesh_paths.append(cad)
+        self.preview_loader.prefetch(paths, self.preview_size())
+        if self.mesh_loader is not None:
+            self.mesh_loader.prefetch(mesh_paths)
+
+    def preview_ready(self, path, pixmap):
+        if path == self.preview_path:
+            self.labelImage.setPixmap(pixmap)
+
+    def show_mesh(self, mesh):
+        self.meshView.set_mesh(mesh)
+        self.meshView.setVisible(mesh is not None)
+
+    def mesh_ready(self, path, mesh):
+        if path == self.mesh_path:
+            self.show_mesh(mesh)
+
+    def done(self, result):
+        # The loaders are shared and outlive the dialog.
+        if self.preview_loader is not None:
+            self.preview_loader.ready.disconnect(self.preview_ready)
+            self.preview_loader = None
+        if self.mesh_loader is not None:
+            self.mesh_loader.ready.disconnect(self.mesh_ready)
+            self.mesh_loader = None
+        super(BaseDialog, self).done(result)
 
     def save_user_input(self):
         """Store user input for the next run."""
@@ -371,11 +861,248 @@ class BaseDialog(QtGui.QDialog):
         self.exec_()
 
 
+class SearchResultModel(QtCore.QAbstractTableModel):
+    """Qt model over a list of OSE_PartSearch.SearchHit.
+
+    *index* is the SearchIndex of the hits, None while it is built.
+    """
+    HEADERS = ["PartNumber", "Catalog", "Text"]
+
+    def __init__(self, index, parent=None):
+        QtCore.QAbstractTableModel.__init__(self, parent)
+        self.index = index
+        self.hits = []
+        # Map table file name -> dialog title of its command.
+        self.catalog_titles = dict((row["Csv"], row["Title"]) for row in COMMAND_TABLE)
+
+    def set_hits(self, hits):
+        self.beginResetModel()
+        self.hits = hits
+        self.endResetModel()
+
+    def rowCount(self, parent):
+        return len(self.hits)
+
+    def columnCount(self, parent):
+        return len(SearchResultModel.HEADERS)
+
+    def data(self, index, role):
+        if not index.isValid() or role != QtCore.Qt.DisplayRole:
+            return None
+        hit = self.hits[index.row()]
+        column = index.column()
+        if column == 0:
+            return hit.key
+        if column == 1:
+            name = os.path.basename(hit.table_path)
+            return self.catalog_titles.get(name, name)
+        return self.get_row(index.row()).get("Text", "")
+
+    def get_row(self, row_index):
+        hit = self.hits[row_index]
+        return self.index.table(hit.table_path).get_row(hit.row_index)
+
+    def headerData(self, col, orientation, role):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return SearchResultModel.HEADERS[col]
+        return None
+
+
+class _IndexSignals(QtCore.QObject):
+    # SearchIndex or the exception raised in the worker thread
+    finished = QtCore.Signal(object)
+
+
+class _IndexTask(QtCore.QRunnable):
+    """Build or refresh the search index in a worker thread."""
+
+    def __init__(self, index, signals):
+        super(_IndexTask, self).__init__()
+        self.index = index
+        self.signals = signals
+
+    def run(self):
+        try:
+            with OSE_Trace.span("search_index"):
+                self.index.refresh()
+            result = self.index
+        except Exception as e:
+            # Report every error, otherwise the dialog would wait for the index forever.
+            result = e
+        self.signals.finished.emit(result)
+
+
+class SearchIndexLoader(QtCore.QObject):
+    """Keep the search index shared by all search dialogs up to date in the background.
+
+    request() starts updating the index for changed tables and the *ready*
+    signal delivers it, or the exception which stopped the update, in the
+    GUI thread later. The index must not be searched while it is updated.
+    """
+    # SearchIndex or exception
+    ready = QtCore.Signal(object)
+
+    def __init__(self, parent=None):
+        super(SearchIndexLoader, self).__init__(parent)
+        self.index = OSE_PartSearch.SearchIndex()
+        self._pool = QtCore.QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self._pending = False
+        self._signals = _IndexSignals(self)
+        # The signal is emitted in the worker thread, Qt queues it to this thread.
+        self._signals.finished.connect(self._loaded)
+
+    def request(self):
+        if not self._pending:
+            self._pending = True
+            self._pool.start(_IndexTask(self.index, self._signals))
+
+    def _loaded(self, result):
+        self._pending = False
+        self.ready.emit(result)
+
+
+_search_index_loader = None
+
+
+def search_index_loader():
+    """Return the search index loader shared by all search dialogs."""
+    global _search_index_loader
+    if _search_index_loader is None:
+        _search_index_loader = SearchIndexLoader()
+    return _search_index_loader
+
+
+class SearchDialog(QtGui.QDialog):
+    """Search a part in all tables of the workbench and insert it."""
+    SETTINGS_NAME = "search"
+    MAX_RESULTS = 200
+
+    def __init__(self, document):
+        super(SearchDialog, self).__init__()
+        self.document = document
+        with OSE_Trace.span("load_manifest"):
+            OSE_Manifest.shared_manifest()
+        # Searching starts when the index is up to date.
+        self.model = SearchResultModel(None)
+        self.index_loader = search_index_loader()
+        self.index_loader.ready.connect(self.index_ready)
+        self.preview_loader = preview_loader()
+        self.preview_path = None
+        self.preview_loader.ready.connect(self.preview_ready)
+        self.setup_ui()
+        settings = QtCore.QSettings(BaseDialog.QSETTINGS_APPLICATION, SearchDialog.SETTINGS_NAME)
+        self.lineEditQuery.setText(settings.value("LastQuery") or "")
+        self.lineEditQuery.selectAll()
+        self.labelText.setText("Indexing the catalogs ...")
+        self.index_loader.request()
+
+    def setup_ui(self):
+        self.setWindowTitle("Search part")
+        self.resize(800, 800)
+        self.verticalLayout = QtGui.QVBoxLayout(self)
+        self.lineEditQuery = QtGui.QLineEdit(self)
+        self.lineEditQuery.setPlaceholderText("Part number or description")
+        self.verticalLayout.addWidget(self.lineEditQuery)
+        self.tableViewParts = QtGui.QTableView(self)
+        self.tableViewParts.setSelectionMode(QtGui.QAbstractItemView.SingleSelection)
+        self.tableViewParts.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
+        self.tableViewParts.setModel(self.model)
+        self.tableViewParts.horizontalHeader().setStretchLastSection(True)
+        self.verticalLayout.addWidget(self.tableViewParts)
+        self.labelText = QtGui.QLabel(self)
+        self.labelText.setWordWrap(True)
+        self.verticalLayout.addWidget(self.labelText)
+        self.labelImage = QtGui.QLabel(self)
+        self.labelImage.setAlignment(QtCore.Qt.AlignCenter)
+        self.verticalLayout.addWidget(self.labelImage)
+        self.buttonBox = QtGui.QDialogButtonBox(self)
+        self.buttonBox.setStandardButtons(
+            QtGui.QDialogButtonBox.Cancel | QtGui.QDialogButtonBox.Ok)
+        self.verticalLayout.addWidget(self.buttonBox)
+
+        QtCore.QObject.connect(self.buttonBox, QtCore.SIGNAL("accepted()"), self.accept)
+        QtCore.QObject.connect(self.buttonBox, QtCore.SIGNAL("rejected()"), self.reject)
+        QtCore.QObject.connect(self.lineEditQuery, QtCore.SIGNAL("textChanged(QString)"),
+                               self.query_changed)
+        QtCore.QObject.connect(self.tableViewParts, QtCore.SIGNAL("doubleClicked(QModelIndex)"),
+                               self.accept)
+        QtCore.QObject.connect(self.tableViewParts.selectionModel(),
+                               QtCore.SIGNAL("selectionChanged(QItemSelection,QItemSelection)"),
+                               self.rows_selected)
+
+    def index_ready(self, result):
+        if isinstance(result, Exception):
+            self.labelText.setText("Building the search index failed: %s" % result)
+            return
+        self.model.index = result
+        self.query_changed(self.lineEditQuery.text())
+
+    def query_changed(self, text):
+        if self.model.index is None:
+            return  # index_ready() searches the text.
+        with OSE_Trace.span("search", query=text) as span:
+            self.model.set_hits(self.model.index.search(text, SearchDialog.MAX_RESULTS))
+            span.set(hits=len(self.model.hits))
+        if self.model.hits:
+            self.tableViewParts.selectRow(0)
+        else:
+            self.rows_selected()
+
+    def get_selected_row(self):
+        rows = self.tableViewParts.selectionModel().selectedRows()
+        if rows:
+            return self.model.get_row(rows[0].row())
+        return None
+
+    def rows_selected(self, *args):
+        row = self.get_selected_row()
+        if row is None:
+            self.preview_path = None
+            self.labelText.setText("")
+            self.labelImage.setPixmap(QtGui.QPixmap())
+            return
+        self.labelText.setText(row.get("Text", ""))
+        path = OSE_Previews.image_path(row) or OSE_Previews.cad_path(row)
+        self.preview_path = path
+        pixmap = None
+        if path is not None:
+            size = self.labelImage.contentsRect().size().expandedTo(BaseDialog.MIN_PREVIEW_SIZE)
+            pixmap = self.preview_loader.request(path, size)
+        self.labelImage.setPixmap(pixmap if pixmap is not None else QtGui.QPixmap())
+
+    def preview_ready(self, path, pixmap):
+        if path == self.preview_path:
+            self.labelImage.setPixmap(pixmap)
+
+    def accept(self, *args):
+        row = self.get_selected_row()
+        if row is None:
+            msg_box = QtGui.QMessageBox()
+            msg_box.setText("Select part")
+            msg_box.exec_()
+            return
+        settings = QtCore.QSettings(BaseDialog.QSETTINGS_APPLICATION, SearchDialog.SETTINGS_NAME)
+        settings.setValue("LastQuery", self.lineEditQuery.text())
+        settings.sync()
+        insert_row(self.document, row)
+        super(SearchDialog, self).accept()
+
+    def done(self, result):
+        # The loaders are shared and outlive the dialog.
+        self.preview_loader.ready.disconnect(self.preview_ready)
+        self.index_loader.ready.disconnect(self.index_ready)
+        super(SearchDialog, self).done(result)
+
+
 # Before working with macros, try to load the dimension table.
 def gui_check_table(table_path):
-    dimensions_used = ["PartNumber", "Text", "Image", "Cad"]
-    # Check if the CSV file exists.
-    if os.path.isfile(table_path) is False:
+    dimensions_used = Catalog.CATALOG_COLUMNS
+    # Check if the CSV file exists. Unchanged tables are taken from the cache.
+    try:
+        with OSE_Trace.span("load_catalog", table=os.path.basename(table_path)):
+            table = Catalog.load_catalog(table_path)
+    except (IOError, OSError):
         text = "This tablePath requires %s  but this file does not exist." % (
             table_path)
         msg_box = QtGui.QMessageBox(QtGui.QMessageBox.Warning,
@@ -383,11 +1110,6 @@ def gui_check_table(table_path):
         msg_box.exec_()
         return None  # Error
 
-    FreeCAD.Console.PrintMessage(
-        "Trying to load CSV file with dimensions: %s" % table_path)
-    table = CsvTable(dimensions_used)
-    table.load(table_path)
-
     if table.has_valid_data is False:
         text = 'Invalid %s.\n'\
             'It must contain columns %s.' % (
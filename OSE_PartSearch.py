@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+# Incremental search over all part catalogs.
+#
+# Every catalog row is a document. Its text is split into words at spaces and
+# punctuation, but not at "-" and "_", which are part of keys like
+# "TS20-0001232". Words like "angle4" or "t-slot" are also indexed as their
+# parts "angle" and "4" or "t" and "slot". Each word is padded with two
+# spaces at the front and cut into trigrams. A query word with at least three
+# characters matches rows which contain it anywhere, a shorter query word
+# matches rows with a word starting with it.
+#
+# Hits are ranked by where the query words are found: in the part key or only
+# in the other columns. Every key is also indexed as one token. Before the
+# query is split into words, it is looked up as a prefix in a sorted list of
+# keys; a user typing a part number gets the hits from there without
+# touching the trigram index. Hits with the same score are returned in key
+# order. Small candidate sets are computed from the trigram postings and
+# scored completely. For broad queries like "b" the documents are visited in
+# key order, only those in the smallest posting of the query are scored, and
+# the search stops after *limit* hits.
+#
+# The index remembers which catalog object it indexed. refresh() asks the
+# shared catalog cache for every table and rebuilds only the tables which were
+# reloaded because their CSV file changed.
+
+import bisect
+import heapq
+import re
+
+import OSE_PartCatalog as Catalog
+
+try:
+    _chr = unichr
+except NameError:
+    _chr = chr
+
+_WORD_SEPARATORS = re.compile(r"[\s,;/\\]+")
+_WORD_PARTS = re.compile(r"\d+|[^\W\d]+")
+
+
+def normalize(text):
+    return text.lower()
+
+
+def words(text):
+    return [w for w in _WORD_SEPARATORS.split(normalize(text)) if w]
+
+
+def index_words(text):
+    """Return words of *text* followed by the letter and digit parts of mixed words."""
+    result = []
+    for word in words(text):
+        result.append(word)
+        parts = _WORD_PARTS.findall(word)
+        if len(parts) > 1:
+            result.extend(parts)
+    return result
+
+
+def key_words(key):
+    """Return the words indexed for a part key: the whole key followed by its words."""
+    whole = normalize(key).strip()
+    return [whole] + [w for w in index_words(key) if w != whole]
+
+
+def trigrams(word):
+    """Return trigrams of an indexed word, including the two at its start."""
+    padded = "  " + word
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def query_trigrams(word):
+    """Return trigrams which an indexed word must have to match query *word*."""
+    if len(word) < 3:
+        return trigrams(word)  # Only at the start of a word.
+    return set(word[i:i + 3] for i in range(len(word) - 2))
+
+
+def _add_postings(postings, text_words, doc_id):
+    for word in text_words:
+        for t in trigrams(word):
+            postings.setdefault(t, set()).add(doc_id)
+
+
+def _remove_postings(postings, text_words, doc_id):
+    for word in text_words:
+        for t in trigrams(word):
+            posting = postings.get(t)
+            if posting is not None:
+                posting.discard(doc_id)
+                if not posting:
+                    del postings[t]
+
+
+class SearchHit:
+    def __init__(self, table_path, row_index, key, score):
+        self.table_path = table_path
+        self.row_index = row_index
+        self.key = key
+        self.score = score
+
+
+class SearchIndex:
+    """Trigram index over the rows of several catalogs.
+
+    :param columns: names of the columns to index, by default all columns.
+    """
+
+    # Scores of a matching query word. A match in the key always scores
+    # higher than a match in the other columns.
+    SCORE_EXACT_KEY = 100
+    SCORE_KEY_PREFIX = 50
+    SCORE_KEY = 20
+    SCORE_OTHER = 5
+    # Candidate sets up to this size are computed and scored completely.
+    SCORE_ALL_LIMIT = 2000
+
+    def __init__(self, columns=None):
+        self.columns = columns
+        # Map document id -> (table path, row index, key, lower case key, words of the text).
+        # The words are joined with a space and start with a space, so " " + word is
+        # a prefix test for a word.
+        self._documents = {}
+        # Map trigram -> set of document ids, for all indexed columns and for the keys.
+        self._postings = {}
+        self._key_postings = {}
+        # Map table path -> (indexed table object, list of document ids).
+        self._tables = {}
+        self._next_id = 0
+        # Sorted list of (lower case key, document id), built on demand.
+        self._sorted_keys = None
+
+    def document_count(self):
+        return len(self._documents)
+
+    def table(self, path):
+        """Return the indexed table object of *path*."""
+        return self._tables[path][0]
+
+    def refresh(self, table_paths=None):
+        """Index new or changed tables and drop removed ones. Return paths of rebuilt tables."""
+        if table_paths is None:
+            table_paths = Catalog.catalog_table_paths()
+        rebuilt = []
+        for path in table_paths:
+            try:
+                table = Catalog.load_catalog(path)
+            except (IOError, OSError, Catalog.Error):
+                table = None
+            indexed = self._tables.get(path)
+            if indexed is not None and indexed[0] is table:
+                continue
+            self.remove_table(path)
+            if table is not None:
+                self.add_table(path, table)
+            rebuilt.append(path)
+        for path in [p for p in self._tables if p not in table_paths]:
+            self.remove_table(path)
+            rebuilt.append(path)
+        return rebuilt
+
+    def add_table(self, path, table):
+        """Index all rows of *table* under the name *path*."""
+        columns = range(table.column_count())
+        if self.columns is not None:
+            columns = [i for i, h in enumerate(table.headers) if h in self.columns]
+        ids = []
+        for row_i in range(table.row_count()):
+            key = table.get_part_key(row_i)
+            text_words = index_words(" ".join(table.get_value(row_i, c) for c in columns))
+            doc_id = self._next_id
+            self._next_id += 1
+            self._documents[doc_id] = (path, row_i, key, normalize(key),
+                                       " " + " ".join(text_words))
+            _add_postings(self._postings, text_words, doc_id)
+            _add_postings(self._key_postings, key_words(key), doc_id)
+            ids.append(doc_id)
+        self._tables[path] = (table, ids)
+        self._sorted_keys = None
+
+    def remove_table(self, path):
+        indexed = self._tables.pop(path, None)
+        if indexed is None:
+            return
+        for doc_id in indexed[1]:
+            _, _, _, key, text = self._documents.pop(doc_id)
+            _remove_postings(self._postings, text.split(), doc_id)
+            _remove_postings(self._key_postings, key_words(key), doc_id)
+        self._sorted_keys = None
+
+    @staticmethod
+    def _estimate(postings_dict, word):
+        """Return an upper bound of the number of documents matching *word* in *postings_dict*."""
+        return min(len(postings_dict.get(t, ())) for t in query_trigrams(word))
+
+    @staticmethod
+    def _intersect(postings_dict, word):
+        """Return ids of documents with all trigrams of query *word* in *postings_dict*."""
+        postings = []
+        for t in query_trigrams(word):
+            posting = postings_dict.get(t)
+            if posting is None:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result.intersection_update(posting)
+            if not result:
+                break
+        return result
+
+    def _word_estimate(self, word):
+        return self._estimate(self._postings, word) + self._estimate(self._key_postings, word)
+
+    def _word_ids(self, word):
+        """Return ids of documents which may match *word* in any indexed column or the key."""
+        return self._intersect(self._postings, word) | self._intersect(self._key_postings, word)
+
+    def _key_ids(self, word):
+        """Return ids of documents whose key may score for query *word*.
+
+        A word shorter than three characters only scores at the start of the key.
+        """
+        if len(word) >= 3:
+            return self._intersect(self._key_postings, word)
+        sorted_keys = self._sorted()
+        start = bisect.bisect_left(sorted_keys, (word,))
+        # The first text after all texts starting with the word.
+        end = bisect.bisect_left(sorted_keys, (word[:-1] + _chr(ord(word[-1]) + 1),))
+        return set(doc_id for _, doc_id in sorted_keys[start:end])
+
+    def _score(self, query_words, document):
+        """Return score of a document or 0 if it does not match all query words."""
+        _, _, _, key, text = document
+        score = 0
+        for word in query_words:
+            if key == word:
+                score += SearchIndex.SCORE_EXACT_KEY
+            elif key.startswith(word):
+                score += SearchIndex.SCORE_KEY_PREFIX
+            elif len(word) >= 3 and word in key:
+                score += SearchIndex.SCORE_KEY
+            elif (word if len(word) >= 3 else " " + word) in text:
+                score += SearchIndex.SCORE_OTHER
+            else:
+                return 0
+        return score
+
+    def _sorted(self):
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted((d[3], doc_id) for doc_id, d in self._documents.items())
+        return self._sorted_keys
+
+    @staticmethod
+    def _smallest(postings_dict, word):
+        """Return the smallest posting of the trigrams of query *word*, empty if one is missing."""
+        smallest = None
+        for t in query_trigrams(word):
+            posting = postings_dict.get(t)
+            if posting is None:
+                return set()
+            if smallest is None or len(posting) < len(smallest):
+                smallest = posting
+        return smallest
+
+    def _walk(self, predicate, ids, limit, within=None):
+        """Return up to *limit* ids for which *predicate* is true, in key order.
+
+        Only *ids* are tested, or all documents in *within* if *ids* is None,
+        or all documents if both are None.
+        """
+        if ids is not None:
+            found = [(self._documents[i][3], i) for i in ids if predicate(i)]
+            return [doc_id for _, doc_id in heapq.nsmallest(limit, found)]
+        result = []
+        if not within and within is not None:
+            return result
+        for _, doc_id in self._sorted():
+            if (within is None or doc_id in within) and predicate(doc_id):
+                result.append(doc_id)
+                if len(result) >= limit:
+                    break
+        return result
+
+    def _key_prefix_hits(self, text, limit, score_factor=1):
+        """Return up to *limit* (score, document id) pairs of the keys starting with *text*."""
+        hits = []
+        sorted_keys = self._sorted()
+        # The key equal to the text is the first of the keys starting with it.
+        i = bisect.bisect_left(sorted_keys, (text,))
+        while i < len(sorted_keys) and len(hits) < limit and sorted_keys[i][0].startswith(text):
+            key, doc_id = sorted_keys[i]
+            hits.append((score_factor * (SearchIndex.SCORE_EXACT_KEY if key == text else
+                                         SearchIndex.SCORE_KEY_PREFIX), doc_id))
+            i += 1
+        return hits
+
+    def search(self, query, limit=100):
+        """Return up to *limit* SearchHit objects for *query*, best first.
+
+        Hits with the same score are ordered by their key. A key which starts
+        with the whole query scores as if every query word was found at the
+        start of the key.
+        """
+        query_words = words(query)
+        if not query_words:
+            return []
+        if len(query_words) == 1:
+            # Starts with the keys starting with the word.
+            hits = self._search_word(query_words[0], limit)
+        else:
+            # Keys with spaces, like "Single frame", typed so far.
+            hits = self._key_prefix_hits(normalize(query).strip(), limit, len(query_words))
+            if len(hits) < limit:
+                found = set(doc_id for _, doc_id in hits)
+                hits.extend(hit for hit in self._search_words(query_words, limit)
+                            if hit[1] not in found)
+                hits = heapq.nsmallest(limit, hits, key=lambda hit: (
+                    -hit[0], self._documents[hit[1]][3]))
+        result = []
+        for score, doc_id in hits:
+            path, row_i, key = self._documents[doc_id][:3]
+            result.append(SearchHit(path, row_i, key, score))
+        return result
+
+    def _search_word(self, word, limit):
+        """Return up to *limit* (score, document id) pairs for a query of one word.
+
+        The hits are produced score by score: keys starting with the word,
+        keys containing it, then the other columns.
+        """
+        hits = self._key_prefix_hits(word, limit)
+        tiers = [(SearchIndex.SCORE_OTHER, self._postings)]
+        if len(word) >= 3:
+            tiers.insert(0, (SearchIndex.SCORE_KEY, self._key_postings))
+        for score, postings_dict in tiers:
+            if len(hits) >= limit:
+                break
+            ids = within = None
+            if self._estimate(postings_dict, word) <= SearchIndex.SCORE_ALL_LIMIT:
+                ids = self._intersect(postings_dict, word)
+            else:
+                within = self._smallest(postings_dict, word)
+            found = self._walk(lambda d: self._score([word], self._documents[d]) == score,
+                               ids, limit - len(hits), within)
+            hits.extend((score, doc_id) for doc_id in found)
+        return hits
+
+    def _search_words(self, query_words, limit):
+        """Return up to *limit* (score, document id) pairs for a query of several words."""
+        # Words shorter than three characters only narrow down the hits of longer ones.
+        long_words = [w for w in query_words if len(w) >= 3] or query_words
+        narrowest = min(long_words, key=self._word_estimate)
+        if self._word_estimate(narrowest) <= SearchIndex.SCORE_ALL_LIMIT:
+            key_docs = self._word_ids(narrowest)
+            broad = False
+        else:
+            # Score only documents with a query word in the key. All others
+            # have the same score and are taken in key order.
+            key_docs = set()
+            for word in query_words:
+                key_docs.update(self._key_ids(word))
+            broad = True
+        scored = []
+        for doc_id in key_docs:
+            document = self._documents[doc_id]
+            score = self._score(query_words, document)
+            if score > 0:
+                scored.append((-score, document[3], doc_id))
+        hits = [(-neg_score, doc_id) for neg_score, _, doc_id in heapq.nsmallest(limit, scored)]
+        if broad and len(hits) < limit:
+            score = SearchIndex.SCORE_OTHER * len(query_words)
+            # The other hits match every word outside the key, so they are in
+            # the smallest posting of each word.
+            within = min((self._smallest(self._postings, w) for w in query_words), key=len)
+            found = self._walk(lambda d: d not in key_docs and
+                               self._score(query_words, self._documents[d]) == score,
+                               None, limit - len(hits), within)
+            hits.extend((score, doc_id) for doc_id in found)
+        return hits
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+# Low-poly meshes for the 3D preview of the part dialogs.
+#
+# The GUI process never opens the part document and never tessellates. The
+# FreeCADCmd workers of OSE_Warmup take the shape from the BREP disk cache
+# of OSE_PartCache or extract it, tessellate it coarsely and reduce it to at
+# most MAX_TRIANGLES triangles by vertex clustering; the dialogs only read
+# the result. The mesh is stored as <hash>.mesh, named after the content
+# hash of the .fcstd file like the thumbnails of OSE_Previews, so a changed
+# part file gets a new mesh. "python OSE_Warmup.py --meshes" builds the
+# meshes of the whole library.
+#
+# A .mesh file is a short header followed by the vertex coordinates as
+# little-endian float32 and the triangles as uint32 vertex indices, which
+# array.fromfile() reads without parsing.
+#
+# Example:
+#
+#     import OSE_PreviewMesh
+#     path = ".../parts/basis-set/winkel/angle4.fcstd"
+#     mesh = OSE_PreviewMesh.MESH_CACHE.get(path) or OSE_PreviewMesh.MESH_CACHE.build(path)
+#     if mesh is not None:
+#         print(mesh.triangle_count())
+
+import array
+import math
+import os
+import struct
+import sys
+
+import OSE_BasePartLibrary as Base
+import OSE_PartCache
+
+# Upper limit of the triangles of a preview mesh.
+MAX_TRIANGLES = 4000
+# Tessellation tolerance relative to the diagonal of the bounding box.
+TESSELLATION_TOLERANCE = 0.01
+# Grid cells along the bounding sphere for the first decimation step.
+DECIMATION_CELLS = 128
+DEFAULT_COLOR = (0.8, 0.8, 0.8)
+
+FORMAT_VERSION = 1
+_MAGIC = b"OSEM"
+# Magic, version, number of vertices, number of triangles, color.
+_HEADER = struct.Struct("<4sIII3f")
+_INDEX_TYPE = "I" if array.array("I").itemsize == 4 else "L"
+
+
+class PreviewMesh:
+    """Triangle mesh in flat arrays.
+
+    *vertices* holds x, y and z of every vertex, *triangles* three vertex
+    indices per triangle. *color* is the RGB color of the part, 0 to 1.
+    """
+
+    def __init__(self, vertices, triangles, color=DEFAULT_COLOR):
+        self.vertices = vertices
+        self.triangles = triangles
+        self.color = tuple(color)
+        if len(vertices) == 0:
+            self.center = (0.0, 0.0, 0.0)
+            self.radius = 1.0
+            return
+        low = [min(vertices[i::3]) for i in range(3)]
+        high = [max(vertices[i::3]) for i in range(3)]
+        self.center = tuple((a + b) / 2.0 for a, b in zip(low, high))
+        self.radius = max(math.sqrt(sum((b - a) ** 2 for a, b in zip(low, high))) / 2.0, 1e-9)
+
+    def vertex_count(self):
+        return len(self.vertices) // 3
+
+    def triangle_count(self):
+        return len(self.triangles) // 3
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def write_mesh(path, mesh):
+    """Write *mesh* to the file *path*."""
+    with Base.atomic_write(path) as tmp_path, open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, FORMAT_VERSION, mesh.vertex_count(),
+                             mesh.triangle_count(), *mesh.color))
+        _little_endian(mesh.vertices).tofile(f)
+        _little_endian(mesh.triangles).tofile(f)
+
+
+def read_mesh(path):
+    """Return the PreviewMesh stored in *path*.
+
+    Raise IOError or OSError if the file cannot be read and ValueError if it
+    is not a complete mesh of this version.
+    """
+    with open(path, "rb") as f:
+        try:
+            magic, version, vertex_count, triangle_count, r, g, b = _HEADER.unpack(
+                f.read(_HEADER.size))
+        except struct.error:
+            raise ValueError("%s is not a preview mesh" % path)
+        if magic != _MAGIC or version != FORMAT_VERSION:
+            raise ValueError("%s is not a preview mesh of version %d" % (path, FORMAT_VERSION))
+        vertices = array.array("f")
+        triangles = array.array(_INDEX_TYPE)
+        try:
+            vertices.fromfile(f, 3 * vertex_count)
+            triangles.fromfile(f, 3 * triangle_count)
+        except EOFError:
+            raise ValueError("%s is truncated" % path)
+    return PreviewMesh(_little_endian(vertices), _little_endian(triangles), (r, g, b))
+
+
+def mesh_from_shape(shape, max_triangles=MAX_TRIANGLES, color=DEFAULT_COLOR):
+    """Return a PreviewMesh of a Part shape with at most *max_triangles* triangles."""
+    tolerance = max(shape.BoundBox.DiagonalLength * TESSELLATION_TOLERANCE, 1e-6)
+    points, facets = shape.tessellate(tolerance)
+    vertices = array.array("f")
+    for p in points:
+        vertices.extend((p.x, p.y, p.z))
+    triangles = array.array(_INDEX_TYPE)
+    for facet in facets:
+        triangles.extend(facet)
+    return decimate(PreviewMesh(vertices, triangles, color), max_triangles)
+
+
+def decimate(mesh, max_triangles):
+    """Return *mesh* reduced to at most *max_triangles* triangles.
+
+    Vertices in the same cell of a grid are merged into their mean and
+    collapsed triangles are dropped. The grid is made coarser until the
+    mesh is small enough.
+    """
+    result = mesh
+    cells = DECIMATION_CELLS
+    while result.triangle_count() > max_triangles and cells >= 2:
+        result = _cluster(mesh, cells)
+        cells = cells * 2 // 3
+    return result
+
+
+def _cluster(mesh, cells):
+    size = 2.0 * mesh.radius / cells
+    cx, cy, cz = mesh.center
+    v = mesh.vertices
+    # Map grid cell -> new vertex index; sums of the coordinates of each new vertex.
+    cell_index = {}
+    sums = []
+    new_index = array.array(_INDEX_TYPE)
+    for i in range(0, len(v), 3):
+        x, y, z = v[i], v[i + 1], v[i + 2]
+        cell = (int((x - cx) // size), int((y - cy) // size), int((z - cz) // size))
+        j = cell_index.get(cell)
+        if j is None:
+            j = cell_index[cell] = len(sums)
+            sums.append([0.0, 0.0, 0.0, 0])
+        s = sums[j]
+        s[0] += x
+        s[1] += y
+        s[2] += z
+        s[3] += 1
+        new_index.append(j)
+    vertices = array.array("f")
+    for sx, sy, sz, n in sums:
+        vertices.extend((sx / n, sy / n, sz / n))
+    triangles = array.array(_INDEX_TYPE)
+    seen = set()
+    t = mesh.triangles
+    for i in range(0, len(t), 3):
+        a, b, c = new_index[t[i]], new_index[t[i + 1]], new_index[t[i + 2]]
+        if a == b or b == c or a == c:
+            continue
+        key = (a, b, c) if a < b and a < c else (b, c, a) if b < c else (c, a, b)
+        if key in seen:
+            continue
+        seen.add(key)
+        triangles.extend((a, b, c))
+    return PreviewMesh(vertices, triangles, mesh.color)
+
+
+def project(mesh, yaw, pitch, width, height):
+    """Return the triangles of *mesh* in a view of *width* x *height* pixels, back to front.
+
+    The view is orthographic with z up; *yaw* turns the part around z and
+    *pitch* is the elevation of the viewer, both in radians. Each item is
+    ((x1, y1, x2, y2, x3, y3), shade) where shade is the cosine of the angle
+    between the triangle and the view direction.
+    """
+    cos_yaw, sin_yaw = math.cos(yaw), math.sin(yaw)
+    cos_pitch, sin_pitch = math.cos(pitch), math.sin(pitch)
+    scale = 0.95 * min(width, height) / (2.0 * mesh.radius)
+    cx, cy, cz = mesh.center
+    # Coordinates in the view: right, up and towards the viewer.
+    right = []
+    up = []
+    depth = []
+    v = mesh.vertices
+    for i in range(0, len(v), 3):
+        x, y, z = v[i] - cx, v[i + 1] - cy, v[i + 2] - cz
+        y1 = x * sin_yaw + y * cos_yaw
+        right.append(x * cos_yaw - y * sin_yaw)
+        up.append(z * cos_pitch + y1 * sin_pitch)
+        depth.append(z * sin_pitch - y1 * cos_pitch)
+    faces = []
+    t = mesh.triangles
+    for i in range(0, len(t), 3):
+        a, b, c = t[i], t[i + 1], t[i + 2]
+        ux, uy, uz = right[b] - right[a], up[b] - up[a], depth[b] - depth[a]
+        vx, vy, vz = right[c] - right[a], up[c] - up[a], depth[c] - depth[a]
+        nx = uy * vz - uz * vy
+        ny = uz * vx - ux * vz
+        nz = ux * vy - uy * vx
+        length = math.sqrt(nx * nx + ny * ny + nz * nz)
+        if length > 0.0:
+            faces.append((depth[a] + depth[b] + depth[c], abs(nz) / length, a, b, c))
+    faces.sort()
+    ox = width / 2.0
+    oy = height / 2.0
+    return [((ox + scale * right[a], oy - scale * up[a], ox + scale * right[b],
+              oy - scale * up[b], ox + scale * right[c], oy - scale * up[c]), shade)
+            for _, shade, a, b, c in faces]
+
+
+class MeshCache:
+    """Disk cache of preview meshes keyed by the content hash of the .fcstd file.
+
+    get() only reads .mesh files, so the dialogs never import or tessellate
+    a shape. put() builds a mesh and runs in the FreeCADCmd workers of
+    OSE_Warmup, build() starts such a worker for one part.
+    """
+
+    def __init__(self, cache_dir, hashes=OSE_PartCache.FILE_HASHES,
+                 max_triangles=MAX_TRIANGLES):
+        self.cache_dir = cache_dir
+        self.hashes = hashes
+        self.max_triangles = max_triangles
+
+    def mesh_path(self, fcstd_path):
+        """Return the .mesh file of *fcstd_path* or None if the part file does not exist."""
+        try:
+            return os.path.join(self.cache_dir, self.hashes.get(fcstd_path) + ".mesh")
+        except (IOError, OSError):
+            return None
+
+    def contains(self, fcstd_path):
+        path = self.mesh_path(fcstd_path)
+        return path is not None and os.path.isfile(path)
+
+    def get(self, fcstd_path):
+        """Return the PreviewMesh of *fcstd_path* or None if it has not been built."""
+        path = self.mesh_path(fcstd_path)
+        if path is None:
+            return None
+        try:
+            return read_mesh(path)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def put(self, fcstd_path, cached_shape):
+        """Build the mesh of the CachedShape of *fcstd_path*, store and return it."""
+        color = (cached_shape.diffuse_color[0][:3] if cached_shape.diffuse_color
+                 else DEFAULT_COLOR)
+        mesh = mesh_from_shape(cached_shape.shape, self.max_triangles, color)
+        path = self.mesh_path(fcstd_path)
+        if path is None:
+            return mesh
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                pass  # Created by another process.
+        try:
+            write_mesh(path, mesh)
+        except (IOError, OSError):
+            pass  # For example a read-only home directory.
+        return mesh
+
+    def build(self, fcstd_path, cancel=None, freecadcmd=None):
+        """Build the mesh of *fcstd_path* in a FreeCADCmd worker and return it.
+
+        The worker takes the shape from the BREP disk cache or extracts it.
+        Return None if the part has no mesh afterwards, for example if
+        FreeCADCmd was not found. Setting the threading.Event *cancel*
+        terminates the worker.
+        """
+        import OSE_Warmup
+        try:
+            OSE_Warmup.warm_up([fcstd_path], freecadcmd, jobs=1, cancel=cancel, meshes=True)
+        except (OSE_Warmup.WarmupError, OSError):
+            return None  # FreeCADCmd was not found or cannot be started.
+        return self.get(fcstd_path)
+
+
+# Mesh cache shared by the dialogs.
+MESH_CACHE = MeshCache(os.path.join(Base.CACHE_PATH, "meshes"))
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# Preview images for catalog rows without a usable Image column.
+#
+# FreeCAD stores a thumbnail in .fcstd files (thumbnails/Thumbnail.png) if
+# the option "Save thumbnail into project file" is enabled. The thumbnail is
+# read directly from the zip archive without opening the document and is
+# cached as a PNG file named after the content hash of the .fcstd file.
+#
+# Example of filling the cache for a whole catalog:
+#
+#     import OSE_PartCatalog, OSE_Previews
+#     table = OSE_PartCatalog.load_catalog(".../tables/winkel.csv")
+#     OSE_Previews.fill_missing_previews(table)
+
+import os
+import zipfile
+from multiprocessing.pool import ThreadPool
+
+import OSE_BasePartLibrary as Base
+import OSE_LibraryPack
+import OSE_PartCache
+
+THUMBNAIL_MEMBER = "thumbnails/Thumbnail.png"
+
+
+def read_thumbnail(fcstd_path):
+    """Return PNG data of the thumbnail embedded in *fcstd_path* or None if it has none.
+
+    Raise IOError, OSError or zipfile.BadZipfile if the archive cannot be read.
+    """
+    with OSE_LibraryPack.open_binary(fcstd_path) as f, zipfile.ZipFile(f) as archive:
+        try:
+            return archive.read(THUMBNAIL_MEMBER)
+        except KeyError:
+            return None  # Saved without thumbnail.
+
+
+def extract_thumbnail(fcstd_path):
+    """Return PNG data of the thumbnail embedded in *fcstd_path* or None."""
+    try:
+        return read_thumbnail(fcstd_path)
+    except (IOError, OSError, zipfile.BadZipfile):
+        return None
+
+
+class ThumbnailCache:
+    """Disk cache of thumbnails extracted from .fcstd files.
+
+    <hash>.png holds the thumbnail. An empty <hash>.none marks files without
+    a thumbnail, so their archives are not opened again. Files which cannot
+    be read are not marked and are tried again by the next get().
+    """
+
+    def __init__(self, cache_dir, hashes=OSE_PartCache.FILE_HASHES):
+        self.cache_dir = cache_dir
+        self.hashes = hashes
+
+    def get(self, fcstd_path):
+        """Return path of the cached thumbnail of *fcstd_path*.
+
+        Return None if it has none or the thumbnail cannot be cached.
+        """
+        try:
+            base = os.path.join(self.cache_dir, self.hashes.get(fcstd_path))
+        except (IOError, OSError):
+            return None  # The part file does not exist.
+        png_path = base + ".png"
+        if os.path.isfile(png_path):
+            return png_path
+        if os.path.isfile(base + ".none"):
+            return None
+        try:
+            data = read_thumbnail(fcstd_path)
+        except (IOError, OSError, zipfile.BadZipfile):
+            return None  # For example a file which is still being written.
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                pass  # Created by another thread.
+        target = png_path if data is not None else base + ".none"
+        try:
+            with Base.atomic_write(target) as tmp_path, open(tmp_path, "wb") as f:
+                if data is not None:
+                    f.write(data)
+        except (IOError, OSError):
+            return None  # For example a read-only home directory.
+        return png_path if data is not None else None
+
+
+# Thumbnail cache shared by the dialogs.
+THUMBNAIL_CACHE = ThumbnailCache(os.path.join(Base.CACHE_PATH, "thumbnails"))
+
+
+def image_path(row):
+    """Return full path of the Image of a catalog row if the file exists, otherwise None."""
+    image = row.get("Image", "")
+    if len(image) > 0:
+        path = os.path.join(Base.PARTS_PATH, image)
+        if OSE_LibraryPack.isfile(path):
+            return path
+    return None
+
+
+def cad_path(row):
+    """Return full path of the Cad file of a catalog row if it is a .fcstd file."""
+    cad = row.get("Cad", "")
+    if cad.lower().endswith(".fcstd"):
+        return os.path.join(Base.PARTS_PATH, cad)
+    return None
+
+
+def preview_path(row):
+    """Return path of a preview image for a catalog row or None.
+
+    The Image column is used if the file exists, otherwise the thumbnail
+    of the Cad file. This may read the .fcstd archive.
+    """
+    path = image_path(row)
+    if path is None:
+        cad = cad_path(row)
+        if cad is not None:
+            path = THUMBNAIL_CACHE.get(cad)
+    return path
+
+
+def fill_missing_previews(table, threads=8):
+    """Extract thumbnails for all rows of *table* without a usable Image.
+
+    Return {part key: thumbnail path or None}.
+    """
+    keys = []
+    cad_paths = []
+    for row_i in range(table.row_count()):
+        row = table.get_row(row_i)
+        cad = cad_path(row)
+        if image_path(row) is None and cad is not None:
+            keys.append(table.get_part_key(row_i))
+            cad_paths.append(cad)
+    if not cad_paths:
+        return {}
+    pool = ThreadPool(threads)
+    try:
+        paths = pool.map(THUMBNAIL_CACHE.get, cad_paths)
+    finally:
+        pool.close()
+        pool.join()
+    return dict(zip(keys, paths))
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# Timing spans for the slow steps of loading catalogs and inserting parts.
+#
+# Wrap a step in a span:
+#
+#     import OSE_Trace
+#     with OSE_Trace.span("open_document", file=filename):
+#         doc = FreeCAD.openDocument(filename)
+#
+# Tracing is off by default and span() then returns a shared object which
+# does nothing. Switch it on with the preference Mod/OSE_PartLibrary, Trace,
+# with the environment variable OSE_PART_LIBRARY_TRACE=<trace file> or with
+# OSE_Trace.enable(). Every finished span is written to the FreeCAD log,
+# indented by its nesting depth. All spans are also collected in a trace
+# file in the Chrome trace event format; open it in chrome://tracing or in
+# https://ui.perfetto.dev to see the steps on a time line.
+
+import atexit
+import json
+import os
+import threading
+import time
+
+import OSE_BasePartLibrary as Base
+
+TRACE_VARIABLE = "OSE_PART_LIBRARY_TRACE"
+
+try:
+    _clock = time.perf_counter
+except AttributeError:  # Python 2
+    _clock = time.time
+
+
+def _log(message):
+    try:
+        import FreeCAD
+    except ImportError:
+        return
+    FreeCAD.Console.PrintLog(message)
+
+
+class _NullSpan(object):
+    """Span used while tracing is off."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span(object):
+    """A named step. Use it as a context manager, see span()."""
+    __slots__ = ("tracer", "name", "args", "start", "depth")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = None
+        self.depth = 0
+
+    def set(self, **args):
+        """Add arguments known only inside the span, for example a result count."""
+        self.args.update(args)
+
+    def __enter__(self):
+        self.depth = self.tracer._push()
+        self.start = _clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = _clock()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer._pop(self, end)
+        return False
+
+
+class Tracer:
+    """Collects finished spans in memory and writes them as a Chrome trace.
+
+    At most *max_events* spans are kept; later ones are only logged. The
+    trace file is rewritten when a top level span ends, but at most once
+    every *save_interval* seconds, and when the process ends.
+    """
+
+    def __init__(self, trace_path=None, log=True, max_events=1000000, save_interval=1.0):
+        self.trace_path = trace_path
+        self.log = log
+        self.max_events = max_events
+        self.save_interval = save_interval
+        self.dropped = 0
+        self._events = []
+        # Reentrant, save() takes it again in events().
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._origin = _clock()
+        self._last_save = 0.0
+
+    def _push(self):
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        return depth
+
+    def _pop(self, span, end):
+        self._local.depth = span.depth
+        duration = end - span.start
+        event = {"name": span.name, "ph": "X", "pid": os.getpid(),
+                 "tid": threading.current_thread().ident,
+                 "ts": (span.start - self._origin) * 1e6, "dur": duration * 1e6}
+        if span.args:
+            event["args"] = span.args
+        with self._lock:
+            if len(self._events) < self.max_events:
+                self._events.append(event)
+            else:
+                self.dropped += 1
+        if self.log:
+            args = ", ".join("%s=%s" % item for item in sorted(span.args.items()))
+            _log("OSE trace: %s%s %.1f ms%s\n" % (
+                "  " * span.depth, span.name, duration * 1000, " (%s)" % args if args else ""))
+        if span.depth == 0 and self.trace_path is not None:
+            with self._lock:
+                if end - self._last_save >= self.save_interval:
+                    self._last_save = end
+                    self.save_quietly()
+
+    def events(self):
+        """Return a copy of the collected events."""
+        with self._lock:
+            return list(self._events)
+
+    def clear(self):
+        with self._lock:
+            del self._events[:]
+            self.dropped = 0
+
+    def save(self, trace_path=None):
+        """Write the collected spans to *trace_path*, by default to the trace file."""
+        trace_path = trace_path or self.trace_path
+        if trace_path is None:
+            return
+        directory = os.path.dirname(os.path.abspath(trace_path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # One writer at a time, so an older trace never replaces a newer one.
+        with self._lock:
+            data = {"traceEvents": self.events(), "displayTimeUnit": "ms",
+                    "otherData": {"dropped": self.dropped}}
+            # Write to a temporary file first, so a viewer never reads half a trace.
+            with Base.atomic_write(trace_path) as tmp_path, open(tmp_path, "w") as f:
+                json.dump(data, f, default=str)  # Any span argument is written.
+
+    def save_quietly(self):
+        """Like save() but log errors; tracing must not break the traced operation."""
+        try:
+            self.save()
+        except Exception as e:
+            _log("OSE trace: could not write %s: %s\n" % (self.trace_path, e))
+
+
+# The active tracer or None if tracing is off.
+_tracer = None
+
+
+def span(name, **args):
+    """Return a context manager which measures the time of the step *name*.
+
+    The keyword arguments are stored with the span. While tracing is off,
+    the call costs one global lookup and returns a shared no-op object.
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return Span(_tracer, name, args)
+
+
+def enabled():
+    return _tracer is not None
+
+
+def tracer():
+    """Return the active Tracer or None."""
+    return _tracer
+
+
+def enable(trace_path=None, log=True):
+    """Start tracing. Spans are written to *trace_path* if it is not None.
+
+    Return the active Tracer. If tracing is already on, only the trace
+    path is changed.
+    """
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(trace_path, log)
+    elif trace_path is not None:
+        _tracer.trace_path = trace_path
+    return _tracer
+
+
+def disable():
+    """Stop tracing and write the trace file."""
+    global _tracer
+    active, _tracer = _tracer, None
+    if active is not None:
+        active.save_quietly()
+
+
+atexit.register(disable)
+
+if os.environ.get(TRACE_VARIABLE):
+    enable(os.environ[TRACE_VARIABLE])
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+# Fill the part shape cache in parallel with headless FreeCAD workers.
+#
+# Run it with plain Python or from the FreeCAD Python console:
+#
+#     python OSE_Warmup.py --freecadcmd /usr/bin/FreeCADCmd --jobs 8
+#
+# Every worker is a FreeCADCmd process which runs this file. It reads part
+# paths from stdin, opens each document, extracts the visible shape with its
+# colors, stores it in OSE_PartCache.DISK_CACHE and reports the result on
+# stdout. Entries are written atomically, so the warm-up can be interrupted
+# with Ctrl+C at any time; the next run continues with the missing parts.
+#
+# OSE_Geometry uses the same workers to measure the shapes, and the preview
+# meshes of OSE_PreviewMesh are built by them.
+
+import collections
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+# The worker runs in FreeCADCmd, which does not have the workbench directory in sys.path.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import OSE_BasePartLibrary as Base  # noqa: E402
+import OSE_LibraryPack  # noqa: E402
+import OSE_Manifest  # noqa: E402
+import OSE_PartCache  # noqa: E402
+import OSE_PreviewMesh  # noqa: E402
+
+WORKER_VARIABLE = "OSE_WARMUP_WORKER"
+# If set, the workers also measure the shapes, see warm_up(). The value "cache"
+# lets them take cached shapes instead of extracting them again.
+MEASURE_VARIABLE = "OSE_WARMUP_MEASURE"
+# If set, the workers also write the preview meshes; "cache" works as above.
+MESH_VARIABLE = "OSE_WARMUP_MESHES"
+# FreeCADCmd prints its own messages to stdout; our lines start with this marker.
+RESULT_MARKER = "OSE_WARMUP_RESULT "
+FREECADCMD_NAMES = ["FreeCADCmd", "freecadcmd", "FreeCADCmd.exe"]
+
+
+class WarmupError(Exception):
+    def __init__(self, message):
+        super(WarmupError, self).__init__(message)
+
+
+def extract_part(filename):
+    """Open *filename* in FreeCAD and return CachedShape of its visible part.
+
+    This is the headless counterpart of the shape resolution in
+    OSE_importPart.importPart. Visibility and view properties are read from
+    GuiDocument.xml because FreeCADCmd does not load view providers.
+    """
+    import FreeCAD
+    import OSE_FCStd
+    filename = OSE_LibraryPack.local_path(filename)
+    view = OSE_FCStd.read_view_properties(
+        filename, ("Visibility", "Transparency", "DiffuseColor") + OSE_PartCache.VIEW_PROPERTIES)
+    doc = FreeCAD.openDocument(filename)
+    try:
+        visible = [obj for obj in doc.Objects
+                   if view.get(obj.Name, {}).get("Visibility", False)
+                   and hasattr(obj, 'Shape') and len(obj.Shape.Faces) > 0
+                   and 'Body' not in obj.Name]
+        if len(visible) != 1:
+            raise WarmupError("%d visible parts, a library part must have exactly one"
+                              % len(visible))
+        obj = visible[0]
+        props = view.get(obj.Name, {})
+        return OSE_PartCache.CachedShape(doc.Label, obj.Shape.copy(),
+                                         OSE_FCStd.diffuse_color(props),
+                                         props.get("Transparency", 0),
+                                         dict((name, props[name])
+                                              for name in OSE_PartCache.VIEW_PROPERTIES
+                                              if name in props))
+    finally:
+        FreeCAD.closeDocument(doc.Name)
+
+
+def _report(result):
+    sys.stdout.write(RESULT_MARKER + json.dumps(result) + "\n")
+    sys.stdout.flush()
+
+
+def run_worker():
+    """Process part paths from stdin until it is closed."""
+    measure = bool(os.environ.get(MEASURE_VARIABLE))
+    meshes = bool(os.environ.get(MESH_VARIABLE))
+    use_cache = "cache" in (os.environ.get(MEASURE_VARIABLE), os.environ.get(MESH_VARIABLE))
+    if measure:
+        import OSE_Geometry
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        path = line.rstrip("\n")
+        start = time.time()
+        try:
+            cached = OSE_PartCache.DISK_CACHE.get(path) if use_cache else None
+            if cached is None:
+                cached = extract_part(path)
+                OSE_PartCache.DISK_CACHE.put(path, cached)
+            result = {"path": path, "error": None}
+            if measure:
+                result["geometry"] = OSE_Geometry.measure(cached.shape)
+            if meshes:
+                OSE_PreviewMesh.MESH_CACHE.put(path, cached)
+            result["time"] = time.time() - start
+            _report(result)
+        except Exception as e:
+            _report({"path": path, "error": "%s: %s" % (type(e).__name__, e),
+                     "time": time.time() - start})
+
+
+class WarmupResult:
+    def __init__(self, path, error, time, geometry=None):
+        self.path = path
+        self.error = error
+        self.time = time
+        # Result of OSE_Geometry.measure() if the shape was measured.
+        self.geometry = geometry
+
+    def ok(self):
+        return self.error is None
+
+
+def find_freecadcmd():
+    """Return path of the FreeCADCmd executable or None."""
+    candidates = []
+    try:
+        import FreeCAD
+        candidates.append(os.path.join(FreeCAD.getHomePath(), "bin"))
+    except ImportError:
+        pass
+    candidates.extend(os.environ.get("PATH", "").split(os.pathsep))
+    for directory in candidates:
+        for name in FREECADCMD_NAMES:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path) and os.access(path, os.X_OK):
+                return path
+    return None
+
+
+def library_parts(parts_path=Base.PARTS_PATH):
+    """Return sorted paths of all .fcstd files under *parts_path*, also in a library pack."""
+    return [p for p in OSE_LibraryPack.list_files(parts_path) if p.lower().endswith(".fcstd")]
+
+
+def _serve(worker, tasks, results):
+    """Feed paths from *tasks* to one worker process and collect its results."""
+    path = None
+    try:
+        while True:
+            try:
+                path = tasks.get_nowait()
+            except queue.Empty:
+                break
+            worker.stdin.write((path + "\n").encode("utf-8"))
+            worker.stdin.flush()
+            while True:
+                line = worker.stdout.readline().decode("utf-8", "replace")
+                if not line:
+                    results.put(WarmupResult(path, "worker exited", 0.0))
+                    return
+                if line.startswith(RESULT_MARKER):
+                    r = json.loads(line[len(RESULT_MARKER):])
+                    results.put(WarmupResult(r["path"], r["error"], r["time"],
+                                             r.get("geometry")))
+                    break
+    except (IOError, OSError, ValueError) as e:
+        # Worker was terminated, for example after Ctrl+C.
+        results.put(WarmupResult(path, "worker failed: %s" % e, 0.0))
+    finally:
+        try:
+            worker.stdin.close()
+        except (IOError, OSError):
+            pass
+
+
+def warm_up(paths=None, freecadcmd=None, jobs=None, force=False, progress=None, cancel=None,
+            measure=False, meshes=False):
+    """Extract the shapes of *paths* into the disk cache with parallel workers.
+
+    :param paths: part files, by default all .fcstd files in Base.PARTS_PATH.
+    :param jobs: number of worker processes, by default the number of CPUs.
+    :param force: also extract parts which are already cached.
+    :param progress: callable(done, total, WarmupResult) called for every part.
+    :param cancel: threading.Event. When it is set, the workers are terminated.
+    :param measure: also measure every shape into WarmupResult.geometry. Cached
+        parts are then read from the disk cache instead of being skipped,
+        unless *force* is set.
+    :param meshes: also write the preview meshes of OSE_PreviewMesh. Parts
+        with a cached shape and a mesh are skipped, cached shapes of the
+        others are used, unless *force* is set.
+    :return: list of WarmupResult, one for every part which was processed.
+        Parts not processed because of a cancel or a dead worker get the
+        error "cancelled" or "worker exited".
+    """
+    if paths is None:
+        paths = library_parts()
+    # Use the stored hashes; only new or changed parts are read to find their cache entries.
+    OSE_Manifest.shared_manifest()
+    if not force and not measure:
+        paths = [p for p in paths if not OSE_PartCache.DISK_CACHE.contains(p)
+                 or meshes and not OSE_PreviewMesh.MESH_CACHE.contains(p)]
+    if not paths:
+        return []
+    if freecadcmd is None:
+        freecadcmd = find_freecadcmd()
+    if freecadcmd is None:
+        raise WarmupError("FreeCADCmd executable not found.")
+    if jobs is None:
+        import multiprocessing
+        jobs = multiprocessing.cpu_count()
+    jobs = max(1, min(jobs, len(paths)))
+
+    tasks = queue.Queue()
+    for p in paths:
+        tasks.put(p)
+    results = queue.Queue()
+    env = dict(os.environ)
+    env[WORKER_VARIABLE] = "1"
+    env["OSE_PART_LIBRARY_CACHE"] = Base.CACHE_PATH
+    if measure:
+        env[MEASURE_VARIABLE] = "extract" if force else "cache"
+    else:
+        env.pop(MEASURE_VARIABLE, None)
+    if meshes:
+        env[MESH_VARIABLE] = "extract" if force else "cache"
+    else:
+        env.pop(MESH_VARIABLE, None)
+    workers = [subprocess.Popen([freecadcmd, os.path.abspath(__file__)], env=env,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+               for _ in range(jobs)]
+    threads = [threading.Thread(target=_serve, args=(w, tasks, results)) for w in workers]
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    done = []
+    try:
+        while len(done) < len(paths) and any(t.is_alive() for t in threads) \
+                or not results.empty():
+            if cancel is not None and cancel.is_set():
+                break
+            try:
+                # Use a timeout, so Ctrl+C is not blocked by the wait.
+                result = results.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            done.append(result)
+            if progress is not None:
+                progress(len(done), len(paths), result)
+    finally:
+        for w in workers:
+            if w.poll() is None:
+                w.terminate()
+        for w in workers:
+            w.wait()
+    _add_unprocessed(paths, done, "cancelled" if cancel is not None and cancel.is_set()
+                     else "worker exited")
+    return done
+
+
+def _add_unprocessed(paths, done, error):
+    """Append a failed WarmupResult to *done* for every path of *paths* without a result."""
+    reported = collections.Counter(r.path for r in done)
+    for p in paths:
+        if reported[p] > 0:
+            reported[p] -= 1
+        else:
+            done.append(WarmupResult(p, error, 0.0))
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Fill the part shape cache in parallel.")
+    parser.add_argument("paths", nargs="*", help="part files (default: the whole library)")
+    parser.add_argument("--freecadcmd", help="FreeCADCmd executable")
+    parser.add_argument("--jobs", "-j", type=int, help="number of workers")
+    parser.add_argument("--force", action="store_true", help="also extract cached parts")
+    parser.add_argument("--meshes", action="store_true",
+                        help="also build the preview meshes of the dialogs")
+    args = parser.parse_args(argv)
+
+    def progress(done, total, result):
+        status = "ok    " if result.ok() else "FAILED"
+        sys.stdout.write("[%d/%d] %s %5.2f s %s\n" % (done, total, status, result.time,
+                                                      result.path))
+        sys.stdout.flush()
+
+    start = time.time()
+    try:
+        results = warm_up(args.paths or None, args.freecadcmd, args.jobs, args.force, progress,
+                          meshes=args.meshes)
+    except KeyboardInterrupt:
+        print("Interrupted. Parts extracted so far stay in the cache.")
+        return 1
+    except WarmupError as e:
+        print(e)
+        return 1
+    failures = [r for r in results if not r.ok()]
+    print("Extracted %d parts in %.1f s into %s" % (
+        len(results) - len(failures), time.time() - start, OSE_PartCache.DISK_CACHE.cache_dir))
+    if failures:
+        print("%d failures:" % len(failures))
+        for r in failures:
+            print("  %s: %s" % (r.path, r.error))
+    return 1 if failures else 0
+
+
+if os.environ.get(WORKER_VARIABLE):
+    run_worker()
+    os._exit(0)  # Do not let FreeCADCmd continue with its own command line.
+elif __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,7 +1,15 @@
 # This file is a partial copy of https://github.com/hamish2014/FreeCAD_assembly2/blob/master/importPart.py
 # From FreeCAD_assembly2 project
 
+import copy
+import os
+
 import FreeCAD
+from PySide import QtGui
+
+import OSE_DocumentIndex
+import OSE_PartCache
+import OSE_Trace
 
 def importPart( filename, partName=None, doc_assembly=None ):
     if doc_assembly == None:
@@ -11,23 +19,23 @@ def importPart( filename, partName=None, doc_assembly=None ):
         FreeCAD.Console.PrintMessage("updating part %s from %s\n" % (partName,filename))
     else:
         FreeCAD.Console.PrintMessage("importing part from %s\n" % filename)
-    doc_already_open = filename in [ d.FileName for d in FreeCAD.listDocuments().values() ]
+    open_doc = OSE_DocumentIndex.open_document(filename)
+    doc_already_open = open_doc is not None
     debugPrint(4, "%s open already %s" % (filename, doc_already_open))
+    # An open document may have unsaved changes, so the cache is only used for closed files.
+    mtime = os.path.getmtime( filename )
+    if not updateExistingPart and not doc_already_open:
+        with OSE_Trace.span("cache_lookup") as span:
+            cached = OSE_PartCache.get_cached_shape( filename, mtime )
+            span.set(hit=cached is not None)
+        if cached is not None:
+            debugPrint(3, 'using cached shape of %s, cache %s\n' % (filename, OSE_PartCache.SHAPE_CACHE.stats()))
+            return importCachedPart( cached, filename, mtime, doc_assembly )
     if doc_already_open:
-        doc = [ d for d in FreeCAD.listDocuments().values() if d.FileName == filename][0]
+        doc = open_doc
     else:
-        if filename.lower().endswith('.fcstd'):
-            debugPrint(4, '  opening %s' % filename)
-            doc = FreeCAD.openDocument(filename)
-            debugPrint(4, '  succesfully opened %s' % filename)
-        else: #trying shaping import http://forum.freecadweb.org/viewtopic.php?f=22&t=12434&p=99772#p99772x
-            import ImportGui
-            doc = FreeCAD.newDocument( os.path.basename(filename) )
-            shapeobj=ImportGui.insert(filename,doc.Name)
-
-    visibleObjects = [ obj for obj in doc.Objects
-                       if hasattr(obj,'ViewObject') and obj.ViewObject.isVisible()
-                       and hasattr(obj,'Shape') and len(obj.Shape.Faces) > 0 and 'Body' not in obj.Name] # len(obj.Shape.Faces) > 0 to avoid sketches, skip Body
+        doc = openSourceDocument( filename )
+    visibleObjects = findVisibleObjects( doc )
 
     debugPrint(3, '%s objects %s' % (doc.Name, doc.Objects))
     if any([ 'importPart' in obj.Content for obj in doc.Objects]) and not len(visibleObjects) == 1:
@@ -61,54 +69,217 @@ def importPart( filename, partName=None, doc_assembly=None ):
             obj.addProperty("App::PropertyBool","updateColors","importPart").updateColors = True
         importUpdateConstraintSubobjects( doc_assembly, obj, obj_to_copy )
     else:
-        partName = findUnusedObjectName( doc.Label + '_', document=doc_assembly )
-        try:
-            obj = doc_assembly.addObject("Part::FeaturePython",partName)
-        except UnicodeEncodeError:
-            safeName = findUnusedObjectName('import_', document=doc_assembly)
-            obj = doc_assembly.addObject("Part::FeaturePython", safeName)
-            obj.Label = findUnusedLabel( doc.Label + '_', document=doc_assembly )
-        obj.addProperty("App::PropertyFile",    "sourceFile",    "importPart").sourceFile = filename
-        obj.addProperty("App::PropertyFloat", "timeLastImport","importPart")
-        obj.setEditorMode("timeLastImport",1)
-        obj.addProperty("App::PropertyBool","fixedPosition","importPart")
-        obj.fixedPosition = not any([i.fixedPosition for i in doc_assembly.Objects if hasattr(i, 'fixedPosition') ])
-        obj.addProperty("App::PropertyBool","updateColors","importPart").updateColors = True
-    obj.Shape = obj_to_copy.Shape.copy()
-    if updateExistingPart:
-        obj.Placement = prevPlacement
-    else:
-        for p in obj_to_copy.ViewObject.PropertiesList: #assuming that the user may change the appearance of parts differently depending on the assembly.
-            if hasattr(obj.ViewObject, p) and p not in ['DiffuseColor']:
-                setattr(obj.ViewObject, p, getattr(obj_to_copy.ViewObject, p))
-        obj.ViewObject.Proxy = ImportedPartViewProviderProxy()
-    if getattr(obj,'updateColors',True):
-        obj.ViewObject.DiffuseColor = copy.copy( obj_to_copy.ViewObject.DiffuseColor )
-        #obj.ViewObject.Transparency = copy.copy( obj_to_copy.ViewObject.Transparency )   # .Transparency property
-        tsp = copy.copy( obj_to_copy.ViewObject.Transparency )   #  .Transparency workaround for FC 0.17 @ Nov 2016
-        if tsp < 100 and tsp!=0:
-            obj.ViewObject.Transparency = tsp+1
-        if tsp == 100:
-            obj.ViewObject.Transparency = tsp-1
-        obj.ViewObject.Transparency = tsp   # .Transparency workaround end 
+        with OSE_Trace.span("add_object"):
+            obj = addImportedPartObject( doc.Label, filename, doc_assembly )
+    with OSE_Trace.span("shape_copy"):
+        obj.Shape = obj_to_copy.Shape.copy()
+    with OSE_Trace.span("view_properties"):
+        if updateExistingPart:
+            obj.Placement = prevPlacement
+        else:
+            #assuming that the user may change the appearance of parts differently depending on the assembly.
+            #The same properties are stored in the shape caches, so a cached import looks the same.
+            setViewProperties( obj, OSE_PartCache.view_properties(obj_to_copy.ViewObject) )
+            obj.ViewObject.Proxy = ImportedPartViewProviderProxy()
+        if getattr(obj,'updateColors',True):
+            setImportedColors( obj, obj_to_copy.ViewObject.DiffuseColor, obj_to_copy.ViewObject.Transparency )
     obj.Proxy = Proxy_importPart()
-    obj.timeLastImport = os.path.getmtime( filename )
+    obj.timeLastImport = mtime
+    if not doc_already_open and not subAssemblyImport: #obj_to_copy of a subassembly is the temporary mux object
+        with OSE_Trace.span("store_cache"):
+            OSE_PartCache.store_cached_shape( filename, mtime, OSE_PartCache.CachedShape(
+                doc.Label, obj_to_copy.Shape.copy(), obj_to_copy.ViewObject.DiffuseColor,
+                obj_to_copy.ViewObject.Transparency,
+                OSE_PartCache.view_properties(obj_to_copy.ViewObject) ) )
     #clean up
     if subAssemblyImport:
         doc_assembly.removeObject(tempPartName)
     if not doc_already_open: #then close again
-        FreeCAD.closeDocument(doc.Name)
-        FreeCAD.setActiveDocument(doc_assembly.Name)
-        FreeCAD.ActiveDocument = doc_assembly
+        with OSE_Trace.span("close_document"):
+            FreeCAD.closeDocument(doc.Name)
+            FreeCAD.setActiveDocument(doc_assembly.Name)
+            FreeCAD.ActiveDocument = doc_assembly
+    return obj
+
+def openSourceDocument( filename ):
+    "Open filename as a new document, files other than .fcstd through ImportGui."
+    if filename.lower().endswith('.fcstd'):
+        debugPrint(4, '  opening %s' % filename)
+        with OSE_Trace.span("open_document"):
+            doc = FreeCAD.openDocument(filename)
+        debugPrint(4, '  succesfully opened %s' % filename)
+    else: #trying shaping import http://forum.freecadweb.org/viewtopic.php?f=22&t=12434&p=99772#p99772x
+        import ImportGui
+        with OSE_Trace.span("import_document"):
+            doc = FreeCAD.newDocument( os.path.basename(filename) )
+            shapeobj=ImportGui.insert(filename,doc.Name)
+    return doc
+
+def findVisibleObjects( doc ):
+    "Return the visible objects of doc which have faces, the candidates for the imported part."
+    with OSE_Trace.span("visible_objects", objects=len(doc.Objects)):
+        return [ obj for obj in doc.Objects
+                 if hasattr(obj,'ViewObject') and obj.ViewObject.isVisible()
+                 and hasattr(obj,'Shape') and len(obj.Shape.Faces) > 0 and 'Body' not in obj.Name] # len(obj.Shape.Faces) > 0 to avoid sketches, skip Body
+
+def loadSourceShape( filename ):
+    """Return CachedShape of the visible part of filename or None.
+
+    The shape caches are used for closed files; on a miss the file is
+    opened, the shape is stored in the caches and the file is closed again.
+    Sub-assemblies and files without exactly one visible part give None.
+    """
+    open_doc = OSE_DocumentIndex.open_document(filename)
+    mtime = os.path.getmtime( filename )
+    if open_doc is None:
+        cached = OSE_PartCache.get_cached_shape( filename, mtime )
+        if cached is not None:
+            return cached
+        active = FreeCAD.ActiveDocument
+        doc = openSourceDocument( filename )
+    else:
+        doc = open_doc
+    try:
+        visibleObjects = findVisibleObjects( doc )
+        if len(visibleObjects) != 1:
+            debugPrint(2, '%s does not have exactly one visible part\n' % filename)
+            return None
+        obj = visibleObjects[0]
+        cached = OSE_PartCache.CachedShape( doc.Label, obj.Shape.copy(),
+                                            obj.ViewObject.DiffuseColor, obj.ViewObject.Transparency,
+                                            OSE_PartCache.view_properties(obj.ViewObject) )
+        if open_doc is None:
+            with OSE_Trace.span("store_cache"):
+                OSE_PartCache.store_cached_shape( filename, mtime, cached )
+        return cached
+    finally:
+        if open_doc is None:
+            with OSE_Trace.span("close_document"):
+                FreeCAD.closeDocument(doc.Name)
+                if active is not None:
+                    FreeCAD.setActiveDocument(active.Name)
+                    FreeCAD.ActiveDocument = active
+
+def importCachedPart( cached, filename, mtime, doc_assembly ):
+    "Add a new part from a CachedShape without opening its source document."
+    with OSE_Trace.span("add_object"):
+        obj = addImportedPartObject( cached.label, filename, doc_assembly )
+    with OSE_Trace.span("shape_copy"):
+        obj.Shape = cached.shape.copy()
+    with OSE_Trace.span("view_properties"):
+        setViewProperties( obj, cached.view_properties )
+        obj.ViewObject.Proxy = ImportedPartViewProviderProxy()
+        setImportedColors( obj, cached.diffuse_color, cached.transparency )
+    obj.Proxy = Proxy_importPart()
+    obj.timeLastImport = mtime
+    return obj
+
+# App::Link exists since FreeCAD 0.19.
+LINKS_SUPPORTED = tuple( int(v) for v in FreeCAD.Version()[:2] ) >= (0, 19)
+
+def importLinkedPart( filename, doc_assembly=None ):
+    """Add an App::Link to the shared geometry of filename.
+
+    The first insert of a file imports it with importPart as a hidden source
+    object, marked with the property sharedGeometry. Every insert adds a
+    link to this source with its own placement and the importPart
+    properties, so repeated parts store and draw one shape.
+    """
+    if doc_assembly == None:
+        doc_assembly = FreeCAD.ActiveDocument
+    if not LINKS_SUPPORTED:
+        debugPrint(2, 'App::Link is not available, importing a copy of %s\n' % filename)
+        return importPart( filename, None, doc_assembly )
+    index = OSE_DocumentIndex.index_for( doc_assembly )
+    label = os.path.splitext( os.path.basename(filename) )[0]
+    source = index.shared_source( filename )
+    if source is None:
+        source = importPart( filename, None, doc_assembly )
+        if source is None:
+            return None
+        # The source is not placed in the assembly, the links are.
+        source.fixedPosition = False
+        source.ViewObject.Visibility = False
+        source.Label = findUnusedLabel( label + '_source_', document=doc_assembly )
+        source.addProperty("App::PropertyBool","sharedGeometry","importPart").sharedGeometry = True
+        source.setEditorMode("sharedGeometry",1)
+    with OSE_Trace.span("add_link"):
+        link = addImportedPartObject( label, filename, doc_assembly, "App::Link" )
+        link.LinkedObject = source
+        link.timeLastImport = source.timeLastImport
+    return link
+
+def updateImportedPart( obj, cached, mtime ):
+    """Replace shape and colors of an imported part by CachedShape cached.
+
+    The placement is kept. A link only gets the new timeLastImport, it
+    shows the shape of its source object.
+    """
+    if obj.TypeId != "App::Link":
+        placement = obj.Placement
+        obj.Shape = cached.shape.copy()
+        obj.Placement = placement
+        if getattr(obj,'updateColors',True):
+            setImportedColors( obj, cached.diffuse_color, cached.transparency )
+    obj.timeLastImport = mtime
+
+def addImportedPartObject( label, filename, doc_assembly, typeId="Part::FeaturePython" ):
+    "Create an empty part object with the importPart properties."
+    index = OSE_DocumentIndex.index_for( doc_assembly )
+    partName = findUnusedObjectName( label + '_', document=doc_assembly )
+    try:
+        obj = doc_assembly.addObject(typeId,partName)
+    except UnicodeEncodeError:
+        safeName = findUnusedObjectName('import_', document=doc_assembly)
+        obj = doc_assembly.addObject(typeId, safeName)
+        obj.Label = findUnusedLabel( label + '_', document=doc_assembly )
+    obj.addProperty("App::PropertyFile",    "sourceFile",    "importPart").sourceFile = filename
+    obj.addProperty("App::PropertyFloat", "timeLastImport","importPart")
+    obj.setEditorMode("timeLastImport",1)
+    obj.addProperty("App::PropertyBool","fixedPosition","importPart")
+    obj.fixedPosition = not index.has_fixed_part()
+    obj.addProperty("App::PropertyBool","updateColors","importPart").updateColors = True
     return obj
 
+def setViewProperties( obj, viewProperties ):
+    "Set the view properties from OSE_PartCache.view_properties() which obj has."
+    for p, value in viewProperties.items():
+        if hasattr(obj.ViewObject, p):
+            setattr(obj.ViewObject, p, value)
+
+def setImportedColors( obj, diffuseColor, transparency ):
+    obj.ViewObject.DiffuseColor = copy.copy( diffuseColor )
+    #obj.ViewObject.Transparency = copy.copy( obj_to_copy.ViewObject.Transparency )   # .Transparency property
+    tsp = copy.copy( transparency )   #  .Transparency workaround for FC 0.17 @ Nov 2016
+    if tsp < 100 and tsp!=0:
+        obj.ViewObject.Transparency = tsp+1
+    if tsp == 100:
+        obj.ViewObject.Transparency = tsp-1
+    obj.ViewObject.Transparency = tsp   # .Transparency workaround end 
+
 class Proxy_importPart:
     def execute(self, shape):
         pass
         
+class ImportedPartViewProviderProxy:
+    def __getstate__(self):
+        return None
+
+    def __setstate__(self, state):
+        return None
+
 def debugPrint(arg1, msg):
     #Ignore arg1
     FreeCAD.Console.PrintLog(msg)
 
-def findUnusedObjectName(alala, document):
-    return "blbalbababa"
+def findUnusedObjectName(base, counterStart=1, fmt='%02i', document=None):
+    "Return the first object name base + number which is not used in the document."
+    if document == None:
+        document = FreeCAD.ActiveDocument
+    return OSE_DocumentIndex.index_for( document ).unused_name( base, counterStart, fmt )
+
+def findUnusedLabel(base, counterStart=1, fmt='%02i', document=None):
+    "Return the first label base + number which is not used in the document."
+    if document == None:
+        document = FreeCAD.ActiveDocument
+    return OSE_DocumentIndex.index_for( document ).unused_label( base, counterStart, fmt )
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# Compare the memory used by catalogs in the old row-wise and in the
+# columnar CsvTable storage.
+#
+# Run it with Python 3 (tracemalloc) from the workbench directory:
+#
+#     python3 benchmarks/bench_memory.py --rows 10000 100000 500000
+#
+# For every size a synthetic catalog is written to a temporary file. The
+# old representation is a list of rows, each a list of strings, and a
+# dictionary built for every row access. The script reports the memory
+# held after loading and the time of 100000 row accesses. Load times are
+# measured while tracemalloc runs and are only comparable with each other.
+
+import csv
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import OSE_PartCatalog as Catalog  # noqa: E402
+
+ACCESSES = 100000
+
+
+def write_catalog(path, rows):
+    """Write a catalog with long repeated path prefixes like the vendor catalogs."""
+    with open(path, "w") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(Catalog.CATALOG_COLUMNS)
+        for i in range(rows):
+            series = 20 + 10 * (i % 4)
+            length = 100 + 5 * (i % 300)
+            writer.writerow([
+                "TS%d-%07d" % (series, i),
+                "T-slot profile %dx%d, length %d mm" % (series, series, length),
+                "basis-set/tslotprofile/images/tslot%d.png" % series,
+                "vendor/tslotprofile/series-%d/tslot%d-%07d.fcstd" % (series, series, i)])
+
+
+class RowTable:
+    """The row-wise storage used before: a list of lists and a dictionary per row access."""
+
+    def __init__(self, path):
+        with open(path, "r") as f:
+            reader = csv.reader(f)
+            self.headers = next(reader)
+            self.data = []
+            self.key_index = {}
+            for row in reader:
+                self.key_index[row[0]] = len(self.data)
+                self.data.append(row)
+
+    def get_row(self, row_index):
+        return dict(zip(self.headers, self.data[row_index]))
+
+
+def measure(load):
+    """Return (object, bytes held after load, load seconds)."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    obj = load()
+    load_time = time.time() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size, load_time
+
+
+def access_time(table, rows):
+    indexes = [random.randrange(rows) for _ in range(ACCESSES)]
+    start = time.time()
+    for i in indexes:
+        row = table.get_row(i)
+        row["Cad"]
+        row["Text"]
+    return time.time() - start
+
+
+def run(rows, directory):
+    path = os.path.join(directory, "catalog_%d.csv" % rows)
+    write_catalog(path, rows)
+    result = {"rows": rows, "file_size": os.path.getsize(path)}
+    for name, load in [("rows", lambda: RowTable(path)),
+                       ("columns", lambda: Catalog.CatalogCache(
+                           index_path=None, streaming_min_bytes=None).get(
+                               path, Catalog.CATALOG_COLUMNS))]:
+        table, size, load_time = measure(load)
+        result[name] = {"bytes": size, "load_time": load_time,
+                        "access_time": access_time(table, rows)}
+        del table
+    os.remove(path)
+    return result
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Compare memory of catalog storages.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--json", help="write all results to this file")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        for rows in args.rows:
+            result = run(rows, directory)
+            results.append(result)
+            old, new = result["rows"], result["columns"]
+            print("%8d rows: rows %7.1f MB, columns %7.1f MB (%.0f%%); "
+                  "load %.2f / %.2f s; %d accesses %.2f / %.2f s" % (
+                      rows, old["bytes"] / 1e6, new["bytes"] / 1e6,
+                      100.0 * new["bytes"] / old["bytes"], old["load_time"], new["load_time"],
+                      ACCESSES, old["access_time"], new["access_time"]))
+    finally:
+        os.rmdir(directory)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
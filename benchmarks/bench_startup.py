@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Measure how long the initialization of the workbench takes.
+#
+# Run it with plain Python and give the FreeCAD executable:
+#
+#     python benchmarks/bench_startup.py --freecad /usr/bin/freecad --runs 5
+#
+# The script starts FreeCAD *runs* times and passes itself as a macro.
+# Inside FreeCAD it activates the workbench, records the time spent in
+# OSE_PartLibraryWorkbench.Initialize() and which heavy modules were imported,
+# writes the result to a JSON file and quits FreeCAD. The first run usually
+# shows the cold disk cache.
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+WORKBENCH = "OSE_PartLibraryWorkbench"
+RESULT_VARIABLE = "OSE_BENCH_STARTUP_RESULT"
+# Modules which should not be imported before the first click on a command.
+DEFERRED_MODULES = ["OSE_PartLibraryGui", "assembly2"]
+
+
+def run_in_freecad(result_path):
+    import FreeCADGui
+    before = set(sys.modules)
+    start = time.time()
+    FreeCADGui.activateWorkbench(WORKBENCH)
+    activation_time = time.time() - start
+    workbench = FreeCADGui.getWorkbench(WORKBENCH)
+    imported = sorted(set(sys.modules) - before)
+    result = {
+        "activation_time": activation_time,
+        "initialization_time": getattr(workbench, "initialization_time", None),
+        "deferred_modules_loaded": [m for m in DEFERRED_MODULES if m in sys.modules],
+        "imported_modules": imported,
+    }
+    with open(result_path, "w") as f:
+        json.dump(result, f)
+    # Do not wait for the event loop; we only need the measurement.
+    os._exit(0)
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Measure workbench initialization time.")
+    parser.add_argument("--freecad", default="freecad", help="FreeCAD executable")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="write all results to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    for run in range(args.runs):
+        fd, result_path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        env = dict(os.environ)
+        env[RESULT_VARIABLE] = result_path
+        start = time.time()
+        subprocess.call([args.freecad, os.path.abspath(__file__)], env=env)
+        process_time = time.time() - start
+        try:
+            with open(result_path) as f:
+                result = json.load(f)
+        except ValueError:
+            sys.stderr.write("Run %d did not produce a result.\n" % run)
+            continue
+        finally:
+            os.remove(result_path)
+        result["process_time"] = process_time
+        results.append(result)
+        print("run %d: initialize %.1f ms, activate %.1f ms, FreeCAD process %.2f s%s" % (
+            run, result["initialization_time"] * 1000, result["activation_time"] * 1000,
+            process_time,
+            ", loaded %s" % ", ".join(result["deferred_modules_loaded"])
+            if result["deferred_modules_loaded"] else ""))
+
+    if not results:
+        return 1
+    print("median initialize %.1f ms over %d runs" % (
+        median([r["initialization_time"] for r in results]) * 1000, len(results)))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if os.environ.get(RESULT_VARIABLE) and "FreeCAD" in sys.modules:
+    run_in_freecad(os.environ[RESULT_VARIABLE])
+elif __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
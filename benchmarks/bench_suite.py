@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+# Headless benchmarks of the catalog, GUI model and insertion code paths.
+#
+# Run it with plain Python from the workbench directory:
+#
+#     python benchmarks/bench_suite.py --json result.json \
+#         --thresholds benchmarks/thresholds.json
+#     python benchmarks/bench_suite.py --quick --baseline result.json --tolerance 0.5
+#
+# FreeCAD, Part and PySide are replaced by the stand-ins in benchmarks/stubs,
+# so the suite runs without FreeCAD and without a display. The stand-ins do
+# no geometry and draw nothing; the numbers measure the Python code of the
+# workbench: CSV parsing, lookups, the Qt models, the search index, the
+# shape caches, the preview meshes and the bookkeeping of importPart.
+#
+# Synthetic catalogs of 10^3 to 10^6 rows are written to a temporary
+# directory. Their Cad column refers to a few small fake .fcstd files.
+# Every benchmark reports the best time in seconds of --repeat runs. The
+# result is a JSON object; with --thresholds (maximum seconds per
+# benchmark) or --baseline (an earlier result) the script exits with status
+# 1 if a benchmark is slower than allowed.
+
+import array
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "stubs"))
+
+# The shape caches must not touch the cache of the user.
+WORK_DIR = tempfile.mkdtemp(prefix="ose-bench-")
+os.environ["OSE_PART_LIBRARY_CACHE"] = os.path.join(WORK_DIR, "cache")
+
+import FreeCAD  # noqa: E402
+import Part  # noqa: E402
+import OSE_BasePartLibrary as Base  # noqa: E402
+import OSE_Bom  # noqa: E402
+import OSE_Geometry  # noqa: E402
+import OSE_ParametricParts  # noqa: E402
+import OSE_PartCache  # noqa: E402
+import OSE_PartCatalog as Catalog  # noqa: E402
+import OSE_PartInsertion  # noqa: E402
+import OSE_PartLibraryGui  # noqa: E402
+import OSE_PartSearch  # noqa: E402
+import OSE_PreviewMesh  # noqa: E402
+import OSE_importPart  # noqa: E402
+
+RESULT_VERSION = 1
+SIZES = [1000, 10000, 100000, 1000000]
+QUICK_SIZES = [1000, 10000]
+# Catalogs larger than this are not indexed for the search benchmarks.
+SEARCH_MAX_ROWS = 100000
+PART_FILES = 50
+INSERT_COUNTS = [1000, 5000]
+QUICK_INSERT_COUNTS = [1000]
+LOOKUPS = 10000
+# Parts of the assembly for the bill of materials.
+BOM_PARTS = 10000
+SEARCH_QUERIES = ["ts20", "0001", "profile 40", "length 105", "t-slot 30 mm"]
+# A benchmark run longer than this is not repeated.
+REPEAT_LIMIT = 1.0
+
+
+def make_part_files(directory, count):
+    """Write *count* minimal .fcstd files with different content and return their paths."""
+    os.makedirs(directory)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, "part%03d.fcstd" % i)
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("Document.xml",
+                             "<Document SchemaVersion=\"4\" Label=\"part%03d\"/>\n" % i)
+        paths.append(path)
+    return paths
+
+
+def make_catalog(path, rows, part_files):
+    """Write a catalog in the layout of the vendor catalogs."""
+    with open(path, "w") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(Catalog.CATALOG_COLUMNS + ["Length"])
+        for i in range(rows):
+            series = 20 + 10 * (i % 4)
+            length = 100 + 5 * (i % 300)
+            writer.writerow([
+                "TS%d-%07d" % (series, i),
+                "T-slot profile %dx%d, length %d mm" % (series, series, length),
+                "images/tslot%d.png" % series,
+                part_files[i % len(part_files)],
+                "%d" % length])
+
+
+def best_time(func, repeat):
+    """Return the shortest run time of *func* in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+        if times[-1] > REPEAT_LIMIT:
+            break
+    return min(times)
+
+
+def reset_shape_caches():
+    OSE_PartCache.SHAPE_CACHE.invalidate()
+    OSE_PartCache.DISK_CACHE.clear()
+
+
+def insert(part_files, count, linked=False):
+    insert_items([(part_files[i % len(part_files)], FreeCAD.Placement())
+                  for i in range(count)], linked)
+
+
+def insert_items(items, linked=False):
+    doc = FreeCAD.newDocument("Assembly")
+    try:
+        report = OSE_PartInsertion.insert_parts(doc, items, linked=linked)
+    finally:
+        FreeCAD.closeDocument(doc.Name)
+    if report.failures():
+        raise RuntimeError(report.failures()[0].error)
+
+
+def refresh(part_files, count):
+    """Return seconds to refresh *count* parts after all part files changed."""
+    doc = FreeCAD.newDocument("Assembly")
+    items = [(part_files[i % len(part_files)], FreeCAD.Placement()) for i in range(count)]
+    try:
+        OSE_PartInsertion.insert_parts(doc, items)
+        for path in part_files:
+            mtime = os.path.getmtime(path) + 1
+            os.utime(path, (mtime, mtime))
+        start = time.time()
+        report = OSE_PartInsertion.refresh_parts(doc)
+        seconds = time.time() - start
+    finally:
+        FreeCAD.closeDocument(doc.Name)
+    if report.errors or report.objects_updated != count:
+        raise RuntimeError(report.summary())
+    return seconds
+
+
+def catalog_benchmarks(results, path, rows, repeat):
+    rng = random.Random(rows)
+    table = Catalog.CsvTable(Catalog.CATALOG_COLUMNS, index_columns=Catalog.CATALOG_INDEX_COLUMNS)
+    results["csv_load/%d" % rows] = best_time(lambda: table.load(path), repeat)
+    keys = [table.get_part_key(rng.randrange(rows)) for _ in range(LOOKUPS)]
+
+    def first_rows():
+        streaming = Catalog.StreamingCsvTable(Catalog.CATALOG_COLUMNS)
+        streaming.open(path)
+        OSE_PartLibraryGui.PartTableModel(streaming)
+    results["streaming_first_rows/%d" % rows] = best_time(first_rows, repeat)
+
+    def find_parts():
+        for key in keys:
+            table.find_part(key)
+    results["find_part_10k/%d" % rows] = best_time(find_parts, repeat)
+
+    model = OSE_PartLibraryGui.PartTableModel(table)
+
+    def row_indexes():
+        for key in keys:
+            model.get_part_row_index(key)
+    results["model_row_index_10k/%d" % rows] = best_time(row_indexes, repeat)
+
+    # Geometry filters of the dialog; the first query sorts the two columns.
+    part_keys = [table.get_part_key(i) for i in range(rows)]
+    columns = dict((name, array.array("d", (rng.uniform(1.0, 500.0) for _ in range(rows))))
+                   for name in OSE_Geometry.COLUMNS)
+    columns["Holes"] = array.array("d", (rng.randrange(9) for _ in range(rows)))
+    geometry = OSE_Geometry.GeometryTable(part_keys, columns)
+    results["geometry_first_query/%d" % rows] = best_time(
+        lambda: OSE_Geometry.GeometryTable(part_keys, columns).find(
+            {"Length": (20.0, 40.0), "Holes": (2.0, None)}), repeat)
+
+    def geometry_queries():
+        for low in range(0, 500, 5):
+            geometry.find({"Length": (low, low + 20.0), "Holes": (2.0, None)})
+    results["geometry_query_100/%d" % rows] = best_time(geometry_queries, repeat)
+
+    def check_table_cold():
+        Catalog.CATALOG_CACHE.invalidate()
+        OSE_PartLibraryGui.gui_check_table(path)
+    results["gui_check_table_cold/%d" % rows] = best_time(check_table_cold, repeat)
+    results["gui_check_table_warm/%d" % rows] = best_time(
+        lambda: OSE_PartLibraryGui.gui_check_table(path), repeat)
+
+    if rows > SEARCH_MAX_ROWS:
+        return
+    index = OSE_PartSearch.SearchIndex(["PartNumber", "Text"])
+
+    def build():
+        index.remove_table(path)
+        index.add_table(path, table)
+    results["search_build/%d" % rows] = best_time(build, repeat)
+
+    def queries():
+        for query in SEARCH_QUERIES:
+            index.search(query, OSE_PartLibraryGui.SearchDialog.MAX_RESULTS)
+    results["search_query/%d" % rows] = best_time(queries, repeat)
+
+
+def mesh_benchmarks(results, repeat):
+    shape = Part.Shape(6)
+    triangles = len(shape.tessellate(0.0)[1])
+    results["mesh_build/%d" % triangles] = best_time(
+        lambda: OSE_PreviewMesh.mesh_from_shape(shape), repeat)
+    mesh = OSE_PreviewMesh.mesh_from_shape(shape)
+    path = os.path.join(WORK_DIR, "preview.mesh")
+    OSE_PreviewMesh.write_mesh(path, mesh)
+    results["mesh_read/%d" % mesh.triangle_count()] = best_time(
+        lambda: OSE_PreviewMesh.read_mesh(path), repeat)
+    # Drawing the preview projects the mesh for every frame.
+    results["mesh_project/%d" % mesh.triangle_count()] = best_time(
+        lambda: OSE_PreviewMesh.project(mesh, 0.5, 0.5, 256, 256), repeat)
+
+
+def bom_benchmarks(results, repeat):
+    """Bill of materials of an assembly with parts of all library catalogs."""
+    sources = []
+    for table_path in Catalog.catalog_table_paths():
+        table = Catalog.load_catalog(table_path)
+        for row_i in range(table.row_count()):
+            cad = table.get_row(row_i)["Cad"]
+            sources.append(cad if OSE_ParametricParts.is_reference(cad)
+                           else os.path.join(Base.PARTS_PATH, cad))
+    doc = FreeCAD.newDocument("Assembly")
+    try:
+        for i in range(BOM_PARTS):
+            OSE_importPart.addImportedPartObject("part", sources[i % len(sources)], doc)
+        path = os.path.join(WORK_DIR, "bom.csv")
+        results["bom_export/%d" % BOM_PARTS] = best_time(
+            lambda: OSE_Bom.export_bom(doc, path), repeat)
+    finally:
+        FreeCAD.closeDocument(doc.Name)
+
+
+def run(sizes, insert_counts, repeat):
+    results = {}
+    part_files = make_part_files(os.path.join(WORK_DIR, "parts"), PART_FILES)
+    # Tables of the benchmark are not in the precompiled index of the library.
+    Catalog.CATALOG_CACHE = Catalog.CatalogCache(index_path=None)
+    for rows in sizes:
+        path = os.path.join(WORK_DIR, "catalog%d.csv" % rows)
+        make_catalog(path, rows, part_files)
+        catalog_benchmarks(results, path, rows, repeat)
+        Catalog.CATALOG_CACHE.invalidate()
+        os.remove(path)
+
+    def import_cold():
+        reset_shape_caches()
+        insert(part_files, len(part_files))
+    results["import_cold/%d" % len(part_files)] = best_time(import_cold, repeat)
+
+    def import_disk_cache():
+        OSE_PartCache.SHAPE_CACHE.invalidate()
+        insert(part_files, len(part_files))
+    results["import_disk_cache/%d" % len(part_files)] = best_time(import_disk_cache, repeat)
+    mesh_benchmarks(results, repeat)
+    bom_benchmarks(results, repeat)
+
+    for count in insert_counts:
+        results["insert_parts/%d" % count] = best_time(
+            lambda: insert(part_files, count), repeat)
+        results["insert_linked_parts/%d" % count] = best_time(
+            lambda: insert(part_files, count, linked=True), repeat)
+        # T-slot profiles of 100 different lengths, generated from the library profile.
+        profiles = [(OSE_ParametricParts.make_reference("tslot", length=100 + 10 * (i % 100)),
+                     FreeCAD.Placement()) for i in range(count)]
+        results["insert_generated_parts/%d" % count] = best_time(
+            lambda: insert_items(profiles), repeat)
+        results["refresh_parts/%d" % count] = min(
+            refresh(part_files, count) for _ in range(repeat))
+    return results
+
+
+def check(results, thresholds=None, baseline=None, tolerance=0.5):
+    """Return a list of messages for benchmarks slower than allowed."""
+    failures = []
+    for name in sorted(results):
+        seconds = results[name]
+        limit = (thresholds or {}).get(name)
+        if limit is not None and seconds > limit:
+            failures.append("%s: %.4f s exceeds the threshold of %.4f s" % (name, seconds, limit))
+        previous = (baseline or {}).get(name)
+        if previous is not None and seconds > previous * (1.0 + tolerance):
+            failures.append("%s: %.4f s is more than %d%% slower than the baseline %.4f s" % (
+                name, seconds, tolerance * 100, previous))
+    return failures
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the headless benchmarks.")
+    parser.add_argument("--sizes", type=int, nargs="+", help="catalog sizes in rows")
+    parser.add_argument("--inserts", type=int, nargs="+", help="numbers of parts to insert")
+    parser.add_argument("--quick", action="store_true", help="only the small sizes")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write the result to this file instead of stdout")
+    parser.add_argument("--thresholds", help="JSON file with the maximum seconds per benchmark")
+    parser.add_argument("--baseline", help="result of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed slowdown against the baseline, 0.5 is 50%%")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    insert_counts = args.inserts or (QUICK_INSERT_COUNTS if args.quick else INSERT_COUNTS)
+    try:
+        results = run(sizes, insert_counts, args.repeat)
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    thresholds = baseline = None
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    failures = check(results, thresholds, baseline, args.tolerance)
+
+    output = {
+        "version": RESULT_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+        "failures": failures,
+    }
+    text = json.dumps(output, indent=2, sort_keys=True)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    for failure in failures:
+        sys.stderr.write("FAILED %s\n" % failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+# Stand-in for the FreeCAD module, used by the headless benchmarks.
+#
+# It implements only what the workbench modules call, with plain Python
+# objects and without geometry. A document opened from a file contains one
+# visible part, like the files of the library. Registered document
+# observers get the signals of object and document changes.
+
+import collections
+import os
+
+
+class _Console:
+    def PrintMessage(self, message):
+        pass
+
+    PrintLog = PrintWarning = PrintError = PrintMessage
+
+
+Console = _Console()
+
+
+class _ParameterGroup:
+    """Parameters always have their default values."""
+
+    def GetBool(self, name, default=False):
+        return default
+
+    def GetInt(self, name, default=0):
+        return default
+
+    def GetFloat(self, name, default=0.0):
+        return default
+
+    def GetString(self, name, default=""):
+        return default
+
+    def SetBool(self, name, value):
+        pass
+
+    SetInt = SetFloat = SetString = SetBool
+
+
+def ParamGet(path):
+    return _ParameterGroup()
+
+
+def Version():
+    return ["0", "19", "0"]
+
+
+def getHomePath():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+class Vector:
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def __mul__(self, factor):
+        return Vector(self.x * factor, self.y * factor, self.z * factor)
+
+
+class Rotation:
+    pass
+
+
+class Placement:
+    def __init__(self, base=None, rotation=None):
+        self.Base = base if base is not None else Vector()
+        self.Rotation = rotation if rotation is not None else Rotation()
+
+
+# Default values of dynamic properties.
+_PROPERTY_DEFAULTS = {"App::PropertyBool": False, "App::PropertyFloat": 0.0,
+                      "App::PropertyFile": "", "App::PropertyString": ""}
+
+
+class ViewObject:
+    def __init__(self):
+        self.Visibility = True
+        self.ShapeColor = (0.8, 0.8, 0.8, 0.0)
+        self.DiffuseColor = [self.ShapeColor]
+        self.Transparency = 0
+        self.LineWidth = 2.0
+        self.DisplayMode = "Flat Lines"
+        self.Proxy = None
+        self.PropertiesList = ["DiffuseColor", "DisplayMode", "LineWidth", "ShapeColor",
+                               "Transparency", "Visibility"]
+
+    def isVisible(self):
+        return self.Visibility
+
+
+_observers = []
+
+
+def addDocumentObserver(observer):
+    _observers.append(observer)
+
+
+def removeDocumentObserver(observer):
+    _observers.remove(observer)
+
+
+def _signal(slot, *args):
+    for observer in _observers:
+        method = getattr(observer, slot, None)
+        if method is not None:
+            method(*args)
+
+
+class DocumentObject:
+    def __init__(self, document, type_id, name):
+        self.Document = document
+        self.TypeId = type_id
+        self.Name = name
+        self.Label = name
+        self.Content = ""
+        self.Placement = Placement()
+        self.Proxy = None
+        self.ViewObject = ViewObject()
+        self.PropertiesList = ["Label", "Placement"]
+
+    def addProperty(self, type_name, name, group="", doc=""):
+        self.PropertiesList.append(name)
+        setattr(self, name, _PROPERTY_DEFAULTS.get(type_name))
+        return self
+
+    def setEditorMode(self, name, mode):
+        pass
+
+    def getPropertyByName(self, name):
+        return getattr(self, name)
+
+    def __setattr__(self, name, value):
+        self.__dict__[name] = value
+        if _observers and "PropertiesList" in self.__dict__:
+            _signal("slotChangedObject", self, name)
+
+
+class Document:
+    def __init__(self, name, filename=""):
+        self.Name = name
+        self.Label = name
+        self.FileName = filename
+        self.Objects = []
+        self.recomputes = 0
+        self._objects = {}
+        # Map name -> last number used to make it unique.
+        self._suffixes = {}
+
+    def addObject(self, type_id, name):
+        unique = name
+        while unique in self._objects:
+            number = self._suffixes.get(name, 0) + 1
+            self._suffixes[name] = number
+            unique = "%s%03d" % (name, number)
+        obj = DocumentObject(self, type_id, unique)
+        self.Objects.append(obj)
+        self._objects[unique] = obj
+        _signal("slotCreatedObject", obj)
+        return obj
+
+    def getObject(self, name):
+        return self._objects.get(name)
+
+    def removeObject(self, name):
+        _signal("slotDeletedObject", self._objects[name])
+        obj = self._objects.pop(name)
+        self.Objects.remove(obj)
+
+    def openTransaction(self, name=""):
+        pass
+
+    def commitTransaction(self):
+        pass
+
+    def abortTransaction(self):
+        pass
+
+    def recompute(self):
+        self.recomputes += 1
+
+
+_documents = collections.OrderedDict()
+ActiveDocument = None
+
+
+def listDocuments():
+    return dict(_documents)
+
+
+def getDocument(name):
+    return _documents[name]
+
+
+def newDocument(name="Unnamed"):
+    global ActiveDocument
+    unique = name
+    number = 0
+    while unique in _documents:
+        number += 1
+        unique = "%s%03d" % (name, number)
+    doc = Document(unique)
+    _documents[unique] = doc
+    ActiveDocument = doc
+    _signal("slotCreatedDocument", doc)
+    return doc
+
+
+def openDocument(filename):
+    """Return a new document with one visible part named after the file."""
+    import Part
+    doc = newDocument(os.path.splitext(os.path.basename(filename))[0])
+    doc.FileName = filename
+    doc.addObject("Part::Feature", "Part").Shape = Part.Shape(faces=6)
+    return doc
+
+
+def closeDocument(name):
+    global ActiveDocument
+    doc = _documents.pop(name)
+    if ActiveDocument is doc:
+        ActiveDocument = None
+    _signal("slotDeletedDocument", doc)
+
+
+def setActiveDocument(name):
+    global ActiveDocument
+    ActiveDocument = _documents[name]
+
+
+def activeDocument():
+    return ActiveDocument
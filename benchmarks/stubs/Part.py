@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# Stand-in for the Part module of FreeCAD, used by the headless benchmarks.
+# A shape only knows its number of plane faces. It is measured as a unit
+# cube and tessellated as one whose faces are fine grids. Slicing gives one
+# wire, extruding a face adds two end faces.
+
+
+# Grid cells along an edge of a tessellated face.
+TESSELLATION_CELLS = 40
+
+
+class _BoundBox:
+    XLength = YLength = ZLength = 1.0
+    DiagonalLength = 3 ** 0.5
+
+
+class Plane:
+    pass
+
+
+class _Face:
+    Surface = Plane()
+    Orientation = "Forward"
+
+
+_FACE = _Face()
+
+
+class Shape:
+    def __init__(self, faces=0):
+        self.Faces = [_FACE] * faces
+        self.MemSize = 1024 * faces
+        self.Volume = 1.0
+        self.Area = float(faces)
+
+    @property
+    def BoundBox(self):
+        return _BoundBox()
+
+    def tessellate(self, tolerance):
+        """Return (points, triangles) of a unit cube with one grid per face."""
+        from FreeCAD import Vector
+        n = TESSELLATION_CELLS
+        points = []
+        triangles = []
+        for axis in range(3):
+            for side in (0.0, 1.0):
+                first = len(points)
+                for i in range(n + 1):
+                    for j in range(n + 1):
+                        coords = [i / float(n), j / float(n)]
+                        coords.insert(axis, side)
+                        points.append(Vector(*coords))
+                for i in range(n):
+                    for j in range(n):
+                        a = first + i * (n + 1) + j
+                        triangles.append((a, a + 1, a + n + 2))
+                        triangles.append((a, a + n + 2, a + n + 1))
+        return points, triangles
+
+    def slice(self, direction, distance):
+        return [Shape()]
+
+    def translate(self, vector):
+        pass
+
+    def extrude(self, vector):
+        return Shape(len(self.Faces) + 2)
+
+    def copy(self):
+        return Shape(len(self.Faces))
+
+    def isNull(self):
+        return not self.Faces
+
+    def exportBrepToString(self):
+        return "STUB %d\n" % len(self.Faces)
+
+    def exportBrep(self, filename):
+        with open(filename, "w") as f:
+            f.write(self.exportBrepToString())
+
+    def importBrep(self, filename):
+        with open(filename) as f:
+            faces = int(f.read().split()[1])
+        self.Faces = [_FACE] * faces
+        self.MemSize = 1024 * faces
+        self.Area = float(faces)
+
+
+def makeFace(wires, face_maker):
+    return Shape(1)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# Stand-in for PySide.QtCore. Signals call their slots directly, thread
+# pools run their tasks in the calling thread and timers fire at once.
+
+
+class Qt:
+    DisplayRole = 0
+    Horizontal = 1
+    Vertical = 2
+    AlignCenter = 0x84
+    AutoText = 2
+    KeepAspectRatio = 1
+    SmoothTransformation = 1
+
+
+def SIGNAL(signature):
+    return signature
+
+
+class _BoundSignal(object):
+    def __init__(self):
+        self._slots = []
+
+    def connect(self, slot):
+        self._slots.append(slot)
+
+    def disconnect(self, slot):
+        self._slots.remove(slot)
+
+    def emit(self, *args):
+        for slot in list(self._slots):
+            slot(*args)
+
+
+class Signal(object):
+    def __init__(self, *types):
+        pass
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        name = "_signal_%d" % id(self)
+        bound = obj.__dict__.get(name)
+        if bound is None:
+            bound = obj.__dict__[name] = _BoundSignal()
+        return bound
+
+
+class QObject(object):
+    def __init__(self, parent=None):
+        self._parent = parent
+
+    @staticmethod
+    def connect(sender, signal, slot):
+        pass
+
+
+class QMetaObject:
+    @staticmethod
+    def connectSlotsByName(obj):
+        pass
+
+
+class QModelIndex:
+    def __init__(self, row=-1, column=-1):
+        self._row = row
+        self._column = column
+
+    def isValid(self):
+        return self._row >= 0
+
+    def row(self):
+        return self._row
+
+    def column(self):
+        return self._column
+
+
+class QAbstractTableModel(QObject):
+    def index(self, row, column, parent=None):
+        return QModelIndex(row, column)
+
+    def beginInsertRows(self, parent, first, last):
+        pass
+
+    def endInsertRows(self):
+        pass
+
+    def beginResetModel(self):
+        pass
+
+    def endResetModel(self):
+        pass
+
+
+class QSize:
+    def __init__(self, width=-1, height=-1):
+        self._width = width
+        self._height = height
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def expandedTo(self, other):
+        return QSize(max(self._width, other.width()), max(self._height, other.height()))
+
+
+class QRunnable(object):
+    def __init__(self):
+        pass
+
+
+class QThreadPool(QObject):
+    def setMaxThreadCount(self, count):
+        pass
+
+    def start(self, runnable):
+        runnable.run()
+
+
+class QSettings:
+    _values = {}
+
+    def __init__(self, organization, application):
+        self._key = (organization, application)
+
+    def value(self, name, default=None):
+        return QSettings._values.get(self._key + (name,), default)
+
+    def setValue(self, name, value):
+        QSettings._values[self._key + (name,)] = value
+
+    def sync(self):
+        pass
+
+
+class QTimer:
+    @staticmethod
+    def singleShot(msec, callback):
+        callback()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# Stand-in for PySide.QtGui. Message boxes count how often they were shown.
+
+from PySide.QtCore import QObject, Signal
+
+
+class QImage:
+    def __init__(self, path=None):
+        self.path = path
+
+    def loadFromData(self, data):
+        self.path = ":memory:"
+        return True
+
+    def isNull(self):
+        return self.path is None
+
+    def scaled(self, *args):
+        return self
+
+
+class QPixmap:
+    def __init__(self, image=None):
+        self.image = image
+
+    @staticmethod
+    def fromImage(image):
+        return QPixmap(image)
+
+
+class QMessageBox:
+    Warning = 2
+    shown = 0
+
+    def __init__(self, *args):
+        self.args = args
+
+    def setText(self, text):
+        self.args = (text,)
+
+    def exec_(self):
+        QMessageBox.shown += 1
+
+    @staticmethod
+    def information(*args):
+        QMessageBox.shown += 1
+
+    warning = information
+
+
+class _Application:
+    def activeWindow(self):
+        return None
+
+
+qApp = _Application()
+
+
+class QApplication:
+    @staticmethod
+    def translate(context, text, *args):
+        return text
+
+
+class QAbstractItemView:
+    SingleSelection = 1
+    SelectRows = 1
+
+
+class QWidget(QObject):
+    def update(self):
+        pass
+
+    def show(self):
+        pass
+
+    def hide(self):
+        pass
+
+    def setVisible(self, visible):
+        pass
+
+
+class QDialog(QObject):
+    def exec_(self):
+        return 0
+
+    def show(self):
+        pass
+
+    def accept(self):
+        pass
+
+    def reject(self):
+        pass
+
+    def done(self, result):
+        pass
+
+
+class QProgressDialog(QDialog):
+    canceled = Signal()
+
+    def __init__(self, label="", cancel_text="", minimum=0, maximum=0, parent=None):
+        super(QProgressDialog, self).__init__(parent)
+        self.label = label
+
+    def setWindowTitle(self, title):
+        pass
+
+    def setMinimumDuration(self, msec):
+        pass
+
+    def setLabelText(self, text):
+        self.label = text
+
+    def setValue(self, value):
+        pass
+
+    def reset(self):
+        pass
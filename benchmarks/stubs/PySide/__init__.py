@@ -0,0 +1,3 @@
+# -*- coding: utf-8 -*-
+# Stand-in for PySide, used by the headless benchmarks. Only the classes
+# used by the workbench modules exist. Models work, widgets do nothing.
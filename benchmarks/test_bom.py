@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# Tests of the mapping from inserted parts back to their catalog rows.
+
+import os
+import unittest
+
+import testsupport
+import OSE_BasePartLibrary as Base
+import OSE_Bom
+
+HEADERS = ["PartNumber", "Text", "Image", "Cad"]
+
+
+class SourceKeysTest(unittest.TestCase):
+
+    def keys(self, source_file):
+        return list(OSE_Bom.source_keys(source_file))
+
+    def test_library_file(self):
+        path = os.path.join(Base.PARTS_PATH, "basis-set", "winkel", "angle4.fcstd")
+        self.assertEqual(self.keys(path), ["basis-set/winkel/angle4.fcstd"])
+
+    def test_replaced_library_file(self):
+        # Assemblies made before the T-slot profiles were generated.
+        path = os.path.join(Base.PARTS_PATH, "basis-set", "tslotprofile", "tslot8.fcstd")
+        self.assertEqual(self.keys(path),
+                         ["basis-set/tslotprofile/tslot8.fcstd", "tslot:length=80"])
+        self.assertEqual(self.keys("C:\\Mod\\lib\\parts\\basis-set\\tslotprofile\\tslot16.fcstd"),
+                         ["basis-set/tslotprofile/tslot16.fcstd", "tslot:length=160"])
+
+    def test_file_of_another_installation(self):
+        self.assertEqual(self.keys("/home/x/Mod/lib/parts/set/a.fcstd"), ["set/a.fcstd"])
+        self.assertEqual(self.keys("C:\\Mod\\lib\\parts\\set\\a.fcstd"), ["set/a.fcstd"])
+        # Every "/parts/" directory is tried, the outermost first.
+        self.assertEqual(self.keys("/data/parts/old/parts/a.fcstd"),
+                         ["old/parts/a.fcstd", "a.fcstd"])
+
+    def test_other_file(self):
+        self.assertEqual(self.keys("/home/x/drawing.fcstd"), [])
+
+    def test_reference(self):
+        self.assertEqual(self.keys("tslot:length=160"), ["tslot:length=160"])
+        # Written again the way make_reference() writes it.
+        self.assertEqual(self.keys("tslot: length = 160.0"), ["tslot:length=160"])
+        # An invalid reference is kept as it is.
+        self.assertEqual(self.keys("tslot:length=-1"), ["tslot:length=-1"])
+
+
+class SourceIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        table_dir = testsupport.temp_dir()
+        self.first = testsupport.write_csv(os.path.join(table_dir, "first.csv"), HEADERS, [
+            ["F1", "Profile", "", "set/a.fcstd"],
+            ["F2", "Other profile", "", "set\\b.fcstd"],
+            ["F3", "Same file again", "", "set/a.fcstd"],
+            ["F4", "Generated", "", "tslot:length=160.0"],
+            ["F5", "Without file", "", ""],
+        ])
+        self.second = testsupport.write_csv(os.path.join(table_dir, "second.csv"), HEADERS, [
+            ["S1", "Also in the first table", "", "set/b.fcstd"],
+            ["S2", "Only here", "", "set/c.fcstd"],
+        ])
+        self.index = OSE_Bom.SourceIndex([self.first, self.second])
+
+    def part(self, name):
+        return os.path.join(Base.PARTS_PATH, "set", name)
+
+    def test_lookup(self):
+        self.assertEqual(self.index.lookup(self.part("a.fcstd")), (self.first, 0))
+        self.assertEqual(self.index.lookup(self.part("c.fcstd")), (self.second, 1))
+        self.assertEqual(self.index.lookup("/other/parts/set/c.fcstd"), (self.second, 1))
+
+    def test_first_row_wins(self):
+        # Backslashes in the Cad column are read as "/".
+        self.assertEqual(self.index.lookup(self.part("b.fcstd")), (self.first, 1))
+
+    def test_reference(self):
+        self.assertEqual(self.index.lookup("tslot:length=160"), (self.first, 3))
+        self.assertEqual(self.index.lookup("tslot:length=170"), None)
+
+    def test_replaced_library_file(self):
+        old = os.path.join(Base.PARTS_PATH, "basis-set", "tslotprofile", "tslot16.fcstd")
+        self.assertEqual(self.index.lookup(old), (self.first, 3))
+        self.assertEqual(self.index.lookup(old.replace("tslot16", "tslot4")), None)
+
+    def test_unknown(self):
+        self.assertEqual(self.index.lookup(self.part("d.fcstd")), None)
+        self.assertEqual(self.index.lookup("/home/x/drawing.fcstd"), None)
+        self.assertEqual(self.index.lookup(""), None)
+
+    def test_shared_index(self):
+        index = OSE_Bom.source_index([self.first, self.second])
+        self.assertIs(OSE_Bom.source_index([self.first, self.second]), index)
+        self.assertTrue(index.is_current([self.first, self.second]))
+        self.assertIsNot(OSE_Bom.source_index([self.second]), index)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# Tests of the cache of loaded catalogs.
+
+import os
+import unittest
+
+import testsupport
+import OSE_PartCatalog as Catalog
+from OSE_PartCatalog import CatalogCache
+
+HEADERS = ["PartNumber", "Text", "Image", "Cad"]
+ROWS = [["P1", "First", "", "a.fcstd"], ["P2", "Second", "", "b.fcstd"]]
+
+
+class CatalogCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = testsupport.temp_dir()
+        self.path = testsupport.write_csv(os.path.join(self.directory, "a.csv"), HEADERS, ROWS)
+        self.cache = CatalogCache(max_entries=2, index_path=None, streaming_min_bytes=None)
+
+    def write(self, name, rows=ROWS):
+        return testsupport.write_csv(os.path.join(self.directory, name), HEADERS, rows)
+
+    def test_unchanged_file_is_a_hit(self):
+        table = self.cache.get(self.path)
+        self.assertIsInstance(table, Catalog.CsvTable)
+        self.assertIs(self.cache.get(self.path), table)
+        # The same file by another path name.
+        self.assertIs(self.cache.get(os.path.join(self.directory, ".", "a.csv")), table)
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (2, 1, 1))
+
+    def test_changed_file_is_loaded_again(self):
+        table = self.cache.get(self.path)
+        self.write("a.csv", ROWS[:1])
+        testsupport.touch_later(self.path)
+        reloaded = self.cache.get(self.path)
+        self.assertIsNot(reloaded, table)
+        self.assertEqual(reloaded.row_count(), 1)
+        self.assertEqual(self.cache.stats()["entries"], 1)
+
+    def test_load_options_are_separate_entries(self):
+        table = self.cache.get(self.path)
+        keyed_by_cad = self.cache.get(self.path, key_column_name="Cad")
+        self.assertIsNot(keyed_by_cad, table)
+        self.assertEqual(keyed_by_cad.find_row_index("b.fcstd"), 1)
+        self.assertIsNot(self.cache.get(self.path, ["Text"]), table)
+
+    def test_least_recently_used_is_evicted(self):
+        b_path = self.write("b.csv")
+        c_path = self.write("c.csv")
+        a = self.cache.get(self.path)
+        b = self.cache.get(b_path)
+        self.assertIs(self.cache.get(self.path), a)  # a is now newer than b.
+        self.cache.get(c_path)
+        self.assertEqual(self.cache.stats()["entries"], 2)
+        self.assertIs(self.cache.get(self.path), a)
+        self.assertIsNot(self.cache.get(b_path), b)
+
+    def test_invalidate(self):
+        a = self.cache.get(self.path)
+        b_path = self.write("b.csv")
+        b = self.cache.get(b_path)
+        self.cache.invalidate(self.path)
+        self.assertIsNot(self.cache.get(self.path), a)
+        self.assertIs(self.cache.get(b_path), b)
+        self.cache.invalidate()
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_missing_file(self):
+        self.assertRaises(OSError, self.cache.get, os.path.join(self.directory, "missing.csv"))
+
+    def test_broken_file_is_not_cached(self):
+        path = self.write("dup.csv", ROWS + ROWS[:1])
+        self.assertRaises(Catalog.CsvError, self.cache.get, path)
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_large_file_is_streamed(self):
+        cache = CatalogCache(index_path=None, streaming_min_bytes=os.path.getsize(self.path))
+        table = cache.get(self.path)
+        self.assertIsInstance(table, Catalog.StreamingCsvTable)
+        self.assertEqual(table.get_part_key(1), "P2")
+        small = self.write("small.csv", ROWS[:1])
+        self.assertIsInstance(cache.get(small), Catalog.CsvTable)
+
+
+if __name__ == "__main__":
+    unittest.main()
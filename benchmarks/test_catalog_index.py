@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Tests of the precompiled catalog index.
+
+import os
+import unittest
+
+import testsupport
+import OSE_BasePartLibrary as Base
+import OSE_CatalogIndex
+import OSE_PartCatalog as Catalog
+
+HEADERS = ["PartNumber", "Text", "Image", "Cad", "Length"]
+ROWS = [
+    ["A-1", "Plain", "images/a.png", "set/a.fcstd", "10"],
+    ["A-2", "Comma, inside", "images/a.png", "set/b.fcstd", "20"],
+    ["A-3", "Two\nlines", "", "set/a.fcstd", "30"],
+    ["A-4", 'Quote "x"', "images/c.png", "tslot:length=160", "40"],
+    ["A-5", "Short row"],
+]
+
+
+def load_csv(path):
+    table = Catalog.CsvTable(Catalog.CATALOG_COLUMNS, index_columns=Catalog.CATALOG_INDEX_COLUMNS)
+    table.load(path)
+    return table
+
+
+class CatalogIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table_dir = testsupport.temp_dir()
+        self.index_path = os.path.join(self.table_dir, Base.CATALOG_INDEX_NAME)
+        self.a_path = testsupport.write_csv(os.path.join(self.table_dir, "a.csv"), HEADERS, ROWS)
+        testsupport.write_csv(os.path.join(self.table_dir, "b.csv"), HEADERS, ROWS[:2])
+        testsupport.write_csv(os.path.join(self.table_dir, "a" + Base.GEOMETRY_TABLE_SUFFIX),
+                              ["PartNumber"], [["A-1"]])
+        self.assertEqual(OSE_CatalogIndex.build_index(self.table_dir, self.index_path),
+                         ["a.csv", "b.csv"])
+        self.index = OSE_CatalogIndex.open_index(self.index_path, self.table_dir)
+        self.assertIsNotNone(self.index)
+
+    def tearDown(self):
+        self.index.close()
+
+    def change_file(self, path, rows):
+        testsupport.write_csv(path, HEADERS, rows)
+        testsupport.touch_later(path)
+
+    def test_lookup(self):
+        self.assertEqual(self.index.table_names(), ["a.csv", "b.csv"])
+        expected = load_csv(self.a_path)
+        table = self.index.table(self.a_path, Catalog.CATALOG_COLUMNS)
+        self.assertTrue(table.has_valid_data)
+        self.assertEqual(table.headers, expected.headers)
+        self.assertEqual(table.row_count(), expected.row_count())
+        for row_i in range(expected.row_count()):
+            self.assertEqual(table.get_row(row_i).to_dict(), expected.get_row(row_i).to_dict())
+        for key in ["A-1", "A-4", "A-5", "missing"]:
+            self.assertEqual(table.find_row_index(key), expected.find_row_index(key))
+        self.assertEqual(table.find_row_indexes("Cad", "set/a.fcstd"), [0, 2])
+
+    def test_tables_not_in_index(self):
+        self.assertIsNone(self.index.table(os.path.join(self.table_dir, "c.csv")))
+        other_dir = testsupport.temp_dir()
+        other = testsupport.write_csv(os.path.join(other_dir, "a.csv"), HEADERS, ROWS)
+        self.assertIsNone(self.index.table(other))
+        self.assertIsNone(self.index.table(self.a_path, key_column_name="Cad"))
+
+    def test_changed_table_is_stale(self):
+        self.assertEqual(self.index.stale_tables(), [])
+        self.change_file(self.a_path, ROWS[:3])
+        self.assertEqual(self.index.stale_tables(), ["a.csv"])
+        self.assertIsNone(self.index.table(self.a_path))
+        self.assertIsNotNone(self.index.table(os.path.join(self.table_dir, "b.csv")))
+
+    def test_new_table_is_stale(self):
+        testsupport.write_csv(os.path.join(self.table_dir, "c.csv"), HEADERS, ROWS)
+        self.assertEqual(self.index.stale_tables(), ["c.csv"])
+
+    def test_ensure_index(self):
+        self.assertFalse(OSE_CatalogIndex.ensure_index(self.table_dir, self.index_path))
+        self.change_file(self.a_path, ROWS[:3])
+        self.assertTrue(OSE_CatalogIndex.ensure_index(self.table_dir, self.index_path))
+        index = OSE_CatalogIndex.open_index(self.index_path, self.table_dir)
+        try:
+            self.assertEqual(index.stale_tables(), [])
+            self.assertEqual(index.table(self.a_path).row_count(), 3)
+        finally:
+            index.close()
+
+    def test_index_file_in_use(self):
+        # On Windows a memory-mapped file cannot be replaced.
+        def replace_file(src, dst):
+            raise OSError(13, "Permission denied", dst)
+        self.change_file(self.a_path, ROWS[:3])
+        with open(self.index_path, "rb") as f:
+            old_index = f.read()
+        Base.replace_file, saved = replace_file, Base.replace_file
+        try:
+            self.assertFalse(OSE_CatalogIndex.ensure_index(self.table_dir, self.index_path))
+        finally:
+            Base.replace_file = saved
+        with open(self.index_path, "rb") as f:
+            self.assertEqual(f.read(), old_index)
+        self.assertEqual(sorted(os.listdir(self.table_dir)),
+                         ["a.csv", "a" + Base.GEOMETRY_TABLE_SUFFIX, "b.csv",
+                          Base.CATALOG_INDEX_NAME])
+        # The changed table is loaded from the CSV file.
+        cache = Catalog.CatalogCache(index_path=self.index_path)
+        table = cache.get(self.a_path, Catalog.CATALOG_COLUMNS)
+        self.assertIsInstance(table, Catalog.CsvTable)
+        self.assertEqual(table.row_count(), 3)
+        self.assertEqual(cache.stats()["index_loads"], 0)
+        cache.get(os.path.join(self.table_dir, "b.csv"), Catalog.CATALOG_COLUMNS)
+        self.assertEqual(cache.stats()["index_loads"], 1)
+
+    def test_broken_index_file(self):
+        path = os.path.join(testsupport.temp_dir(), Base.CATALOG_INDEX_NAME)
+        with open(path, "wb") as f:
+            f.write(b"not an index")
+        self.assertIsNone(OSE_CatalogIndex.open_index(path, self.table_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Tests of the unused object names and labels of a document.
+
+import unittest
+
+import testsupport  # noqa: F401
+import FreeCAD
+from OSE_DocumentIndex import DocumentIndex
+
+
+class UnusedNameTest(unittest.TestCase):
+
+    def setUp(self):
+        self.document = FreeCAD.newDocument("IndexTest")
+        self.index = DocumentIndex(self.document)
+
+    def add(self, name, label=None):
+        obj = self.document.addObject("Part::Feature", name)
+        if label is not None:
+            obj.Label = label
+        self.index.add_object(obj)
+        return obj
+
+    def test_first_number(self):
+        self.assertEqual(self.index.unused_name("Part"), "Part01")
+        self.assertEqual(self.index.unused_name("Part", counter_start=0), "Part00")
+        self.assertEqual(self.index.unused_name("Part", fmt="%03i"), "Part001")
+
+    def test_skips_used_names(self):
+        self.add("Part01")
+        self.add("Part02")
+        self.add("Part04")
+        self.assertEqual(self.index.unused_name("Part"), "Part03")
+        self.add("Part03")
+        self.assertEqual(self.index.unused_name("Part"), "Part05")
+
+    def test_removed_name_is_used_again(self):
+        for name in ["Part01", "Part02", "Part03"]:
+            self.add(name)
+        self.assertEqual(self.index.unused_name("Part"), "Part04")
+        self.index.remove_object(self.document.getObject("Part02"))
+        self.document.removeObject("Part02")
+        self.assertEqual(self.index.unused_name("Part"), "Part02")
+
+    def test_names_created_behind_the_index(self):
+        # Objects added while no observer was listening are found in the document.
+        self.document.addObject("Part::Feature", "Part01")
+        self.document.addObject("Part::Feature", "Part02")
+        self.assertEqual(self.index.unused_name("Part"), "Part03")
+
+    def test_identifier(self):
+        self.assertEqual(self.index.unused_name("M6 screw-20"), "M6_screw_2001")
+        self.assertEqual(self.index.unused_name("6mm"), "_6mm01")
+        self.assertEqual(self.index.unused_name(""), "_01")
+
+    def test_bases_are_independent(self):
+        self.add("Part01")
+        self.assertEqual(self.index.unused_name("Screw"), "Screw01")
+        self.assertEqual(self.index.unused_name("Part"), "Part02")
+
+    def test_rebuild(self):
+        self.document.addObject("Part::Feature", "Part01")
+        self.index.rebuild()
+        self.assertIn("Part01", self.index.names)
+        self.assertEqual(self.index.unused_name("Part"), "Part02")
+
+    def test_unused_label(self):
+        self.add("A", "Part01")
+        self.add("B", "Part02")
+        self.assertEqual(self.index.unused_label("Part"), "Part03")
+        # Labels are not identifiers.
+        self.assertEqual(self.index.unused_label("M6 screw"), "M6 screw01")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Tests of the geometry filters and their range queries.
+
+import array
+import os
+import unittest
+
+import testsupport
+import OSE_BasePartLibrary as Base
+import OSE_Geometry
+from OSE_Geometry import GeometryCache, GeometryError, GeometryTable
+
+CATALOG_HEADERS = ["PartNumber", "Text", "Image", "Cad"]
+
+
+def make_table(values):
+    """Return GeometryTable of parts P0, P1, ... with *values* of (Length, Holes) each."""
+    keys = ["P%d" % i for i in range(len(values))]
+    columns = dict((name, array.array("d", [1.0] * len(values)))
+                   for name in OSE_Geometry.COLUMNS)
+    columns["Length"] = array.array("d", [length for length, _ in values])
+    columns["Holes"] = array.array("d", [holes for _, holes in values])
+    return GeometryTable(keys, columns)
+
+
+class ParseFilterTest(unittest.TestCase):
+
+    def test_ranges(self):
+        self.assertEqual(OSE_Geometry.parse_filter("length 20..40, holes >= 2"),
+                         {"Length": (20.0, 40.0), "Holes": (2.0, None)})
+        self.assertEqual(OSE_Geometry.parse_filter("Mass<=1.5"), {"Mass": (None, 1.5)})
+        self.assertEqual(OSE_Geometry.parse_filter("width ..10"), {"Width": (None, 10.0)})
+        self.assertEqual(OSE_Geometry.parse_filter("width 10.."), {"Width": (10.0, None)})
+        self.assertEqual(OSE_Geometry.parse_filter("height -1.5 .. 2e1"),
+                         {"Height": (-1.5, 20.0)})
+
+    def test_single_value(self):
+        self.assertEqual(OSE_Geometry.parse_filter("holes 4"), {"Holes": (4.0, 4.0)})
+        self.assertEqual(OSE_Geometry.parse_filter("holes = 4"), {"Holes": (4.0, 4.0)})
+
+    def test_alias_and_case(self):
+        self.assertEqual(OSE_Geometry.parse_filter("SIZE 100"), {"Length": (100.0, 100.0)})
+        self.assertEqual(OSE_Geometry.parse_filter("VOLUME>=1"), {"Volume": (1.0, None)})
+
+    def test_empty(self):
+        self.assertEqual(OSE_Geometry.parse_filter(""), {})
+        self.assertEqual(OSE_Geometry.parse_filter(" , ,"), {})
+
+    def test_last_term_of_a_column_wins(self):
+        self.assertEqual(OSE_Geometry.parse_filter("length 10, length 20..30"),
+                         {"Length": (20.0, 30.0)})
+
+    def test_invalid(self):
+        for text in ["length", "length abc", "length 1..2..3", "20..40", "length >= ",
+                     "holes 2 4"]:
+            self.assertRaises(GeometryError, OSE_Geometry.parse_filter, text)
+
+    def test_unknown_column(self):
+        self.assertRaises(GeometryError, OSE_Geometry.parse_filter, "color 3")
+
+
+class GeometryTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = make_table([(40, 2), (10, 0), (30, 4), (20, 2), (30, 0)])
+
+    def test_rows_in_range(self):
+        self.assertEqual(list(self.table.rows_in_range("Length", 20, 30)), [3, 2, 4])
+        self.assertEqual(list(self.table.rows_in_range("Length", None, 15)), [1])
+        self.assertEqual(list(self.table.rows_in_range("Length", 35)), [0])
+        self.assertEqual(list(self.table.rows_in_range("Length", 50)), [])
+
+    def test_find(self):
+        self.assertEqual(self.table.find({"Length": (20.0, 40.0), "Holes": (2.0, None)}),
+                         ["P0", "P2", "P3"])
+        self.assertEqual(self.table.find({"Length": (30.0, 30.0)}), ["P2", "P4"])
+        self.assertEqual(self.table.find({"Holes": (None, 0.0), "Length": (None, 20.0)}),
+                         ["P1"])
+        self.assertEqual(self.table.find({"Length": (41.0, None)}), [])
+
+    def test_find_without_ranges(self):
+        self.assertEqual(self.table.find({}), ["P0", "P1", "P2", "P3", "P4"])
+
+    def test_find_parsed_filter(self):
+        self.assertEqual(self.table.find(OSE_Geometry.parse_filter("size 25..35, holes 4")),
+                         ["P2"])
+
+    def test_unknown_column(self):
+        self.assertRaises(GeometryError, self.table.find, {"Color": (1.0, 2.0)})
+
+    def test_get(self):
+        self.assertEqual(self.table.get("P3")["Length"], 20.0)
+        self.assertEqual(self.table.get("P3")["Holes"], 2.0)
+        self.assertIsNone(self.table.get("P9"))
+
+
+class GeometryFileTest(unittest.TestCase):
+
+    def test_write_and_read(self):
+        path = os.path.join(testsupport.temp_dir(), "parts" + Base.GEOMETRY_TABLE_SUFFIX)
+        values = [0.5, 1e-7, 123456.789, 3.0, 4.0, 5.0, 2.0]
+        rows = [("P1", "set/a.fcstd", "abc", values),
+                ("P2", "tslot:length=160", "def", [0.0] * len(values))]
+        OSE_Geometry.write_table(path, rows)
+        self.assertEqual(OSE_Geometry.read_table(path), rows)
+        self.assertEqual(os.listdir(os.path.dirname(path)), [os.path.basename(path)])
+
+
+class GeometryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = testsupport.temp_dir()
+        self.parts = []
+        for name in ["a", "b"]:
+            part = os.path.join(self.directory, name + ".fcstd")
+            with open(part, "w") as f:
+                f.write(part)
+            self.parts.append(part)
+        self.table_path = self.write_catalog(self.parts)
+        self.write_geometry()
+        self.cache = GeometryCache()
+
+    def write_catalog(self, cads):
+        return testsupport.write_csv(os.path.join(self.directory, "parts.csv"), CATALOG_HEADERS,
+                                     [["P%d" % i, "", "", cad] for i, cad in enumerate(cads)])
+
+    def write_geometry(self):
+        rows = [("P%d" % i, part, OSE_Geometry.current_hash(part), [10.0 * (i + 1)] + [1.0] * 6)
+                for i, part in enumerate(self.parts)]
+        OSE_Geometry.write_table(OSE_Geometry.geometry_path(self.table_path), rows)
+
+    def test_hit(self):
+        table = self.cache.get(self.table_path)
+        self.assertEqual(table.find({}), ["P0", "P1"])
+        self.assertIs(self.cache.get(self.table_path), table)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_changed_geometry_table(self):
+        table = self.cache.get(self.table_path)
+        self.write_geometry()
+        testsupport.touch_later(OSE_Geometry.geometry_path(self.table_path))
+        self.assertIsNot(self.cache.get(self.table_path), table)
+
+    def test_changed_catalog(self):
+        self.cache.get(self.table_path)
+        self.write_catalog([self.parts[0], os.path.join(self.directory, "c.fcstd")])
+        testsupport.touch_later(self.table_path)
+        # The Cad entry of P1 changed since it was measured.
+        self.assertEqual(self.cache.get(self.table_path).find({}), ["P0"])
+
+    def test_changed_part_file(self):
+        table = self.cache.get(self.table_path)
+        # The part files are hashed when their rows are found, not when the table is loaded.
+        with open(self.parts[1], "w") as f:
+            f.write("changed")
+        testsupport.touch_later(self.parts[1])
+        self.assertEqual(table.find({"Length": (None, 100.0)}), ["P0"])
+        self.assertIsNone(table.get("P1"))
+        self.assertEqual(table.get("P0")["Length"], 10.0)
+
+    def test_without_geometry_table(self):
+        os.remove(OSE_Geometry.geometry_path(self.table_path))
+        self.assertIsNone(self.cache.get(self.table_path))
+
+    def test_invalidate(self):
+        table = self.cache.get(self.table_path)
+        self.cache.invalidate(self.table_path)
+        self.assertIsNot(self.cache.get(self.table_path), table)
+
+
+if __name__ == "__main__":
+    unittest.main()
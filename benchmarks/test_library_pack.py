@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# Tests of the part library read from one zip archive.
+
+import os
+import unittest
+import zipfile
+
+import testsupport
+import OSE_BasePartLibrary as Base
+import OSE_LibraryPack
+import OSE_PartCatalog as Catalog
+from OSE_LibraryPack import LibraryPack
+
+HEADERS = ["PartNumber", "Text", "Image", "Cad"]
+
+
+def make_workbench():
+    """Return a directory with tables/ and parts/ like the workbench."""
+    workbench = testsupport.temp_dir()
+    os.makedirs(os.path.join(workbench, "tables"))
+    os.makedirs(os.path.join(workbench, "parts", "set"))
+    testsupport.write_csv(os.path.join(workbench, "tables", "a.csv"), HEADERS,
+                          [["P1", "Part", "set/a.png", "set/a.fcstd"]])
+    for name, data in [("tables/" + Base.CATALOG_INDEX_NAME, b"index"),
+                       ("parts/set/a.fcstd", b"fcstd data"), ("parts/set/a.png", b"png data"),
+                       ("other/b.txt", b"not packed")]:
+        path = os.path.join(workbench, *name.split("/"))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(data)
+    return workbench
+
+
+class LibraryPackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pack_path = os.path.join(testsupport.temp_dir(), "library-pack.zip")
+        self.assertEqual(OSE_LibraryPack.build(self.pack_path, make_workbench()), 3)
+        self.extract_path = testsupport.temp_dir()
+        self.pack = LibraryPack(self.pack_path, self.extract_path)
+
+    def tearDown(self):
+        self.pack.close()
+
+    def test_build(self):
+        with zipfile.ZipFile(self.pack_path) as archive:
+            types = dict((info.filename, info.compress_type) for info in archive.infolist())
+        self.assertEqual(types, {"tables/a.csv": zipfile.ZIP_DEFLATED,
+                                 "parts/set/a.fcstd": zipfile.ZIP_STORED,
+                                 "parts/set/a.png": zipfile.ZIP_STORED})
+        self.assertEqual(os.listdir(os.path.dirname(self.pack_path)), ["library-pack.zip"])
+
+    def test_members(self):
+        path = os.path.join(self.pack_path, "parts", "set", "a.png")
+        self.assertEqual(self.pack.member(path), "parts/set/a.png")
+        self.assertIsNone(self.pack.member(os.path.join(self.extract_path, "a.png")))
+        self.assertTrue(self.pack.isfile("parts/set/a.png"))
+        self.assertFalse(self.pack.isfile("parts/set"))
+        self.assertEqual(self.pack.read("parts/set/a.png"), b"png data")
+        self.assertEqual(self.pack.stamp("parts/set/a.png"), (self.pack.mtime, 8))
+        self.assertEqual(self.pack.files("parts"), ["parts/set/a.fcstd", "parts/set/a.png"])
+        self.assertRaises(IOError, self.pack.read, "parts/set/b.png")
+
+    def test_extract(self):
+        target = self.pack.extract("parts/set/a.fcstd")
+        self.assertEqual(target, os.path.join(self.extract_path, "library-pack", "parts", "set",
+                                              "a.fcstd"))
+        with open(target, "rb") as f:
+            self.assertEqual(f.read(), b"fcstd data")
+        self.assertEqual(self.pack.extracted_member(target), "parts/set/a.fcstd")
+        self.assertEqual(os.listdir(os.path.dirname(target)), ["a.fcstd"])
+        # An unchanged file is not written again.
+        mtime = os.path.getmtime(target)
+        with open(target, "wb") as f:
+            f.write(b"FCSTD DATA")
+        os.utime(target, (mtime, mtime))
+        self.pack.extract("parts/set/a.fcstd")
+        with open(target, "rb") as f:
+            self.assertEqual(f.read(), b"FCSTD DATA")
+        # A file with another time is.
+        os.utime(target, (mtime + 10, mtime + 10))
+        self.pack.extract("parts/set/a.fcstd")
+        with open(target, "rb") as f:
+            self.assertEqual(f.read(), b"fcstd data")
+        self.assertEqual(os.path.getmtime(target), mtime)
+
+
+class ActivePackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pack_path = os.path.join(testsupport.temp_dir(), "library-pack.zip")
+        OSE_LibraryPack.build(self.pack_path, make_workbench())
+        self._library_pack = Base.LIBRARY_PACK
+        Base.LIBRARY_PACK = self.pack_path
+        OSE_LibraryPack.reload()
+
+    def tearDown(self):
+        Base.LIBRARY_PACK = self._library_pack
+        OSE_LibraryPack.reload()
+
+    def test_paths(self):
+        png = os.path.join(self.pack_path, "parts", "set", "a.png")
+        self.assertTrue(OSE_LibraryPack.in_pack(png))
+        self.assertFalse(OSE_LibraryPack.in_pack(self.pack_path))
+        self.assertTrue(OSE_LibraryPack.isfile(png))
+        self.assertFalse(OSE_LibraryPack.isfile(png + ".missing"))
+        self.assertEqual(OSE_LibraryPack.read(png), b"png data")
+        with OSE_LibraryPack.open_binary(png) as f:
+            self.assertEqual(f.read(), b"png data")
+        self.assertEqual(OSE_LibraryPack.stamp(png)[1], 8)
+        self.assertRaises(IOError, OSE_LibraryPack.stamp, png + ".missing")
+        self.assertEqual(OSE_LibraryPack.local_path(self.pack_path), self.pack_path)
+
+    def test_local_path(self):
+        fcstd = os.path.join(self.pack_path, "parts", "set", "a.fcstd")
+        local = OSE_LibraryPack.local_path(fcstd)
+        self.assertFalse(OSE_LibraryPack.in_pack(local))
+        os.remove(local)
+        self.assertEqual(OSE_LibraryPack.update_local(local), local)
+        self.assertTrue(os.path.isfile(local))
+
+    def test_catalog_from_pack(self):
+        cache = Catalog.CatalogCache(index_path=None, streaming_min_bytes=0)
+        path = os.path.join(self.pack_path, "tables", "a.csv")
+        table = cache.get(path, Catalog.CATALOG_COLUMNS)
+        self.assertIsInstance(table, Catalog.CsvTable)
+        self.assertEqual(table.find_part("P1")["Cad"], "set/a.fcstd")
+        self.assertIs(cache.get(path, Catalog.CATALOG_COLUMNS), table)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# Tests of the manifest of the files referenced by the catalogs.
+
+import json
+import os
+import unittest
+import zipfile
+
+import testsupport
+from OSE_Manifest import Manifest
+from OSE_PartCache import FileHashes
+
+HEADERS = ["PartNumber", "Text", "Image", "Cad"]
+
+
+class ManifestCheckTest(unittest.TestCase):
+
+    def setUp(self):
+        self.parts_path = testsupport.temp_dir()
+        os.mkdir(os.path.join(self.parts_path, "set"))
+        self.write_part("set/good.fcstd")
+        with open(os.path.join(self.parts_path, "set/broken.fcstd"), "wb") as f:
+            f.write(b"PK\x03\x04 not an archive")
+        with open(os.path.join(self.parts_path, "set/good.png"), "wb") as f:
+            f.write(b"\x89PNG")
+        self.table = testsupport.write_csv(
+            os.path.join(testsupport.temp_dir(), "parts.csv"), HEADERS, [
+                ["P1", "Good", "set/good.png", "set/good.fcstd"],
+                ["P2", "Same file", "", "set/good.fcstd"],
+                ["P3", "Broken", "", "set/broken.fcstd"],
+                ["P4", "Missing", "set/missing.png", "set/missing.fcstd"],
+                ["P5", "Without file", "", ""],
+                ["P6", "Invalid reference", "", "tslot:length=-1"],
+            ])
+        self.hashes = FileHashes()
+        self.manifest = Manifest(os.path.join(testsupport.temp_dir(), "manifest.json"),
+                                 self.parts_path, self.hashes)
+
+    def write_part(self, name, content="<Document/>"):
+        path = os.path.join(self.parts_path, name)
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("Document.xml", content)
+        return path
+
+    def check(self):
+        return self.manifest.check([self.table], threads=2)
+
+    def test_problems(self):
+        report = self.check()
+        self.assertFalse(report.ok())
+        problems = sorted((p.key, p.column, p.message.split(":")[0]) for p in report.problems)
+        self.assertEqual(problems, [
+            ("P3", "Cad", "broken archive"),
+            ("P4", "Cad", "missing file"),
+            ("P4", "Image", "missing file"),
+            ("P5", "Cad", "no Cad file"),
+            ("P6", "Cad", "tslot")])
+        self.assertEqual((report.files, report.hashed), (5, 3))
+        self.assertEqual(sorted(self.manifest.records),
+                         ["set/broken.fcstd", "set/good.fcstd", "set/good.png"])
+
+    def test_unchanged_files_are_not_read_again(self):
+        self.check()
+        self.assertEqual(self.check().hashed, 0)
+        path = self.write_part("set/good.fcstd", "<Document version='2'/>")
+        testsupport.touch_later(path)
+        report = self.check()
+        self.assertEqual(report.hashed, 1)
+        self.assertEqual(self.hashes.known(path)[1],
+                         self.manifest.records["set/good.fcstd"].sha1)
+
+    def test_unreferenced_records_are_dropped(self):
+        self.check()
+        testsupport.write_csv(self.table, HEADERS, [["P1", "Good", "", "set/good.fcstd"]])
+        testsupport.touch_later(self.table)
+        self.assertTrue(self.check().ok())
+        self.assertEqual(list(self.manifest.records), ["set/good.fcstd"])
+
+    def test_unreadable_table(self):
+        report = self.manifest.check([os.path.join(self.parts_path, "missing.csv")])
+        self.assertEqual([(p.key, p.message.split(":")[0]) for p in report.problems],
+                         [(None, "can not read table")])
+
+    def test_save_and_load(self):
+        self.check()
+        self.manifest.save()
+        hashes = FileHashes()
+        loaded = Manifest(self.manifest.path, self.parts_path, hashes)
+        self.assertTrue(loaded.load())
+        self.assertEqual(sorted(loaded.records), sorted(self.manifest.records))
+        path = os.path.join(self.parts_path, "set/good.fcstd")
+        self.assertEqual(hashes.known(path), self.hashes.known(path))
+        # Loaded records are not read again.
+        self.assertEqual(loaded.check([self.table]).hashed, 0)
+
+    def test_load_other_version(self):
+        self.check()
+        self.manifest.save()
+        with open(self.manifest.path) as f:
+            data = json.load(f)
+        data["version"] = Manifest.FORMAT_VERSION + 1
+        with open(self.manifest.path, "w") as f:
+            json.dump(data, f)
+        self.assertFalse(Manifest(self.manifest.path, self.parts_path, FileHashes()).load())
+
+
+if __name__ == "__main__":
+    unittest.main()
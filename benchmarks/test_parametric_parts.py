@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Tests of the references to generated parts.
+
+import unittest
+
+import testsupport  # noqa: F401
+import OSE_ParametricParts
+from OSE_ParametricParts import ParameterError
+
+
+class ReferenceTest(unittest.TestCase):
+
+    def test_make_and_parse(self):
+        reference = OSE_ParametricParts.make_reference("tslot", length=160.0)
+        self.assertEqual(reference, "tslot:length=160")
+        generator, parameters = OSE_ParametricParts.parse_reference(reference)
+        self.assertIs(generator, OSE_ParametricParts.GENERATORS["tslot"])
+        self.assertEqual(parameters, {"length": 160.0})
+
+    def test_is_reference(self):
+        self.assertTrue(OSE_ParametricParts.is_reference("tslot:length=160"))
+        self.assertFalse(OSE_ParametricParts.is_reference("basis-set/tslotprofile/tslot8.fcstd"))
+        self.assertFalse(OSE_ParametricParts.is_reference("C:\\parts\\a.fcstd"))
+
+    def test_invalid(self):
+        for reference in ["cube:length=1", "tslot:width=1", "tslot:length=abc",
+                          "tslot:length=0", "tslot:"]:
+            self.assertRaises(ParameterError, OSE_ParametricParts.parse_reference, reference)
+
+    def test_legacy_reference(self):
+        self.assertEqual(
+            OSE_ParametricParts.legacy_reference("basis-set/tslotprofile/tslot16.fcstd"),
+            "tslot:length=160")
+        self.assertEqual(
+            OSE_ParametricParts.legacy_reference("basis-set\\tslotprofile\\tslot4.fcstd"),
+            "tslot:length=40")
+        # The profiles with connector holes keep their files.
+        self.assertIsNone(
+            OSE_ParametricParts.legacy_reference("basis-set/tslotprofile/tslot16con.fcstd"))
+
+    def test_legacy_references_are_valid(self):
+        for reference in OSE_ParametricParts.LEGACY_CAD.values():
+            OSE_ParametricParts.parse_reference(reference)
+
+
+if __name__ == "__main__":
+    unittest.main()
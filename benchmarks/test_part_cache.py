@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+# Tests of the shape caches of imported parts.
+
+import json
+import os
+import time
+import unittest
+
+import testsupport
+import FreeCAD
+import Part
+import OSE_importPart
+import OSE_PartCache
+from OSE_PartCache import BrepDiskCache, CachedShape, FileHashes, ShapeCache
+
+
+def cached_shape(faces=6, label="Part"):
+    return CachedShape(label, Part.Shape(faces), [(1.0, 0.0, 0.0, 0.0)], 20,
+                       {"ShapeColor": [0.25, 0.5, 0.75, 0.0], "LineWidth": 2.0})
+
+
+class CachedShapeTest(unittest.TestCase):
+
+    def test_colors_are_tuples(self):
+        cached = cached_shape()
+        self.assertEqual(cached.diffuse_color, [(1.0, 0.0, 0.0, 0.0)])
+        self.assertEqual(cached.view_properties,
+                         {"ShapeColor": (0.25, 0.5, 0.75, 0.0), "LineWidth": 2.0})
+        self.assertEqual(cached.size, 6 * 1024)
+
+    def test_view_properties(self):
+        view = FreeCAD.ViewObject()
+        view.LineWidth = 3.0
+        self.assertEqual(OSE_PartCache.view_properties(view),
+                         {"ShapeColor": view.ShapeColor, "LineWidth": 3.0,
+                          "DisplayMode": "Flat Lines"})
+
+
+class ShapeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ShapeCache(max_bytes=20 * 1024)
+
+    def test_hit_and_miss(self):
+        cached = cached_shape()
+        self.assertIsNone(self.cache.get("/lib/a.fcstd", 1.0))
+        self.cache.put("/lib/a.fcstd", 1.0, cached)
+        self.assertIs(self.cache.get("/lib/a.fcstd", 1.0), cached)
+        self.assertIs(self.cache.get("/lib/./a.fcstd", 1.0), cached)
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (2, 1, 1))
+        self.assertEqual(stats["bytes"], cached.size)
+
+    def test_changed_file(self):
+        self.cache.put("/lib/a.fcstd", 1.0, cached_shape())
+        self.assertIsNone(self.cache.get("/lib/a.fcstd", 2.0))
+        # The outdated version is dropped.
+        self.assertEqual(self.cache.stats()["bytes"], 0)
+        self.cache.put("/lib/a.fcstd", 2.0, cached_shape(4))
+        self.cache.put("/lib/a.fcstd", 3.0, cached_shape(5))
+        self.assertEqual(self.cache.stats()["entries"], 1)
+        self.assertEqual(self.cache.total_bytes, 5 * 1024)
+
+    def test_least_recently_used_is_evicted(self):
+        for name in ["a", "b", "c"]:
+            self.cache.put("/lib/%s.fcstd" % name, 1.0, cached_shape(6))
+        self.assertIsNotNone(self.cache.get("/lib/a.fcstd", 1.0))
+        self.cache.put("/lib/d.fcstd", 1.0, cached_shape(6))
+        self.assertIsNone(self.cache.get("/lib/b.fcstd", 1.0))
+        for name in ["a", "c", "d"]:
+            self.assertIsNotNone(self.cache.get("/lib/%s.fcstd" % name, 1.0))
+        stats = self.cache.stats()
+        self.assertEqual((stats["evictions"], stats["bytes"]), (1, 18 * 1024))
+
+    def test_shape_larger_than_cache(self):
+        self.cache.put("/lib/a.fcstd", 1.0, cached_shape(6))
+        self.cache.put("/lib/b.fcstd", 1.0, cached_shape(21))
+        self.assertIsNone(self.cache.get("/lib/b.fcstd", 1.0))
+        self.assertIsNotNone(self.cache.get("/lib/a.fcstd", 1.0))
+
+    def test_invalidate(self):
+        self.cache.put("/lib/a.fcstd", 1.0, cached_shape(6))
+        self.cache.put("/lib/b.fcstd", 1.0, cached_shape(4))
+        self.cache.invalidate("/lib/a.fcstd")
+        self.assertIsNone(self.cache.get("/lib/a.fcstd", 1.0))
+        self.assertEqual(self.cache.total_bytes, 4 * 1024)
+        self.cache.invalidate()
+        self.assertEqual(self.cache.stats()["entries"], 0)
+        self.assertEqual(self.cache.total_bytes, 0)
+
+
+class ImportCachedPartTest(unittest.TestCase):
+
+    def setUp(self):
+        self.filename = os.path.join(testsupport.temp_dir(), "part.fcstd")
+        with open(self.filename, "wb") as f:
+            f.write(b"part")
+        OSE_PartCache.SHAPE_CACHE.invalidate()
+        OSE_PartCache.DISK_CACHE.clear()
+        self.assembly = FreeCAD.newDocument("Assembly")
+        self._open_document = FreeCAD.openDocument
+        FreeCAD.openDocument = self.open_document
+
+    def tearDown(self):
+        FreeCAD.openDocument = self._open_document
+        FreeCAD.closeDocument(self.assembly.Name)
+
+    def open_document(self, filename):
+        doc = self._open_document(filename)
+        view = doc.Objects[0].ViewObject
+        view.ShapeColor = (0.25, 0.5, 0.75, 0.0)
+        view.DiffuseColor = [(0.5, 0.5, 0.5, 0.0)] * 6
+        view.Transparency = 30
+        view.LineWidth = 3.0
+        view.DisplayMode = "Wireframe"
+        return doc
+
+    def insert(self):
+        obj = OSE_importPart.importPart(self.filename, None, self.assembly)
+        view = obj.ViewObject
+        return dict((name, getattr(view, name, None)) for name in
+                    ("ShapeColor", "DiffuseColor", "Transparency", "LineWidth", "DisplayMode"))
+
+    def test_hit_sets_the_same_view_properties(self):
+        imported = self.insert()
+        self.assertEqual(imported["LineWidth"], 3.0)
+        self.assertEqual(imported["DisplayMode"], "Wireframe")
+        self.assertEqual(imported["Transparency"], 30)
+        self.assertEqual(self.insert(), imported)
+        self.assertEqual(OSE_PartCache.SHAPE_CACHE.stats()["hits"], 1)
+        # From the disk cache.
+        OSE_PartCache.SHAPE_CACHE.invalidate()
+        self.assertEqual(self.insert(), imported)
+        self.assertEqual(OSE_PartCache.DISK_CACHE.hits, 1)
+
+
+class _BrokenShape(Part.Shape):
+    def exportBrep(self, filename):
+        with open(filename, "w") as f:
+            f.write("STUB")
+        raise IOError("disk full")
+
+
+class BrepDiskCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.part_dir = testsupport.temp_dir()
+        self.cache_dir = os.path.join(testsupport.temp_dir(), "shapes")
+        self.cache = BrepDiskCache(self.cache_dir, hashes=FileHashes())
+
+    def part(self, name, content=None):
+        path = os.path.join(self.part_dir, name)
+        with open(path, "w") as f:
+            f.write(content or name)
+        return path
+
+    def entry_paths(self, path):
+        digest = self.cache.source_hash(path)
+        return (os.path.join(self.cache_dir, digest + ".brep"),
+                os.path.join(self.cache_dir, digest + ".json"))
+
+    def age(self, path, seconds):
+        stamp = time.time() - seconds
+        os.utime(self.entry_paths(path)[1], (stamp, stamp))
+
+    def test_put_and_get(self):
+        path = self.part("a.fcstd")
+        self.assertIsNone(self.cache.get(path))
+        self.cache.put(path, cached_shape(4, "A"))
+        self.assertTrue(self.cache.contains(path))
+        self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                         sorted(os.path.basename(p) for p in self.entry_paths(path)))
+        cached = self.cache.get(path)
+        self.assertEqual(cached.label, "A")
+        self.assertEqual(len(cached.shape.Faces), 4)
+        self.assertEqual(cached.diffuse_color, [(1.0, 0.0, 0.0, 0.0)])
+        self.assertEqual(cached.transparency, 20)
+        self.assertEqual(cached.view_properties, cached_shape().view_properties)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_same_content_shares_the_entry(self):
+        self.cache.put(self.part("a.fcstd", "same"), cached_shape())
+        self.assertIsNotNone(self.cache.get(self.part("b.fcstd", "same")))
+
+    def test_changed_file_is_a_miss(self):
+        path = self.part("a.fcstd")
+        self.cache.put(path, cached_shape())
+        self.part("a.fcstd", "changed")
+        testsupport.touch_later(path)
+        self.assertFalse(self.cache.contains(path))
+        self.assertIsNone(self.cache.get(path))
+
+    def test_incomplete_entry_is_a_miss(self):
+        path = self.part("a.fcstd")
+        self.cache.put(path, cached_shape())
+        brep_path, json_path = self.entry_paths(path)
+        os.remove(json_path)
+        self.assertFalse(self.cache.contains(path))
+        self.assertIsNone(self.cache.get(path))
+
+    def test_vanished_shape_is_a_miss(self):
+        # Deleted by cleanup() of another process.
+        path = self.part("a.fcstd")
+        self.cache.put(path, cached_shape())
+        os.remove(self.entry_paths(path)[0])
+        self.assertIsNone(self.cache.get(path))
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_entry_of_other_version_is_a_miss(self):
+        path = self.part("a.fcstd")
+        self.cache.put(path, cached_shape())
+        json_path = self.entry_paths(path)[1]
+        with open(json_path) as f:
+            meta = json.load(f)
+        meta["version"] = BrepDiskCache.FORMAT_VERSION - 1
+        with open(json_path, "w") as f:
+            json.dump(meta, f)
+        self.assertIsNone(self.cache.get(path))
+
+    def test_failed_put_leaves_no_temporary_file(self):
+        path = self.part("a.fcstd")
+        self.cache.put(path, cached_shape())
+        cached = CachedShape("A", _BrokenShape(6), [], 0)
+        self.assertRaises(IOError, self.cache.put, self.part("b.fcstd"), cached)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                         sorted(os.path.basename(p) for p in self.entry_paths(path)))
+
+    def test_cleanup_deletes_least_recently_used(self):
+        paths = [self.part(name) for name in ["a.fcstd", "b.fcstd", "c.fcstd"]]
+        for i, path in enumerate(paths):
+            self.cache.put(path, cached_shape())
+            self.age(path, 100 - i)
+        self.assertIsNotNone(self.cache.get(paths[0]))  # a is now the newest entry.
+        entry_size = self.cache.stats()["bytes"] // 3
+        self.assertEqual(self.cache.cleanup(2 * entry_size), 1)
+        self.assertFalse(self.cache.contains(paths[1]))
+        self.assertTrue(self.cache.contains(paths[0]))
+        self.assertTrue(self.cache.contains(paths[2]))
+        self.assertEqual(self.cache.clear(), 2)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_put_keeps_the_size_below_max_bytes(self):
+        path = self.part("a.fcstd")
+        self.cache.put(path, cached_shape())
+        entry_size = self.cache.stats()["bytes"]
+        self.cache.max_bytes = int(2.5 * entry_size)
+        for name in ["b.fcstd", "c.fcstd", "d.fcstd"]:
+            self.age(path, 100)
+            path = self.part(name)
+            self.cache.put(path, cached_shape())
+        stats = self.cache.stats()
+        # Every put above max_bytes deleted entries down to CLEANUP_FRACTION of it.
+        self.assertEqual(stats["entries"], 2)
+        self.assertTrue(stats["bytes"] <= self.cache.max_bytes * BrepDiskCache.CLEANUP_FRACTION)
+        self.assertEqual(self.cache._total_bytes, stats["bytes"])
+        self.assertTrue(self.cache.contains(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
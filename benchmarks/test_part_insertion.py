@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# Tests of the batch insertion of library parts.
+
+import os
+import unittest
+
+import testsupport
+import FreeCAD
+import OSE_BasePartLibrary as Base
+import OSE_importPart
+import OSE_PartInsertion
+
+HEADERS = ["PartNumber", "Text", "Image", "Cad"]
+
+
+class InsertPartsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = testsupport.write_csv(
+            os.path.join(testsupport.temp_dir(), "parts.csv"), HEADERS, [
+                ["T1", "T connector", "", "basis-set/verbinder/tcon.fcstd"],
+                ["L1", "L connector", "", "basis-set/verbinder/lcon.fcstd"],
+                ["S1", "Profile", "", "tslot:length=160"],
+            ])
+        self.document = FreeCAD.newDocument("Insertion")
+
+    def tearDown(self):
+        FreeCAD.closeDocument(self.document.Name)
+
+    def insert(self, items, linked=False):
+        return OSE_PartInsertion.insert_parts(self.document, items, [self.table], linked=linked)
+
+    def test_batch(self):
+        placement = FreeCAD.Placement(FreeCAD.Vector(0, 0, 100))
+        report = self.insert([("T1", placement), ("basis-set/verbinder/lcon.fcstd", None),
+                              ("S1", None)])
+        self.assertEqual(report.failures(), [])
+        self.assertEqual(len(report.objects()), 3)
+        first, second, third = report.results
+        self.assertEqual(first.cad_path,
+                         os.path.join(Base.PARTS_PATH, "basis-set/verbinder/tcon.fcstd"))
+        self.assertIs(first.obj.Placement, placement)
+        self.assertEqual(first.obj.sourceFile, first.cad_path)
+        self.assertEqual(second.obj.sourceFile,
+                         os.path.join(Base.PARTS_PATH, "basis-set/verbinder/lcon.fcstd"))
+        self.assertEqual(third.cad_path, "tslot:length=160")
+        self.assertEqual(third.obj.sourceFile, "tslot:length=160")
+        self.assertEqual(self.document.recomputes, 1)
+        self.assertTrue(report.summary().endswith(
+            "Inserted 3 of 3 parts in %.1f ms (recompute %.1f ms)"
+            % (report.total_time * 1000, report.recompute_time * 1000)))
+
+    def test_failed_items_do_not_stop_the_batch(self):
+        report = self.insert([("X1", None), ("set/missing.fcstd", None), ("L1", None)])
+        self.assertEqual([r.ok() for r in report.results], [False, False, True])
+        self.assertIn("X1", report.results[0].error)
+        self.assertIn("missing.fcstd", report.results[1].error)
+        self.assertEqual(report.objects(), [report.results[2].obj])
+        self.assertEqual(self.document.recomputes, 1)
+        self.assertIn("X1  FAILED: ", report.summary())
+
+    def test_unexpected_exception_is_recorded(self):
+        def import_part(filename, part_name=None, doc_assembly=None):
+            raise RuntimeError("broken shape")
+        saved = OSE_importPart.importPart
+        OSE_importPart.importPart = import_part
+        try:
+            report = self.insert([("T1", None), ("S1", None)])
+        finally:
+            OSE_importPart.importPart = saved
+        self.assertEqual(report.results[0].error, "RuntimeError: broken shape")
+        self.assertTrue(report.results[1].ok())
+
+    def test_linked(self):
+        report = self.insert([("T1", None), ("T1", None)], linked=True)
+        self.assertEqual(report.failures(), [])
+        links = report.objects()
+        self.assertEqual([obj.TypeId for obj in links], ["App::Link", "App::Link"])
+        self.assertIs(links[0].LinkedObject, links[1].LinkedObject)
+        self.assertEqual(self.document.recomputes, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
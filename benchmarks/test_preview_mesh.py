@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Tests of the preview mesh files.
+
+import array
+import os
+import stat
+import sys
+import threading
+import unittest
+
+import testsupport
+import Part
+import OSE_PartCache
+import OSE_PreviewMesh
+from OSE_PreviewMesh import MeshCache, PreviewMesh
+
+# Stands in for FreeCADCmd: runs the real worker with the stub modules.
+FREECADCMD = """#!/bin/sh
+PYTHONPATH=%(stubs)s exec %(python)s "$@"
+"""
+
+
+def tetrahedron():
+    vertices = array.array("f", [0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1.5])
+    triangles = array.array(OSE_PreviewMesh._INDEX_TYPE, [0, 2, 1, 0, 1, 3, 0, 3, 2, 1, 2, 3])
+    return PreviewMesh(vertices, triangles, (0.25, 0.5, 1.0))
+
+
+class MeshFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = testsupport.temp_dir()
+        self.path = os.path.join(self.directory, "mesh.bin")
+
+    def assert_same_meshes(self, mesh, expected):
+        self.assertEqual(list(mesh.vertices), list(expected.vertices))
+        self.assertEqual(list(mesh.triangles), list(expected.triangles))
+        self.assertEqual(mesh.color, expected.color)
+        self.assertEqual(mesh.center, expected.center)
+        self.assertEqual(mesh.radius, expected.radius)
+
+    def test_round_trip(self):
+        mesh = tetrahedron()
+        OSE_PreviewMesh.write_mesh(self.path, mesh)
+        read = OSE_PreviewMesh.read_mesh(self.path)
+        self.assertEqual(read.vertex_count(), 4)
+        self.assertEqual(read.triangle_count(), 4)
+        self.assert_same_meshes(read, mesh)
+        self.assertEqual(os.listdir(self.directory), ["mesh.bin"])
+
+    def test_round_trip_of_tessellated_shape(self):
+        # A color which float32 stores exactly.
+        mesh = OSE_PreviewMesh.mesh_from_shape(Part.Shape(6), max_triangles=500,
+                                               color=(0.25, 0.5, 0.75))
+        self.assertTrue(0 < mesh.triangle_count() <= 500)
+        OSE_PreviewMesh.write_mesh(self.path, mesh)
+        self.assert_same_meshes(OSE_PreviewMesh.read_mesh(self.path), mesh)
+
+    def test_empty_mesh(self):
+        mesh = PreviewMesh(array.array("f"), array.array(OSE_PreviewMesh._INDEX_TYPE))
+        OSE_PreviewMesh.write_mesh(self.path, mesh)
+        read = OSE_PreviewMesh.read_mesh(self.path)
+        self.assertEqual(read.vertex_count(), 0)
+        self.assertEqual(read.triangle_count(), 0)
+        self.assertEqual(read.color, tuple(array.array("f", OSE_PreviewMesh.DEFAULT_COLOR)))
+
+    def test_replace(self):
+        OSE_PreviewMesh.write_mesh(self.path, tetrahedron())
+        mesh = PreviewMesh(array.array("f", [0, 0, 0, 2, 0, 0, 0, 2, 0]),
+                           array.array(OSE_PreviewMesh._INDEX_TYPE, [0, 1, 2]))
+        OSE_PreviewMesh.write_mesh(self.path, mesh)
+        self.assertEqual(OSE_PreviewMesh.read_mesh(self.path).triangle_count(), 1)
+
+    def test_truncated_file(self):
+        OSE_PreviewMesh.write_mesh(self.path, tetrahedron())
+        with open(self.path, "rb") as f:
+            data = f.read()
+        for size in [0, 10, len(data) - 4]:
+            with open(self.path, "wb") as f:
+                f.write(data[:size])
+            self.assertRaises(ValueError, OSE_PreviewMesh.read_mesh, self.path)
+
+    def test_other_file(self):
+        with open(self.path, "wb") as f:
+            f.write(b"PNG" + b"\0" * 100)
+        self.assertRaises(ValueError, OSE_PreviewMesh.read_mesh, self.path)
+
+    def test_missing_file(self):
+        self.assertRaises((IOError, OSError), OSE_PreviewMesh.read_mesh,
+                          os.path.join(self.directory, "missing.bin"))
+
+
+class MeshCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = testsupport.temp_dir()
+        self.part = os.path.join(self.directory, "part.fcstd")
+        with open(self.part, "wb") as f:
+            f.write(b"first part")
+        self.cache = MeshCache(os.path.join(self.directory, "meshes"), max_triangles=200)
+        self.shape = OSE_PartCache.CachedShape("Part", Part.Shape(6), [(0.25, 0.5, 0.75, 0.0)],
+                                               0)
+
+    def test_put_and_get(self):
+        self.assertIsNone(self.cache.get(self.part))
+        self.assertFalse(self.cache.contains(self.part))
+        mesh = self.cache.put(self.part, self.shape)
+        self.assertTrue(0 < mesh.triangle_count() <= 200)
+        self.assertEqual(mesh.color, (0.25, 0.5, 0.75))
+        self.assertTrue(self.cache.contains(self.part))
+        self.assertEqual(list(self.cache.get(self.part).triangles), list(mesh.triangles))
+
+    def test_default_color(self):
+        shape = OSE_PartCache.CachedShape("Part", Part.Shape(6), [], 0)
+        self.assertEqual(self.cache.put(self.part, shape).color, OSE_PreviewMesh.DEFAULT_COLOR)
+
+    def test_changed_part(self):
+        self.cache.put(self.part, self.shape)
+        with open(self.part, "wb") as f:
+            f.write(b"second part")
+        testsupport.touch_later(self.part)
+        self.assertIsNone(self.cache.get(self.part))
+
+    def test_missing_part(self):
+        missing = os.path.join(self.directory, "missing.fcstd")
+        self.assertIsNone(self.cache.mesh_path(missing))
+        self.assertIsNone(self.cache.get(missing))
+        self.assertFalse(self.cache.contains(missing))
+
+    def test_unreadable_mesh(self):
+        os.makedirs(self.cache.cache_dir)
+        with open(self.cache.mesh_path(self.part), "wb") as f:
+            f.write(b"OSEM")
+        self.assertIsNone(self.cache.get(self.part))
+
+    def test_build_without_freecadcmd(self):
+        missing = os.path.join(self.directory, "FreeCADCmd")
+        self.assertIsNone(self.cache.build(self.part, freecadcmd=missing))
+
+
+@unittest.skipIf(os.name == "nt", "the FreeCADCmd stand-in is a shell script")
+class BuildMeshTest(unittest.TestCase):
+    """The shared mesh cache filled by a worker process."""
+
+    def setUp(self):
+        self.directory = testsupport.temp_dir()
+        self.part = os.path.join(self.directory, "part.fcstd")
+        # Meshes are named after the content, each test needs another part.
+        with open(self.part, "w") as f:
+            f.write(self.part)
+        self.freecadcmd = os.path.join(self.directory, "FreeCADCmd")
+        with open(self.freecadcmd, "w") as f:
+            f.write(FREECADCMD % {"stubs": os.path.join(testsupport.TEST_DIR, "stubs"),
+                                  "python": sys.executable})
+        os.chmod(self.freecadcmd, os.stat(self.freecadcmd).st_mode | stat.S_IXUSR)
+        OSE_PartCache.DISK_CACHE.put(self.part, OSE_PartCache.CachedShape(
+            "Part", Part.Shape(6), [(0.25, 0.5, 0.75, 0.0)], 0))
+
+    def test_build(self):
+        mesh = OSE_PreviewMesh.MESH_CACHE.build(self.part, freecadcmd=self.freecadcmd)
+        self.assertIsNotNone(mesh)
+        self.assertEqual(mesh.color, (0.25, 0.5, 0.75))
+        self.assertTrue(OSE_PreviewMesh.MESH_CACHE.contains(self.part))
+
+    def test_cancelled_build(self):
+        cancel = threading.Event()
+        cancel.set()
+        self.assertIsNone(OSE_PreviewMesh.MESH_CACHE.build(self.part, cancel, self.freecadcmd))
+        self.assertFalse(OSE_PreviewMesh.MESH_CACHE.contains(self.part))
+
+
+if __name__ == "__main__":
+    unittest.main()
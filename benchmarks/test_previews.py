@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Tests of the thumbnails extracted from .fcstd files.
+
+import os
+import unittest
+import zipfile
+
+import testsupport
+import OSE_Previews
+from OSE_PartCache import FileHashes
+from OSE_Previews import ThumbnailCache
+
+PNG = b"\x89PNG\r\n\x1a\n thumbnail"
+
+
+class ThumbnailCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.part_dir = testsupport.temp_dir()
+        self.cache_dir = os.path.join(testsupport.temp_dir(), "thumbnails")
+        self.cache = ThumbnailCache(self.cache_dir, FileHashes())
+
+    def fcstd(self, name, thumbnail=None):
+        path = os.path.join(self.part_dir, name)
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("Document.xml", "<Document/>")
+            if thumbnail is not None:
+                archive.writestr(OSE_Previews.THUMBNAIL_MEMBER, thumbnail)
+        return path
+
+    def test_thumbnail(self):
+        path = self.fcstd("a.fcstd", PNG)
+        png_path = self.cache.get(path)
+        with open(png_path, "rb") as f:
+            self.assertEqual(f.read(), PNG)
+        self.assertEqual(self.cache.get(path), png_path)
+        self.assertEqual(os.listdir(self.cache_dir), [os.path.basename(png_path)])
+
+    def test_without_thumbnail(self):
+        path = self.fcstd("a.fcstd")
+        self.assertIsNone(OSE_Previews.read_thumbnail(path))
+        self.assertIsNone(self.cache.get(path))
+        names = os.listdir(self.cache_dir)
+        self.assertEqual([os.path.splitext(name)[1] for name in names], [".none"])
+        self.assertIsNone(self.cache.get(path))
+
+    def test_broken_archive_is_not_marked(self):
+        path = os.path.join(self.part_dir, "a.fcstd")
+        with open(path, "wb") as f:
+            f.write(b"PK\x03\x04 half written")
+        self.assertRaises(zipfile.BadZipfile, OSE_Previews.read_thumbnail, path)
+        self.assertIsNone(OSE_Previews.extract_thumbnail(path))
+        self.assertIsNone(self.cache.get(path))
+        self.assertFalse(os.path.isdir(self.cache_dir) and os.listdir(self.cache_dir))
+        # The file is read again once it is complete.
+        self.fcstd("a.fcstd", PNG)
+        testsupport.touch_later(path)
+        self.assertIsNotNone(self.cache.get(path))
+
+    def test_missing_file(self):
+        self.assertIsNone(self.cache.get(os.path.join(self.part_dir, "missing.fcstd")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# Tests of the ranking of the incremental part search.
+
+import os
+import time
+import unittest
+
+import testsupport
+import OSE_PartCatalog as Catalog
+import OSE_PartSearch
+from OSE_PartSearch import SearchIndex
+
+HEADERS = ["PartNumber", "Text", "Image", "Cad"]
+ROWS = [
+    ["TS20-0001232", "T-slot profile 20x20, length 100 mm", "", "a.fcstd"],
+    ["TS20-0001233", "T-slot profile 20x20, length 105 mm", "", "a.fcstd"],
+    ["TS20-00012", "T-slot profile 20x20, length 110 mm", "", "a.fcstd"],
+    ["tslot-screw", "Screw M6 for T-slot profiles", "", "b.fcstd"],
+    ["angle4", "Angle with 4 holes", "", "c.fcstd"],
+    ["bracket", "Bracket for angle4", "", "c.fcstd"],
+    ["Single frame", "Frame of four profiles", "", "d.fcstd"],
+]
+
+
+def keys(hits):
+    return [hit.key for hit in hits]
+
+
+def scores(hits):
+    return [(hit.key, hit.score) for hit in hits]
+
+
+class SearchIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = testsupport.write_csv(
+            os.path.join(testsupport.temp_dir(), "parts.csv"), HEADERS, ROWS)
+        self.index = SearchIndex(["PartNumber", "Text"])
+        self.index.refresh([self.path])
+
+    def search(self, query, limit=100):
+        return self.index.search(query, limit)
+
+    def test_exact_key_first(self):
+        hits = self.search("TS20-00012")
+        self.assertEqual(scores(hits)[0], ("TS20-00012", SearchIndex.SCORE_EXACT_KEY))
+        self.assertEqual(scores(hits)[1:], [("TS20-0001232", SearchIndex.SCORE_KEY_PREFIX),
+                                            ("TS20-0001233", SearchIndex.SCORE_KEY_PREFIX)])
+        self.assertEqual(scores(self.search("tslot-screw")),
+                         [("tslot-screw", SearchIndex.SCORE_EXACT_KEY)])
+
+    def test_key_prefix_in_key_order(self):
+        hits = self.search("ts20-0001")
+        self.assertEqual(keys(hits), ["TS20-00012", "TS20-0001232", "TS20-0001233"])
+        self.assertTrue(all(hit.score == SearchIndex.SCORE_KEY_PREFIX for hit in hits))
+
+    def test_key_before_other_columns(self):
+        # "angle4" is the key of one row and in the text of another.
+        self.assertEqual(scores(self.search("angle4")),
+                         [("angle4", SearchIndex.SCORE_EXACT_KEY),
+                          ("bracket", SearchIndex.SCORE_OTHER)])
+        # In the middle of a key.
+        self.assertEqual(scores(self.search("screw"))[0], ("tslot-screw", SearchIndex.SCORE_KEY))
+
+    def test_words_of_text(self):
+        self.assertEqual(keys(self.search("105")), ["TS20-0001233"])
+        # A short word matches at the start of a word only.
+        self.assertEqual(keys(self.search("m6")), ["tslot-screw"])
+        self.assertEqual(self.search("lo"), [])
+        # Parts of words with letters and digits, and substrings of longer query words.
+        self.assertEqual(keys(self.search("holes 4")), ["angle4"])
+        self.assertEqual(set(keys(self.search("slot"))),
+                         set(["TS20-0001232", "TS20-0001233", "TS20-00012", "tslot-screw"]))
+
+    def test_all_words_must_match(self):
+        hits = self.search("profile 110")
+        self.assertEqual(scores(hits), [("TS20-00012", 2 * SearchIndex.SCORE_OTHER)])
+        self.assertEqual(self.search("profile missing"), [])
+        # Scores of the words add up.
+        self.assertEqual(scores(self.search("ts20-00012 20x20"))[0],
+                         ("TS20-00012", SearchIndex.SCORE_EXACT_KEY + SearchIndex.SCORE_OTHER))
+
+    def test_key_with_spaces(self):
+        self.assertEqual(keys(self.search("single fr")), ["Single frame"])
+        self.assertEqual(scores(self.search("Single frame")),
+                         [("Single frame", 2 * SearchIndex.SCORE_EXACT_KEY)])
+
+    def test_case_and_separators(self):
+        self.assertEqual(scores(self.search("ANGLE4")), scores(self.search("angle4")))
+        self.assertEqual(keys(self.search(" profile,  110 ")), ["TS20-00012"])
+        self.assertEqual(self.search(""), [])
+        self.assertEqual(self.search(" , "), [])
+
+    def test_limit(self):
+        self.assertEqual(keys(self.search("ts", 2)), ["TS20-00012", "TS20-0001232"])
+        self.assertEqual(len(self.search("profile", 3)), 3)
+
+    def test_hit_position(self):
+        hit = self.search("angle4")[0]
+        self.assertEqual(hit.table_path, self.path)
+        self.assertEqual(self.index.table(self.path).get_part_key(hit.row_index), "angle4")
+
+    def test_broad_query_in_key_order(self):
+        # More candidates than SCORE_ALL_LIMIT are walked in key order.
+        path = testsupport.write_csv(
+            os.path.join(testsupport.temp_dir(), "many.csv"), HEADERS,
+            [["P%05d" % i, "Part %d of %s" % (i, "steel" if i % 2 else "wood"), "", "x.fcstd"]
+             for i in range(SearchIndex.SCORE_ALL_LIMIT * 2)])
+        self.index.refresh([path])
+        hits = self.search("part steel", 3)
+        self.assertEqual(scores(hits), [("P00001", 10), ("P00003", 10), ("P00005", 10)])
+        self.assertEqual(keys(self.search("p0", 2)), ["P00000", "P00001"])
+
+    def test_refresh(self):
+        self.assertEqual(self.index.refresh([self.path]), [])
+        self.assertEqual(self.index.document_count(), len(ROWS))
+        testsupport.write_csv(self.path, HEADERS, ROWS[:2] + [["new-part", "New", "", "n.fcstd"]])
+        stamp = time.time() + 10
+        os.utime(self.path, (stamp, stamp))
+        self.assertEqual(self.index.refresh([self.path]), [self.path])
+        self.assertEqual(self.index.document_count(), 3)
+        self.assertEqual(keys(self.search("new-part")), ["new-part"])
+        self.assertEqual(self.search("angle4"), [])
+        self.assertEqual(self.index.refresh([]), [self.path])
+        self.assertEqual(self.index.document_count(), 0)
+        self.assertEqual(self.search("ts"), [])
+
+    def test_words(self):
+        self.assertEqual(OSE_PartSearch.words("T-slot 20x20, M6/M8"),
+                         ["t-slot", "20x20", "m6", "m8"])
+        self.assertEqual(OSE_PartSearch.key_words("TS20-0001232"),
+                         ["ts20-0001232", "ts", "20", "0001232"])
+        self.assertEqual(OSE_PartSearch.index_words("angle4"), ["angle4", "angle", "4"])
+
+    def test_catalog_cache(self):
+        # refresh() indexes the table object of the shared catalog cache once.
+        self.assertIs(self.index.table(self.path), Catalog.load_catalog(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# Tests of the catalog tables read on demand from large CSV files.
+
+import os
+import sys
+import unittest
+
+import testsupport
+import OSE_BasePartLibrary as Base
+import OSE_PartCatalog as Catalog
+
+PY2 = sys.version_info[0] == 2
+HEADERS = ["PartNumber", "Text", "Image", "Cad", "Length"]
+ROWS = [
+    ["A-1", "Plain", "images/a.png", "set/a.fcstd", "10"],
+    ["A-2", "Comma, inside", "images/a.png", "set/b.fcstd", "20"],
+    ["A-3", "Two\nlines", "", "set/a.fcstd", "30"],
+    ["A-4", 'Quote "x"', "images/c.png", "tslot:length=160", "40"],
+    ["A-5", "Short row"],
+]
+
+
+def load(path, cls):
+    table = cls(Catalog.CATALOG_COLUMNS, index_columns=Catalog.CATALOG_INDEX_COLUMNS)
+    if cls is Catalog.StreamingCsvTable:
+        table.open(path)
+    else:
+        table.load(path)
+    return table
+
+
+class StreamingCsvTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = testsupport.write_csv(
+            os.path.join(testsupport.temp_dir(), "parts.csv"), HEADERS, ROWS)
+
+    def assert_same_tables(self, expected, table):
+        self.assertEqual(table.headers, expected.headers)
+        self.assertEqual(table.has_valid_data, expected.has_valid_data)
+        self.assertEqual(table.row_count(), expected.row_count())
+        self.assertEqual(table.column_count(), expected.column_count())
+        for row_i in range(expected.row_count()):
+            self.assertEqual(table.get_part_key(row_i), expected.get_part_key(row_i))
+            for column_i in range(expected.column_count()):
+                self.assertEqual(table.get_value(row_i, column_i),
+                                 expected.get_value(row_i, column_i))
+            self.assertEqual(table.get_row(row_i).to_dict(), expected.get_row(row_i).to_dict())
+
+    def test_same_values_as_csv_table(self):
+        expected = load(self.path, Catalog.CsvTable)
+        self.assertEqual(expected.row_count(), len(ROWS))
+        self.assert_same_tables(expected, load(self.path, Catalog.StreamingCsvTable))
+
+    def test_same_lookups_as_csv_table(self):
+        expected = load(self.path, Catalog.CsvTable)
+        table = load(self.path, Catalog.StreamingCsvTable)
+        for key in ["A-1", "A-3", "A-5", "missing"]:
+            self.assertEqual(table.find_row_index(key), expected.find_row_index(key))
+        self.assertEqual(table.find_row_index("missing"), -1)
+        for value in ["set/a.fcstd", "tslot:length=160", "missing"]:
+            self.assertEqual(table.find_row_indexes("Cad", value),
+                             expected.find_row_indexes("Cad", value))
+        self.assertEqual(table.find_row_indexes("Cad", "set/a.fcstd"), [0, 2])
+
+    def test_open_scans_the_file(self):
+        table = load(self.path, Catalog.StreamingCsvTable)
+        self.assertEqual(table.scanned_row_count(), len(ROWS))
+        self.assertTrue(table.at_end())
+        self.assertEqual(table.scan(), 0)
+        self.assertEqual(table.get_part_key(1), "A-2")
+
+    def test_line_breaks_inside_values(self):
+        # Characters which str.splitlines() also treats as line breaks.
+        rows = [["B-1", u"Form\x0cfeed", "", "set/a.fcstd", "1"],
+                ["B-2", u"Line\u2028separator", "", "set/b.fcstd", "2"],
+                ["B-3", "Carriage\rreturn", "", "set/c.fcstd", "3"]]
+        if PY2:
+            rows = [[value.encode("utf-8") for value in row] for row in rows]
+        path = testsupport.write_csv(os.path.join(testsupport.temp_dir(), "breaks.csv"),
+                                     HEADERS, rows)
+        expected = load(path, Catalog.CsvTable)
+        table = load(path, Catalog.StreamingCsvTable)
+        self.assertEqual(table.row_count(), 3)
+        self.assert_same_tables(expected, table)
+        self.assertEqual(table.find_row_index("B-3"), 2)
+
+    def test_64_bit_offsets(self):
+        table = load(self.path, Catalog.StreamingCsvTable)
+        self.assertTrue(table._offsets.itemsize >= 8 or PY2)
+
+    def test_library_tables(self):
+        for name in sorted(os.listdir(Base.TABLE_PATH)):
+            if not name.endswith(".csv") or name.endswith(Base.GEOMETRY_TABLE_SUFFIX):
+                continue
+            path = os.path.join(Base.TABLE_PATH, name)
+            self.assert_same_tables(load(path, Catalog.CsvTable),
+                                    load(path, Catalog.StreamingCsvTable))
+
+    def test_duplicate_key(self):
+        path = testsupport.write_csv(os.path.join(testsupport.temp_dir(), "dup.csv"),
+                                     HEADERS, ROWS + [ROWS[0]])
+        self.assertRaises(Catalog.CsvError, load, path, Catalog.CsvTable)
+        self.assertRaises(Catalog.CsvError, load, path, Catalog.StreamingCsvTable)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# Tests of the timing spans.
+
+import json
+import os
+import threading
+import unittest
+
+import testsupport
+import FreeCAD
+import OSE_Trace
+from OSE_Trace import Tracer
+
+
+class TracerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = testsupport.temp_dir()
+        self.messages = []
+        self._print_log = FreeCAD.Console.PrintLog
+        FreeCAD.Console.PrintLog = self.messages.append
+
+    def tearDown(self):
+        FreeCAD.Console.PrintLog = self._print_log
+
+    def test_nested_spans(self):
+        tracer = Tracer()
+        with OSE_Trace.Span(tracer, "outer", {"table": "a.csv"}) as outer:
+            with OSE_Trace.Span(tracer, "inner", {}) as inner:
+                inner.set(rows=3)
+            outer.set(parts=1)
+        self.assertEqual((outer.depth, inner.depth), (0, 1))
+        events = tracer.events()
+        self.assertEqual([e["name"] for e in events], ["inner", "outer"])
+        self.assertEqual(events[0]["args"], {"rows": 3})
+        self.assertEqual(events[1]["args"], {"table": "a.csv", "parts": 1})
+        self.assertTrue(events[1]["ts"] <= events[0]["ts"])
+        self.assertTrue(events[1]["dur"] >= events[0]["dur"])
+        self.assertTrue(self.messages[0].startswith("OSE trace:   inner "))
+        self.assertTrue(self.messages[1].startswith("OSE trace: outer "))
+        self.assertTrue(self.messages[1].endswith(" (parts=1, table=a.csv)\n"))
+
+    def test_exception(self):
+        tracer = Tracer(log=False)
+
+        def fail():
+            with OSE_Trace.Span(tracer, "step", {}):
+                raise ValueError("broken")
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(tracer.events()[0]["args"], {"error": "ValueError"})
+        with OSE_Trace.Span(tracer, "next", {}) as span:
+            pass
+        self.assertEqual(span.depth, 0)
+        self.assertEqual(self.messages, [])
+
+    def test_depth_per_thread(self):
+        tracer = Tracer(log=False)
+        depths = []
+
+        def other_thread():
+            with OSE_Trace.Span(tracer, "other", {}) as span:
+                depths.append(span.depth)
+        with OSE_Trace.Span(tracer, "main", {}):
+            thread = threading.Thread(target=other_thread)
+            thread.start()
+            thread.join()
+        self.assertEqual(depths, [0])
+
+    def test_max_events(self):
+        tracer = Tracer(log=False, max_events=2)
+        for name in ["a", "b", "c", "d"]:
+            with OSE_Trace.Span(tracer, name, {}):
+                pass
+        self.assertEqual([e["name"] for e in tracer.events()], ["a", "b"])
+        self.assertEqual(tracer.dropped, 2)
+        tracer.clear()
+        self.assertEqual((tracer.events(), tracer.dropped), ([], 0))
+
+    def test_save(self):
+        path = os.path.join(self.directory, "traces", "trace.json")
+        tracer = Tracer(path, log=False, max_events=1, save_interval=0.0)
+        with OSE_Trace.Span(tracer, "load", {"path": object()}):
+            pass
+        with OSE_Trace.Span(tracer, "dropped", {}):
+            pass
+        with open(path) as f:
+            data = json.load(f)
+        self.assertEqual([e["name"] for e in data["traceEvents"]], ["load"])
+        self.assertEqual(data["otherData"], {"dropped": 1})
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["trace.json"])
+
+    def test_save_error_is_logged(self):
+        # A file is in the way of the trace directory.
+        blocker = os.path.join(self.directory, "blocker")
+        open(blocker, "w").close()
+        tracer = Tracer(os.path.join(blocker, "trace.json"), log=False, save_interval=0.0)
+        with OSE_Trace.Span(tracer, "step", {}):
+            pass
+        self.assertEqual(len(tracer.events()), 1)
+        self.assertEqual(len(self.messages), 1)
+        self.assertTrue(self.messages[0].startswith("OSE trace: could not write "))
+        self.assertRaises((IOError, OSError), tracer.save)
+
+
+class EnableTest(unittest.TestCase):
+
+    def tearDown(self):
+        OSE_Trace.disable()
+
+    def test_disabled(self):
+        OSE_Trace.disable()
+        self.assertFalse(OSE_Trace.enabled())
+        self.assertIs(OSE_Trace.span("a"), OSE_Trace.span("b", file="x"))
+        with OSE_Trace.span("a") as span:
+            span.set(hit=True)
+
+    def test_enable(self):
+        path = os.path.join(testsupport.temp_dir(), "trace.json")
+        tracer = OSE_Trace.enable(log=False)
+        self.assertIs(OSE_Trace.tracer(), tracer)
+        self.assertIs(OSE_Trace.enable(path), tracer)
+        self.assertEqual(tracer.trace_path, path)
+        tracer.save_interval = 3600.0
+        with OSE_Trace.span("insert", part="P1"):
+            pass
+        OSE_Trace.disable()
+        self.assertIsNone(OSE_Trace.tracer())
+        with open(path) as f:
+            events = json.load(f)["traceEvents"]
+        self.assertEqual([(e["name"], e["args"]) for e in events], [("insert", {"part": "P1"})])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Tests of the parallel warm-up with worker processes.
+#
+# A small Python script stands in for FreeCADCmd. It answers like
+# OSE_Warmup.run_worker() but dies after a given number of parts.
+
+import os
+import stat
+import sys
+import threading
+import unittest
+
+import testsupport
+import OSE_Warmup
+
+WORKER = """#!%(python)s
+import json
+import sys
+
+for _ in range(%(limit)d):
+    line = sys.stdin.readline()
+    if not line:
+        break
+    sys.stdout.write("FreeCAD message\\n")
+    sys.stdout.write(%(marker)r + json.dumps({"path": line.rstrip("\\n"), "error": None,
+                                               "time": 0.0}) + "\\n")
+    sys.stdout.flush()
+sys.stdin.readline()  # Exit while working on the next part.
+"""
+
+
+@unittest.skipIf(os.name == "nt", "the fake worker is a script with a #! line")
+class WarmUpTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = testsupport.temp_dir()
+        self.paths = [os.path.join(self.directory, "part%d.fcstd" % i) for i in range(5)]
+
+    def worker(self, limit):
+        path = os.path.join(self.directory, "worker%d" % limit)
+        with open(path, "w") as f:
+            f.write(WORKER % {"python": sys.executable, "limit": limit,
+                              "marker": OSE_Warmup.RESULT_MARKER})
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+        return path
+
+    def warm_up(self, limit, jobs, cancel=None):
+        progress = []
+        results = OSE_Warmup.warm_up(self.paths, self.worker(limit), jobs, force=True,
+                                     progress=lambda *args: progress.append(args),
+                                     cancel=cancel)
+        self.assertEqual(sorted(r.path for r in results), self.paths)
+        return results, progress
+
+    def test_all_parts(self):
+        results, progress = self.warm_up(100, 2)
+        self.assertTrue(all(r.ok() for r in results))
+        self.assertEqual([done for done, _, _ in progress], [1, 2, 3, 4, 5])
+
+    def test_workers_exit(self):
+        # The worker extracts two parts and exits while the third one is
+        # sent to it; the last two parts are never sent.
+        results, progress = self.warm_up(2, 1)
+        self.assertEqual([r.error for r in results], [None, None] + ["worker exited"] * 3)
+        self.assertEqual([done for done, _, _ in progress], [1, 2, 3])
+
+    def test_cancel(self):
+        cancel = threading.Event()
+        cancel.set()
+        results, progress = self.warm_up(100, 1, cancel)
+        self.assertEqual(progress, [])
+        self.assertEqual([r.error for r in results], ["cancelled"] * 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
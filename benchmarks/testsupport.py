@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Setup shared by the unit tests in this directory.
+#
+# Like bench_suite.py, the tests use the stand-ins in benchmarks/stubs for
+# FreeCAD, Part and PySide. Run them from the workbench directory with
+#
+#     python -m pytest benchmarks
+#     python -m unittest discover -s benchmarks -p "test_*.py"
+#
+# Import this module before any module of the workbench, so the caches are
+# written to a temporary directory instead of the cache of the user.
+
+import atexit
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TEST_DIR))
+sys.path.insert(0, os.path.join(TEST_DIR, "stubs"))
+
+WORK_DIR = tempfile.mkdtemp(prefix="ose-test-")
+os.environ["OSE_PART_LIBRARY_CACHE"] = os.path.join(WORK_DIR, "cache")
+atexit.register(shutil.rmtree, WORK_DIR, True)
+
+
+def temp_dir():
+    """Return a new empty directory below WORK_DIR."""
+    return tempfile.mkdtemp(dir=WORK_DIR)
+
+
+def write_csv(path, headers, rows):
+    """Write a catalog with *headers* and *rows* to *path* and return *path*."""
+    if sys.version_info[0] < 3:
+        f = open(path, "wb")
+    else:
+        f = open(path, "w", newline="")
+    with f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        writer.writerows(rows)
+    return path
+
+
+def touch_later(path, seconds=10):
+    """Move the modification time of *path* into the future.
+
+    A file rewritten within the same second gets another stamp even on
+    file systems with coarse times.
+    """
+    stamp = time.time() + seconds
+    os.utime(path, (stamp, stamp))